@@ -0,0 +1,61 @@
+"""
+Author: David Meyer
+
+Description
+-----------
+Benchmarks the import time of the dbcmailmerge modules and reports which heavy dependencies they load.
+
+Each module is imported in a fresh interpreter, so that the measurement includes the cold import of all its
+dependencies. Run from the root directory of the project:
+
+    python benchmarks/import_time.py [--repeat 5]
+"""
+import sys
+import argparse
+import statistics
+import subprocess
+from pathlib import Path
+
+MODULES = ["dbcmailmerge.config", "dbcmailmerge.utility", "dbcmailmerge.mailproject", "dbcmailmerge.cli"]
+HEAVY_DEPENDENCIES = ["pandas", "numpy", "tkinter", "PyPDF2", "mailmerge", "lxml"]
+
+# prints the import time in seconds and the loaded heavy dependencies
+MEASURE = """
+import sys, time
+start = time.perf_counter()
+import {module}
+print(time.perf_counter() - start)
+print(','.join(name for name in {heavy!r} if name in sys.modules))
+"""
+
+
+def measure(module, repeat):
+    """
+    Imports `module` `repeat` times, each time in a new interpreter.
+
+    Returns
+    -------
+    median_seconds, loaded_dependencies : float, str
+        The median import time and the comma separated heavy dependencies loaded by the import.
+    """
+    timings = []
+    loaded = ''
+    for _ in range(repeat):
+        process = subprocess.run([sys.executable, "-c", MEASURE.format(module=module, heavy=HEAVY_DEPENDENCIES)],
+                                 stdout=subprocess.PIPE, check=True, cwd=Path(__file__).resolve().parents[1],
+                                 universal_newlines=True)
+        seconds, loaded = process.stdout.splitlines()
+        timings.append(float(seconds))
+
+    return statistics.median(timings), loaded
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("-----------")[1].strip().split("\n")[0])
+    parser.add_argument("--repeat", type=int, default=5, help="number of measurements per module (default: 5)")
+    args = parser.parse_args()
+
+    print(f"{'module':<30}{'median import [ms]':>20}  heavy dependencies loaded")
+    for module in MODULES:
+        seconds, loaded = measure(module, args.repeat)
+        print(f"{module:<30}{seconds * 1000:>20.1f}  {loaded or '-'}")
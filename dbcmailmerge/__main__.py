@@ -0,0 +1,12 @@
+"""
+Author: David Meyer
+
+Description
+-----------
+Allows running the non-interactive command line interface with `python -m dbcmailmerge`. See cli.py.
+"""
+import sys
+
+from dbcmailmerge.cli import main
+
+sys.exit(main())
@@ -0,0 +1,270 @@
+"""
+Author: David Meyer
+
+Description
+-----------
+Contains the PdfAssembler, which merges the converted, customized pdfs and the standard pdfs into the final pdf per
+client and doc type.
+
+Compared to appending open file objects to a PdfFileMerger, the assembler
+    - reads each input into memory and closes it right away, so that every assembly holds at most one input and one
+      output file descriptor, no matter how many workers run in parallel or how many pdfs are merged,
+    - writes the result through a large buffer into a temporary file next to the target and renames it afterwards, so
+      that readers of the output directory (e.g., a network share) never see partially written files,
+    - optionally compresses the content streams and stores identical streams (fonts, images) only once per output.
+
+How far the size of a pdf is reduced is set per doc type by a size profile (see SIZE_PROFILES and
+DOC_TYPE_SIZE_PROFILES in config.py), e.g., the documents sent by email as small as possible and the internal forms
+with the settings of the run. The profiles are lossless, images aren't resampled.
+
+PyPDF2's writer modifies the objects of the readers it copies from. Therefore, each assembly parses the (cached) bytes
+of the standard pdfs again instead of sharing reader objects between outputs.
+"""
+import io
+import os
+import hashlib
+from pathlib import Path
+
+from dbcmailmerge.config import SIZE_PROFILES, DOC_TYPE_SIZE_PROFILES
+from dbcmailmerge.cache import DocumentCache
+
+WRITE_BUFFER_SIZE = 1024 * 1024  # bytes, PyPDF2 writes many small chunks
+
+# entries of a font descriptor that contain the embedded font program
+FONT_FILE_KEYS = ("/FontFile", "/FontFile2", "/FontFile3")
+
+# entries of a page, which aren't needed for viewing and printing
+PAGE_EXTRA_KEYS = ("/Thumb", "/PieceInfo", "/Metadata")
+
+
+class PdfAssembler:
+    """
+    Merges pdfs into one file per client and doc type. Thread-safe, one instance can be shared by all workers.
+
+    Parameters
+    ----------
+    compress : bool, optional
+        Compresses the content streams of all pages (default: False).
+    dedup : bool, optional
+        Stores identical font programs and images only once per output file (default: False).
+    cache : cache.DocumentCache or None, optional
+        Provides the standard pdfs (default: None, i.e., a new cache).
+    profiles : dict, optional
+        Contains doc_type, profile pairs. The profile is a key of SIZE_PROFILES, or None if the doc type uses
+        `compress` and `dedup` (default: config.DOC_TYPE_SIZE_PROFILES).
+
+    Raises
+    ------
+    ValueError
+        If a profile is unknown.
+    """
+    def __init__(self, compress=False, dedup=False, cache=None, profiles=DOC_TYPE_SIZE_PROFILES):
+        self.compress = compress
+        self.dedup = dedup
+        self.cache = cache if cache is not None else DocumentCache()
+
+        unknown = {profile for profile in profiles.values() if profile is not None} - SIZE_PROFILES.keys()
+        if unknown:
+            raise ValueError(f"Unknown size profile(s): {', '.join(sorted(unknown))}")
+        self.profiles = dict(profiles)
+
+    def options(self, doc_type=None):
+        """
+        Returns the size options for the pdfs of a doc type.
+
+        Parameters
+        ----------
+        doc_type : str or None, optional
+            One of TEMPLATES.keys() (default: None, i.e., the settings of the assembler).
+
+        Returns
+        -------
+        options : dict
+            Contains the `compress`, `dedup` and `strip` options, see SIZE_PROFILES.
+        """
+        profile = self.profiles.get(doc_type)
+        if profile is None:
+            return {"compress": self.compress, "dedup": self.dedup, "strip": False}
+        return dict(SIZE_PROFILES[profile])
+
+    def assemble(self, customized_documents_paths, standard_pdfs, out_file, remove_customized=True, doc_type=None):
+        """
+        Merges the customized pdfs and the standard pdfs (in that order) and writes the result to `out_file`.
+
+        Parameters
+        ----------
+        customized_documents_paths : list of pathlib.Path or pathlike str
+            Filepaths to the converted, customized pdfs of one client and doc type.
+        standard_pdfs : list of pathlib.Path or pathlike str
+            Filepaths to the standard pdfs that should be appended, read through the cache.
+        out_file : pathlib.Path
+            Filepath of the merged pdf.
+        remove_customized : bool, optional
+            Deletes the customized pdfs after they have been read (default: True).
+        doc_type : str or None, optional
+            The doc type of the pdf, which determines its size profile (default: None, i.e., the settings of the
+            assembler).
+
+        Returns
+        -------
+        page_count : int
+            The number of pages of the merged pdf.
+        """
+        from PyPDF2 import PdfFileReader, PdfFileWriter
+
+        options = self.options(doc_type)
+        writer = PdfFileWriter()
+
+        sources = [_read_and_close(path) for path in customized_documents_paths]
+        sources.extend(self.cache.standard_pdf(path) for path in standard_pdfs)
+
+        # The readers need to stay referenced until the writer has written the output, which copies their objects.
+        readers = [PdfFileReader(source, strict=False) for source in sources]
+        for reader in readers:
+            for page_number in range(reader.getNumPages()):
+                page = reader.getPage(page_number)
+                if options["compress"]:
+                    page.compressContentStreams()
+                writer.addPage(page)
+
+        if options["strip"]:
+            strip_page_extras(writer)
+        if options["dedup"]:
+            deduplicate_resources(writer)
+
+        write_atomic(writer, out_file)
+
+        if remove_customized:
+            for path in customized_documents_paths:
+                os.remove(path)
+
+        return writer.getNumPages()
+
+
+def deduplicate_resources(writer):
+    """
+    Replaces references to identical font programs and images of the pages in `writer` by one shared reference.
+
+    LibreOffice embeds the fonts and images in each converted document. When several documents are merged, the same
+    image (e.g., a logo) is stored once per document. Only byte-identical streams are merged, subsets of the same font
+    with different glyphs are kept.
+
+    Parameters
+    ----------
+    writer : PyPDF2.PdfFileWriter
+        The writer before writing the output. Its pages are modified.
+
+    Returns
+    -------
+    replaced : int
+        The number of references, that have been replaced.
+    """
+    from PyPDF2.generic import IndirectObject, NameObject
+
+    seen = {}
+    replaced = 0
+
+    def canonical(container, key):
+        nonlocal replaced
+        reference = container.raw_get(key)
+        if not isinstance(reference, IndirectObject):
+            return
+        stream = reference.getObject()
+        data = getattr(stream, "_data", None)
+        if data is None:
+            return
+
+        digest = hashlib.sha256(data).digest() + repr(sorted((k, repr(v)) for k, v in stream.items()
+                                                              if k != "/Length")).encode()
+        if digest in seen:
+            if seen[digest] != reference:
+                container[NameObject(key)] = seen[digest]
+                replaced += 1
+        else:
+            seen[digest] = reference
+
+    for page_number in range(writer.getNumPages()):
+        resources = writer.getPage(page_number).get("/Resources")
+        if resources is None:
+            continue
+        resources = resources.getObject()
+
+        x_objects = resources.get("/XObject")
+        if x_objects is not None:
+            x_objects = x_objects.getObject()
+            for name in list(x_objects.keys()):
+                canonical(x_objects, name)
+
+        fonts = resources.get("/Font")
+        if fonts is not None:
+            for font in fonts.getObject().values():
+                descriptor = font.getObject().get("/FontDescriptor")
+                if descriptor is None:
+                    continue
+                descriptor = descriptor.getObject()
+                for key in FONT_FILE_KEYS:
+                    if key in descriptor:
+                        canonical(descriptor, key)
+
+    return replaced
+
+
+def strip_page_extras(writer):
+    """
+    Removes the entries of the pages in `writer`, which aren't needed for viewing and printing (see PAGE_EXTRA_KEYS).
+
+    Thumbnails are rendered by the viewers, the metadata and the private data of the authoring application (e.g., of
+    the application, in which a standard pdf has been designed) are only used for editing the pdf.
+
+    Parameters
+    ----------
+    writer : PyPDF2.PdfFileWriter
+        The writer before writing the output. Its pages are modified.
+
+    Returns
+    -------
+    removed : int
+        The number of removed entries.
+    """
+    removed = 0
+    for page_number in range(writer.getNumPages()):
+        page = writer.getPage(page_number)
+        for key in PAGE_EXTRA_KEYS:
+            if key in page:
+                del page[key]
+                removed += 1
+
+    return removed
+
+
+def write_atomic(writer, out_file):
+    """
+    Writes the pdf of `writer` to a temporary file in the directory of `out_file` and renames it to `out_file`.
+
+    Parameters
+    ----------
+    writer : PyPDF2.PdfFileWriter
+        The writer containing the pages.
+    out_file : pathlib.Path or pathlike str
+        Filepath of the pdf, an existing file is replaced.
+
+    Returns
+    -------
+    None
+    """
+    out_file = Path(out_file)
+    partial_file = out_file.with_name(out_file.name + ".part")
+
+    try:
+        with open(partial_file, "wb", buffering=WRITE_BUFFER_SIZE) as out_pdf:
+            writer.write(out_pdf)
+        os.replace(partial_file, out_file)
+    except BaseException:
+        if partial_file.exists():
+            os.remove(partial_file)
+        raise
+
+
+def _read_and_close(path):
+    with open(path, "rb") as in_pdf:
+        return io.BytesIO(in_pdf.read())
@@ -0,0 +1,254 @@
+"""
+Author: David Meyer
+
+Description
+-----------
+Contains the autotuning of the number of parallel workers, see ConcurrencyTuner.
+
+The best number of workers depends on the cores, the memory per LibreOffice instance, and the speed of the storage,
+so it differs between a laptop and the batch server. In an autotuned run, the pool has AUTOTUNE_MAX_WORKERS workers
+(see config.py), but only the number of active workers of the tuner create pdfs at the same time. After every
+AUTOTUNE_WINDOW pdfs, the tuner measures the throughput (pdfs per second) and the latency (seconds per pdf) and
+    - adds a worker, as long as the throughput rises by at least AUTOTUNE_MIN_GAIN,
+    - returns to the best number of workers, if the additional worker didn't increase the throughput (e.g., all cores
+      are busy or the storage is the bottleneck), which is the upper bound for the rest of the run,
+    - removes a worker, if the latency at the best number of workers has risen by more than
+      AUTOTUNE_LATENCY_TOLERANCE (e.g., the network share is slower), and measures again,
+    - removes a worker and lowers the upper bound, if less than AUTOTUNE_MIN_AVAILABLE_MEMORY is available.
+The LibreOffice instances of the inactive workers are never started (see conversion.ConverterPool).
+
+The chosen number of workers is saved per machine, backend, and engine in AUTOTUNE_FILE and used as the start of the
+next autotuned run, so that the next run doesn't start with one worker again. The available memory is read with the
+optional dependency psutil (`pip install psutil`) or from /proc/meminfo; if neither is available, the memory isn't
+checked.
+"""
+import os
+import json
+import time
+import socket
+import threading
+from collections import namedtuple
+from contextlib import contextmanager
+from datetime import datetime
+
+from dbcmailmerge.config import (AUTOTUNE_MIN_WORKERS, AUTOTUNE_MAX_WORKERS, AUTOTUNE_WINDOW, AUTOTUNE_MIN_GAIN,
+                                 AUTOTUNE_LATENCY_TOLERANCE, AUTOTUNE_MIN_AVAILABLE_MEMORY, AUTOTUNE_FILE)
+
+# One measurement of the tuner
+# workers : int, the number of active workers during the measurement
+# throughput : float, pdfs per second
+# latency : float, average seconds per pdf
+# available_memory : int or None, bytes of available memory, None if unknown
+# action : str, `increase`, `decrease`, `latency`, `memory`, or `keep`
+Measurement = namedtuple("Measurement", ["workers", "throughput", "latency", "available_memory", "action"])
+
+
+class ConcurrencyTuner:
+    """
+    Limits and adjusts the number of active workers of a run, see the module docstring. Thread-safe, one instance is
+    shared by all workers of a run.
+
+    Parameters
+    ----------
+    initial : int or None, optional
+        The number of active workers at the start, e.g. of the last run (default: None, i.e., `min_workers`).
+    min_workers, max_workers, window, min_gain, latency_tolerance, min_available_memory : optional
+        See the AUTOTUNE_* settings in config.py.
+    memory : callable, optional
+        Returns the available memory in bytes or None (default: available_memory).
+    clock : callable, optional
+        Returns the current time in seconds (default: time.monotonic).
+
+    Attributes
+    ----------
+    history : list of Measurement
+        The measurements of the run.
+    """
+    def __init__(self, initial=None, min_workers=AUTOTUNE_MIN_WORKERS, max_workers=AUTOTUNE_MAX_WORKERS,
+                 window=AUTOTUNE_WINDOW, min_gain=AUTOTUNE_MIN_GAIN, latency_tolerance=AUTOTUNE_LATENCY_TOLERANCE,
+                 min_available_memory=AUTOTUNE_MIN_AVAILABLE_MEMORY, memory=None, clock=time.monotonic):
+        self.min_workers = min_workers
+        self.max_workers = max(min_workers, max_workers)
+        self.window = window
+        self.min_gain = min_gain
+        self.latency_tolerance = latency_tolerance
+        self.min_available_memory = min_available_memory
+        self.memory = memory if memory is not None else available_memory
+        self.clock = clock
+        self.history = []
+
+        self.__workers = min(max(initial or min_workers, min_workers), self.max_workers)
+        self.__ceiling = self.max_workers
+        self.__best = None  # the Measurement with the highest throughput
+        self.__active = 0
+        self.__latencies = []
+        self.__window_start = clock()
+        self.__condition = threading.Condition()
+
+    @property
+    def workers(self):
+        """The current number of active workers."""
+        with self.__condition:
+            return self.__workers
+
+    @property
+    def chosen(self):
+        """The number of workers with the highest measured throughput, with which the next run should start."""
+        with self.__condition:
+            measurements = [measurement for measurement in self.history if measurement.workers <= self.__ceiling]
+            if not measurements:
+                return self.__workers
+            return max(measurements, key=lambda measurement: measurement.throughput).workers
+
+    @contextmanager
+    def slot(self):
+        """Blocks until less than `workers` workers are active, the worker is active within the context."""
+        with self.__condition:
+            self.__condition.wait_for(lambda: self.__active < self.__workers)
+            self.__active += 1
+        try:
+            yield
+        finally:
+            with self.__condition:
+                self.__active -= 1
+                self.__condition.notify_all()
+
+    def record(self, seconds):
+        """
+        Records a created pdf and adjusts the number of workers after every `window` pdfs.
+
+        Parameters
+        ----------
+        seconds : float
+            The time it took to create the pdf.
+
+        Returns
+        -------
+        measurement : Measurement or None
+            The measurement, if the window is complete.
+        """
+        with self.__condition:
+            self.__latencies.append(seconds)
+            if len(self.__latencies) < self.window:
+                return None
+
+            now = self.clock()
+            elapsed = max(now - self.__window_start, 1e-9)
+            measurement = self.__adjust(len(self.__latencies) / elapsed,
+                                        sum(self.__latencies) / len(self.__latencies), self.memory())
+
+            self.history.append(measurement)
+            self.__latencies = []
+            self.__window_start = now
+            self.__condition.notify_all()
+            return measurement
+
+    def __adjust(self, throughput, latency, memory):
+        # Needs to be called while holding the lock
+        workers = self.__workers
+        measurement = Measurement(workers, throughput, latency, memory, "keep")
+
+        if memory is not None and memory < self.min_available_memory:
+            self.__ceiling = max(self.min_workers, workers - 1)
+            self.__workers = self.__ceiling
+            measurement = measurement._replace(action="memory")
+        elif self.__best is None or throughput > self.__best.throughput * (1 + self.min_gain):
+            self.__best = measurement
+            self.__workers = min(workers + 1, self.__ceiling)
+            if self.__workers > workers:
+                measurement = measurement._replace(action="increase")
+        elif workers == self.__best.workers:
+            if latency > self.__best.latency * self.latency_tolerance and workers > self.min_workers:
+                # e.g. the storage has become slower, the best number of workers is measured again
+                self.__workers = workers - 1
+                self.__best = None
+                measurement = measurement._replace(action="latency")
+        else:
+            # the additional worker didn't increase the throughput
+            self.__ceiling = min(self.__ceiling, self.__best.workers)
+            self.__workers = self.__ceiling
+            measurement = measurement._replace(action="decrease")
+
+        return measurement
+
+
+def available_memory():
+    """Returns the available memory in bytes, None if it can't be determined (see the module docstring)."""
+    try:
+        import psutil
+    except ImportError:
+        pass
+    else:
+        return psutil.virtual_memory().available
+
+    try:
+        with open("/proc/meminfo", encoding="ascii") as meminfo:
+            for line in meminfo:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024  # kB
+    except (OSError, ValueError):
+        pass
+
+    return None
+
+
+def machine_key(backend, engine):
+    """Returns the key of the saved settings, which depend on the machine, the backend and the engine."""
+    return f"{socket.gethostname()}/{backend}/{engine}"
+
+
+def load_workers(key, settings_file=AUTOTUNE_FILE):
+    """
+    Returns the number of workers chosen by the last autotuned run.
+
+    Parameters
+    ----------
+    key : str
+        See machine_key.
+    settings_file : pathlib.Path, optional
+        Default: config.AUTOTUNE_FILE.
+
+    Returns
+    -------
+    workers : int or None
+        None if no run has been saved for `key` or the file can't be read.
+    """
+    try:
+        with open(settings_file, encoding="utf-8") as settings:
+            return int(json.load(settings)[key]["workers"])
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def save_workers(key, tuner, settings_file=AUTOTUNE_FILE):
+    """
+    Saves the number of workers chosen by `tuner` and its best throughput, keeps the settings of the other keys.
+
+    Parameters
+    ----------
+    key : str
+        See machine_key.
+    tuner : ConcurrencyTuner
+        The tuner of the finished run.
+    settings_file : pathlib.Path, optional
+        Default: config.AUTOTUNE_FILE.
+
+    Returns
+    -------
+    None
+    """
+    try:
+        with open(settings_file, encoding="utf-8") as settings:
+            all_settings = json.load(settings)
+    except (OSError, ValueError):
+        all_settings = {}
+
+    measurements = [measurement for measurement in tuner.history if measurement.workers == tuner.chosen]
+    all_settings[key] = {"workers": tuner.chosen,
+                         "throughput": max((measurement.throughput for measurement in measurements), default=None),
+                         "saved": datetime.now().isoformat(timespec="seconds")}
+
+    partial_file = settings_file.with_name(settings_file.name + ".part")
+    with open(partial_file, "w", encoding="utf-8") as settings:
+        json.dump(all_settings, settings, indent=2)
+    os.replace(partial_file, settings_file)
@@ -0,0 +1,207 @@
+"""
+Author: David Meyer
+
+Description
+-----------
+Contains the batch mode, which creates the documents for all projects of a project sheet in one run.
+
+`MailProject.from_data_source` returns a list of projects if the project sheet contains several records, e.g., all bonds of a
+quarter-end mailing. The batch mode loads the clients of each project, selects them, and creates all documents through
+one converter pool and one template/standard pdf cache (see MailProject.create_batch_documents), instead of starting
+a new run per project.
+
+The clients of each project are read from the client sheet. If the name of the client sheet contains the placeholder
+`{project_id}`, it is replaced by the id of the respective project, e.g. `client_data_{project_id}`. Otherwise, all
+projects use the same client sheet.
+"""
+from contextlib import ExitStack
+
+from dbcmailmerge.config import (FIELD_MAP_CLIENTS, FIELD_MAP_PROJECT, DEFAULT_WORKERS, DEFAULT_BACKEND,
+                                 DEFAULT_ENGINE, STAGING_ROOT, DEFAULT_OUTPUT_MODE, SNAPSHOT_DIR, DEFAULT_SCHEDULE,
+                                 AUTOTUNE_MAX_WORKERS)
+from dbcmailmerge.mailproject import MailProject
+from dbcmailmerge.conversion import ConverterPool
+from dbcmailmerge.cache import DocumentCache
+from dbcmailmerge.assembly import PdfAssembler
+from dbcmailmerge.output import create_output
+from dbcmailmerge.snapshot import SnapshotCache
+from dbcmailmerge.profiling import RunProfiler, default_profile_dir
+from dbcmailmerge.printshop import PrintShop
+from dbcmailmerge.autotune import ConcurrencyTuner, machine_key, load_workers, save_workers
+from dbcmailmerge.tracing import TraceRecorder, default_trace_file, trace_span
+
+
+def as_project_list(projects):
+    """
+    Returns the result of MailProject.from_data_source as a list, which is either one instance or a list of instances.
+
+    Parameters
+    ----------
+    projects : MailProject or list of MailProject
+        The result of MailProject.from_data_source.
+
+    Returns
+    -------
+    projects : list of MailProject
+    """
+    if isinstance(projects, list):
+        return projects
+    return [projects]
+
+
+def client_sheet_name(client_sheet, project):
+    """
+    Returns the name of the client sheet for `project`, see the module docstring.
+
+    Parameters
+    ----------
+    client_sheet : str or None
+        Name of the client sheet, may contain the placeholder `{project_id}`. None for CSV and Parquet files.
+    project : MailProject
+        The project for which the clients should be loaded.
+
+    Returns
+    -------
+    sheet_name : str or None
+    """
+    if client_sheet is None:
+        return None
+    return client_sheet.replace("{project_id}", str(project.project_id))
+
+
+def load_batch(data_source, project_sheet, client_sheet, selection_criteria=None, client_data_source=None,
+               snapshot_cache=None):
+    """
+    Loads all projects of the project sheet and their clients and selects the clients.
+
+    Parameters
+    ----------
+    data_source : pathlib.Path or pathlike str
+        Filepath to the data source, see utility.DATA_SOURCE_FORMATS for the supported formats.
+    project_sheet : str or None
+        The sheet/table name of the project records, not used for CSV and Parquet files.
+    client_sheet : str or None
+        The sheet/table name of the client records, see client_sheet_name. Not used for CSV and Parquet files.
+    selection_criteria : dict of functions or None, optional
+        Passed to MailProject.select_clients (default: None, i.e., all clients are selected).
+    client_data_source : pathlib.Path or pathlike str or None, optional
+        Filepath to the data source of the clients, if they are stored in another file than the projects
+        (default: None, i.e., `data_source`).
+    snapshot_cache : snapshot.SnapshotCache or None, optional
+        Loads the records of unchanged sheets from snapshots (default: None, i.e., the sheets are always parsed).
+
+    Returns
+    -------
+    selections : list of tuple
+        Contains one (MailProject, selected_clients) pair per project, which can be passed to
+        MailProject.create_batch_documents.
+    """
+    if selection_criteria is None:
+        selection_criteria = {}
+    if client_data_source is None:
+        client_data_source = data_source
+
+    selections = []
+    projects = MailProject.from_data_source(data_source, project_sheet, FIELD_MAP_PROJECT, snapshot_cache)
+    for project in as_project_list(projects):
+        project.create_client_records(client_data_source, client_sheet_name(client_sheet, project), FIELD_MAP_CLIENTS,
+                                      snapshot_cache)
+        selections.append((project, project.select_clients(selection_criteria)))
+
+    return selections
+
+
+def validate_batch(data_source, project_sheet, client_sheet, selection_criteria=None, snapshot_dir=SNAPSHOT_DIR,
+                   client_data_source=None):
+    """
+    Loads all projects and their clients and validates the documents in a dry run, see validation.py.
+
+    See load_batch and run_batch for the parameters.
+
+    Returns
+    -------
+    selections : list of tuple
+        Contains the validated (MailProject, selected_clients) pairs.
+    report : validation.ValidationReport
+    """
+    snapshot_cache = SnapshotCache(snapshot_dir) if snapshot_dir is not None else None
+    selections = load_batch(data_source, project_sheet, client_sheet, selection_criteria, client_data_source,
+                            snapshot_cache)
+
+    return selections, MailProject.validate_batch_documents(selections)
+
+
+def run_batch(data_source, project_sheet, client_sheet, hierarchy_root, standard_pdfs, selection_criteria=None,
+              progress_callback=None, workers=DEFAULT_WORKERS, backend=DEFAULT_BACKEND, compress=False,
+              engine=DEFAULT_ENGINE, staging_root=STAGING_ROOT, output_mode=DEFAULT_OUTPUT_MODE,
+              snapshot_dir=SNAPSHOT_DIR, client_data_source=None, profile=False, profile_memory=False,
+              trace=False, schedule=DEFAULT_SCHEDULE, print_shop=False, doc_types=None, converter=None,
+              cache=None, autotune=False):
+    """
+    Loads all projects and their clients and creates the documents for all of them in one run.
+
+    See load_batch and MailProject.create_client_documents for the parameters. If `compress` is True, the content
+    streams of the created pdfs are compressed and identical fonts and images are stored once per pdf
+    (see assembly.PdfAssembler). The intermediate files are written to a staging directory in `staging_root` and the
+    finished pdfs are saved at `hierarchy_root` in the folder hierarchy or in zip archives, depending on `output_mode`
+    (see output.py). If `snapshot_dir` is not None, the parsed records are cached in that directory (see snapshot.py).
+
+    If `profile` is True, the run (including loading the data source) is profiled per pipeline stage and worker, and
+    the reports are written to `hierarchy_root/profile_<timestamp>`. `profile_memory` additionally traces the memory
+    allocations (see profiling.RunProfiler). If `trace` is True, the timeline of the run is saved as a Chrome trace at
+    `hierarchy_root/trace_<timestamp>.json`, also if the run fails (see tracing.py). If `print_shop` is True, the pdfs
+    of the clients without mailing by email are additionally saved in one print file per advisor (see printshop.py).
+    If `doc_types` is not None, only the pdfs of these doc types are created and the existing pdfs of the other doc
+    types are kept (see utility.select_doc_types). A running `converter` (conversion.ConverterPool) and a `cache`
+    (cache.DocumentCache) can be shared by several runs, e.g. by the service (see service.py); otherwise, they are
+    created for this run. If `autotune` is True, the number of workers is adjusted during the run, starting with the
+    number of the last autotuned run on this machine, and the chosen number is saved for the next run (see
+    autotune.py).
+
+    Returns
+    -------
+    selections : list of tuple
+        Contains the processed (MailProject, selected_clients) pairs.
+    """
+    with ExitStack() as stack:
+        tracer = None
+        if trace:
+            tracer = TraceRecorder()
+            # registered first, so that the trace is exported after the output has been closed
+            stack.callback(tracer.export, default_trace_file(hierarchy_root))
+
+        tuner = None
+        if autotune:
+            tuner_key = machine_key(backend, engine)
+            max_workers = converter.size if converter is not None else AUTOTUNE_MAX_WORKERS
+            tuner = ConcurrencyTuner(load_workers(tuner_key) or workers, max_workers=max_workers)
+
+        if converter is None:
+            # LibreOffice starts in the background while the data source is loaded
+            converter = stack.enter_context(ConverterPool(tuner.max_workers if tuner else workers, backend))
+            converter.warm_up(tuner.workers if tuner else None)
+
+        profiler = None
+        if profile:
+            profiler = stack.enter_context(RunProfiler(default_profile_dir(hierarchy_root), profile_memory))
+
+        snapshot_cache = SnapshotCache(snapshot_dir) if snapshot_dir is not None else None
+        with trace_span(tracer, "load", data_source=data_source):
+            selections = load_batch(data_source, project_sheet, client_sheet, selection_criteria, client_data_source,
+                                    snapshot_cache)
+
+        if cache is None:
+            cache = DocumentCache()
+        assembler = PdfAssembler(compress=compress, dedup=compress, cache=cache)
+
+        with create_output(hierarchy_root, output_mode, staging_root, tracer=tracer) as output:
+            MailProject.create_batch_documents(selections, hierarchy_root, standard_pdfs,
+                                               progress_callback=progress_callback, workers=workers, backend=backend,
+                                               converter=converter, cache=cache, assembler=assembler, engine=engine,
+                                               output=output, profiler=profiler, tracer=tracer, schedule=schedule,
+                                               print_shop=PrintShop() if print_shop else None, doc_types=doc_types,
+                                               tuner=tuner)
+        if tuner is not None:
+            save_workers(tuner_key, tuner)
+
+    return selections
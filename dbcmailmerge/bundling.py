@@ -0,0 +1,254 @@
+"""
+Author: David Meyer
+
+Description
+-----------
+Contains the StandardsBundler, which saves the standard pdfs once per advisor or once per run, instead of appending
+them to the pdf of each client.
+
+By default, the standard pdfs (e.g., the product information sheet and the factsheet) are appended to the pdf of
+each client of the doc types in INCLUDE_STANDARDS, so a run of 500 clients contains 500 copies of them. For the doc
+types in STANDARDS_BUNDLES (see config.py), the pdfs of the clients only contain the customized pages, and the
+standard pdfs are assembled once into a bundle
+    - `advisor`: in the folder of each advisor, e.g. `client_correspondence/Betreuer 1/standards_offer_documents.pdf`,
+    - `run`: in the TOP_LEVEL_DIR, e.g. `client_correspondence/standards_offer_documents.pdf`.
+The bundle uses the size profile of the doc type (see assembly.PdfAssembler). Each advisor folder additionally
+receives an index (`index_offer_documents.csv`), which lists the pdf of each client and the bundle, that belongs to
+it (paths relative to the advisor folder). If only some clients are created (e.g., `--client-id`), the clients of
+the existing index, whose pdfs still exist, are kept.
+
+The bundles and indexes are written when all pdfs of the run have been created. In the distributed mode (see
+workqueue.py), each shard updates the indexes of its advisors, so the update of an index (read the existing index,
+merge, replace) is serialized by a lock file next to it (`index_offer_documents.csv.lock`), and the pdfs of the shard
+are transferred before, so that the other workers see them. The lock of a worker, that died while holding it, is
+removed after LEASE_TIMEOUT seconds (measured with the clock of the file server, as in workqueue.py).
+
+The print files (see printshop.py) contain the pdfs of the clients without the bundle, which is printed once per
+advisor or run. A bundle per run isn't supported with one zip archive per advisor, since it doesn't belong to an
+archive.
+"""
+import os
+import csv
+import time
+import uuid
+import threading
+from pathlib import Path, PurePosixPath
+from contextlib import contextmanager
+
+from dbcmailmerge.config import INCLUDE_STANDARDS, BUNDLE_SCOPES, STANDARDS_BUNDLES, LEASE_TIMEOUT
+from dbcmailmerge.output import ZipOutput, transfer
+
+STANDARDS_FILE_NAME = "standards_{doc_type}.pdf"
+INDEX_FILE_NAME = "index_{doc_type}.csv"
+INDEX_COLUMNS = ("client_id", "document", "standards")
+INDEX_LOCK_POLL_INTERVAL = 0.1  # seconds
+
+
+class StandardsBundler:
+    """
+    Collects the pdfs of the bundled doc types and writes the bundles and indexes at the end of the run. Thread-safe,
+    one instance is shared by all workers of a run.
+
+    Parameters
+    ----------
+    scopes : dict, optional
+        Contains doc_type, scope pairs, the scope is one of BUNDLE_SCOPES or None (default: config.STANDARDS_BUNDLES).
+
+    Raises
+    ------
+    ValueError
+        If a scope is unknown.
+    """
+    def __init__(self, scopes=STANDARDS_BUNDLES):
+        unknown = {scope for scope in scopes.values() if scope is not None and scope not in BUNDLE_SCOPES}
+        if unknown:
+            raise ValueError(f"Unknown bundle scope(s): {', '.join(sorted(unknown))}")
+
+        self.scopes = scopes
+        self.__documents = {}  # (advisor_dir, doc_type): {filename: client_id}
+        self.__lock = threading.Lock()
+
+    def bundles(self, doc_type):
+        """Returns True, if the standard pdfs of `doc_type` are bundled instead of being appended to each pdf."""
+        return INCLUDE_STANDARDS[doc_type] and self.scopes.get(doc_type) is not None
+
+    def standards_file(self, advisor_dir, doc_type):
+        """
+        Returns the location of the bundle of an advisor.
+
+        Parameters
+        ----------
+        advisor_dir : pathlib.Path
+            The folder of the advisor relative to the destination root (TOP_LEVEL_DIR/advisor).
+        doc_type : str
+            One of TEMPLATES.keys().
+
+        Returns
+        -------
+        relative_file : pathlib.Path
+            The bundle relative to the destination root.
+        """
+        bundle_dir = advisor_dir if self.scopes[doc_type] == "advisor" else advisor_dir.parent
+        return bundle_dir / STANDARDS_FILE_NAME.format(doc_type=doc_type)
+
+    def add(self, advisor_dir, doc_type, client_id, filename):
+        """
+        Adds the pdf of a client to the index of its advisor.
+
+        Parameters
+        ----------
+        advisor_dir : pathlib.Path
+            The folder of the advisor relative to the destination root (TOP_LEVEL_DIR/advisor).
+        doc_type : str
+            One of TEMPLATES.keys(), the pdf is saved in the folder `advisor_dir/doc_type`.
+        client_id : str
+        filename : str
+            The name of the pdf including the suffix.
+
+        Returns
+        -------
+        None
+        """
+        with self.__lock:
+            self.__documents.setdefault((advisor_dir, doc_type), {})[filename] = client_id
+
+    def finish(self, output, standard_pdfs, assembler):
+        """
+        Assembles the bundles and writes the indexes to the staging directory of `output` and publishes them. The
+        indexes of a DirectoryOutput are transferred immediately under the lock of the index, see the module docstring.
+
+        Parameters
+        ----------
+        output : output.DirectoryOutput or output.ZipOutput
+            The output of the run, which transfers the files to the destination.
+        standard_pdfs : list of pathlib.Path or pathlike str
+            The standard pdfs of the run.
+        assembler : assembly.PdfAssembler
+            Assembles the bundles with the size profile of the doc type.
+
+        Returns
+        -------
+        files : list of pathlib.Path
+            The published bundles and indexes relative to the destination root.
+        """
+        with self.__lock:
+            documents, self.__documents = self.__documents, {}
+
+        shared = not isinstance(output, ZipOutput)
+        if shared and documents:
+            output.flush()  # the pdfs have to be at the destination, before the index is merged (see below)
+
+        files = []
+        for (advisor_dir, doc_type), filenames in sorted(documents.items()):
+            standards_file = self.standards_file(advisor_dir, doc_type)
+            if standard_pdfs and standards_file not in files:
+                assembler.assemble([], standard_pdfs, output.local_dir(standards_file.parent) / standards_file.name,
+                                   doc_type=doc_type)
+                output.publish(standards_file)
+                files.append(standards_file)
+
+            index_file = advisor_dir / INDEX_FILE_NAME.format(doc_type=doc_type)
+            standards = _relative_posix(standards_file, advisor_dir) if standard_pdfs else ''
+            rows = {(PurePosixPath(doc_type) / filename).as_posix(): {"client_id": client_id, "standards": standards}
+                    for filename, client_id in filenames.items()}
+
+            destination_index = Path(output.destination_root) / index_file
+            with (_index_lock(destination_index) if shared else _no_lock()):
+                # clients of a previous run or of the other workers, e.g. if only some clients have been created
+                for row in read_index(destination_index):
+                    if row["document"] not in rows and (Path(output.destination_root) / advisor_dir
+                                                        / row["document"]).exists():
+                        rows[row["document"]] = row
+
+                staged_index = output.local_dir(advisor_dir) / index_file.name
+                with open(staged_index, "w", newline='', encoding="utf-8") as index:
+                    writer = csv.DictWriter(index, INDEX_COLUMNS, extrasaction="ignore")
+                    writer.writeheader()
+                    for document, row in sorted(rows.items()):
+                        writer.writerow(dict(row, document=document))
+
+                if shared:
+                    transfer(staged_index, destination_index)
+                else:
+                    output.publish(index_file)
+            files.append(index_file)
+
+        return files
+
+
+def read_index(index_path):
+    """
+    Reads an index written by StandardsBundler.finish.
+
+    Parameters
+    ----------
+    index_path : pathlib.Path
+
+    Returns
+    -------
+    rows : list of dict
+        One dict per client with the keys of INDEX_COLUMNS, empty if the index doesn't exist.
+    """
+    try:
+        with open(index_path, newline='', encoding="utf-8") as index:
+            return list(csv.DictReader(index))
+    except FileNotFoundError:
+        return []
+
+
+@contextmanager
+def _index_lock(index_path, timeout=LEASE_TIMEOUT):
+    """Holds the lock file of `index_path` (see the module docstring), waits while another worker holds it."""
+    lock_path = index_path.with_name(index_path.name + ".lock")
+    lock_path.parent.mkdir(parents=True, exist_ok=True)
+
+    while True:
+        try:
+            os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            break
+        except FileExistsError:
+            pass
+
+        try:
+            if _server_time(lock_path.parent) - lock_path.stat().st_mtime > timeout:
+                # only one of several waiting workers succeeds in moving the stale lock away
+                stale_path = lock_path.with_name(f"{lock_path.name}.{uuid.uuid4().hex}.stale")
+                os.rename(lock_path, stale_path)
+                os.remove(stale_path)
+                continue
+        except FileNotFoundError:
+            continue  # released in the meantime
+
+        time.sleep(INDEX_LOCK_POLL_INTERVAL)
+
+    try:
+        yield
+    finally:
+        os.remove(lock_path)
+
+
+@contextmanager
+def _no_lock():
+    yield
+
+
+def _server_time(directory):
+    # the mtime of a touched file is set by the file server, see workqueue.py
+    clock_path = directory / f".clock_{uuid.uuid4().hex}"
+    clock_path.touch()
+    now = clock_path.stat().st_mtime
+    os.remove(clock_path)
+
+    return now
+
+
+def appends_standards(doc_type, scopes=STANDARDS_BUNDLES):
+    """Returns True, if the standard pdfs are appended to each pdf of `doc_type` (INCLUDE_STANDARDS, not bundled)."""
+    return INCLUDE_STANDARDS[doc_type] and scopes.get(doc_type) is None
+
+
+def _relative_posix(relative_file, start_dir):
+    """Returns the path of `relative_file` relative to `start_dir`, both relative to the same root."""
+    if relative_file.parent == start_dir:
+        return relative_file.name
+    return (PurePosixPath("..") / relative_file.name).as_posix()
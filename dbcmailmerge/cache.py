@@ -0,0 +1,68 @@
+"""
+Author: David Meyer
+
+Description
+-----------
+Contains the DocumentCache, which keeps the word templates and the standard pdfs in memory during a run.
+
+Without the cache, every template is read from disk for every client and every standard pdf is opened once per
+client. The cache reads each file once and hands out independent in-memory file objects, so it can be shared by all
+workers and by all projects of a batch (see batch.py).
+"""
+import io
+import threading
+from pathlib import Path
+
+
+class DocumentCache:
+    """
+    Thread-safe, in-memory cache of the files used for creating the documents.
+
+    Returns a new io.BytesIO object per request, so that callers can read, seek, and close them independently.
+    """
+    def __init__(self):
+        self.__files = {}
+        self.__lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.__files)
+
+    def template(self, template_path):
+        """
+        Returns the word template at `template_path`, e.g. for MailMerge.
+
+        Parameters
+        ----------
+        template_path : pathlib.Path or pathlike str
+            Filepath to the docx template.
+
+        Returns
+        -------
+        template : io.BytesIO
+            The content of the template.
+        """
+        return io.BytesIO(self.__read(template_path))
+
+    def standard_pdf(self, pdf_path):
+        """
+        Returns the standard pdf at `pdf_path`, e.g. for appending it to the customized documents.
+
+        Parameters
+        ----------
+        pdf_path : pathlib.Path or pathlike str
+            Filepath to the standard pdf.
+
+        Returns
+        -------
+        pdf : io.BytesIO
+            The content of the pdf.
+        """
+        return io.BytesIO(self.__read(pdf_path))
+
+    def __read(self, path):
+        key = Path(path).resolve()
+
+        with self.__lock:
+            if key not in self.__files:
+                self.__files[key] = key.read_bytes()
+            return self.__files[key]
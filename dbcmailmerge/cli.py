@@ -0,0 +1,449 @@
+"""
+Author: David Meyer
+
+Description
+-----------
+Non-interactive command line interface for creating the client documents, e.g., for scheduled runs on a server.
+
+Contrary to run.py, this module never prompts the user and never imports tkinter. All settings are provided as
+command line arguments and/or in a config file. Run `python -m dbcmailmerge --help` for the available options.
+
+Config File
+-----------
+The config file is an INI file. Each section describes one project run, the runs are executed in the order of the
+sections. Values in the DEFAULT section apply to all runs, command line arguments override the values of the file.
+Relative paths are resolved relative to the directory of the config file.
+
+    [DEFAULT]
+    output_root = /srv/mailings
+    workers = 4
+
+    [project_141]
+    data_source = data/q4.xlsx
+    project_sheet = project_data
+    client_sheet = client_data
+    filters = amount
+    standard_pdfs =
+        data/pib.pdf
+        data/factsheet.pdf
+"""
+import sys
+import argparse
+import configparser
+from pathlib import Path
+
+from dbcmailmerge.config import (SELECTION_FILTERS, DEFAULT_WORKERS, DEFAULT_BACKEND, ENGINES, DEFAULT_ENGINE,
+                                 STAGING_ROOT, OUTPUT_MODES, DEFAULT_OUTPUT_MODE, SNAPSHOT_DIR, SHARD_SIZE,
+                                 SCHEDULES, DEFAULT_SCHEDULE, TEMPLATES, WATCH_INTERVAL, STANDARDS_BUNDLES)
+from dbcmailmerge.conversion import BACKENDS
+from dbcmailmerge.utility import DATA_SOURCE_FORMATS, select_doc_types, client_id_filter
+
+REQUIRED_SETTINGS = ("data_source", "output_root")
+PATH_SETTINGS = ("data_source", "client_data_source", "output_root", "staging_dir", "snapshot_dir", "queue_dir")
+
+
+class ConfigError(Exception):
+    """Raised if the settings for a run are incomplete or invalid."""
+
+
+def build_parser():
+    """
+    Creates the parser for the command line arguments.
+
+    Returns
+    -------
+    parser : argparse.ArgumentParser
+        The parser. Options that are not provided are None, so that they don't override values of the config file.
+    """
+    parser = argparse.ArgumentParser(prog="dbcmailmerge",
+                                     description="Creates one PDF per client and doc type without user interaction.")
+
+    parser.add_argument("--config", type=Path,
+                        help="INI file, each section describes one project run (executed in order)")
+    parser.add_argument("--data-source", type=Path,
+                        help=f"file containing the project and client data ({', '.join(DATA_SOURCE_FORMATS)})")
+    parser.add_argument("--client-data-source", type=Path,
+                        help="file containing the client data, if it isn't the data source (e.g., for CSV files)")
+    parser.add_argument("--project-sheet", help="sheet/table name of the project data (excel, SQLite)")
+    parser.add_argument("--client-sheet",
+                        help="sheet/table name of the client data (excel, SQLite), may contain `{project_id}` for "
+                             "multiple projects")
+    parser.add_argument("--filter", action="append", dest="filters", choices=sorted(SELECTION_FILTERS),
+                        help="only create documents for clients passing this filter, can be repeated")
+    parser.add_argument("--standard-pdf", action="append", dest="standard_pdfs", type=Path,
+                        help="standard pdf appended to the documents (see INCLUDE_STANDARDS), can be repeated")
+    parser.add_argument("--doc-type", action="append", dest="doc_types", choices=list(TEMPLATES),
+                        help="only create the pdfs of this doc type and keep the existing pdfs of the other doc types, "
+                             "can be repeated")
+    parser.add_argument("--template", action="append", dest="templates",
+                        help="only create the pdfs of the doc types containing this template (filename), can be "
+                             "repeated")
+    parser.add_argument("--client-id", action="append", dest="client_ids",
+                        help="only create the pdfs of this client and keep the existing pdfs of the other clients, "
+                             "can be repeated")
+    parser.add_argument("--snapshot-dir", type=Path,
+                        help="cache the parsed data source in this directory and reuse it while it is unchanged")
+    parser.add_argument("--output-root", type=Path, help="directory in which the documents are saved")
+    parser.add_argument("--output-mode", choices=OUTPUT_MODES,
+                        help=f"save the pdfs in folders or zip archives, see output.py (default: {DEFAULT_OUTPUT_MODE})")
+    parser.add_argument("--staging-dir", type=Path,
+                        help="local directory for the intermediate files, the finished pdfs are moved to the output "
+                             "root (default: the temp directory)")
+    parser.add_argument("--workers", type=int, help=f"number of parallel workers (default: {DEFAULT_WORKERS})")
+    parser.add_argument("--backend", choices=BACKENDS, help=f"conversion backend (default: {DEFAULT_BACKEND})")
+    parser.add_argument("--autotune", action="store_true", default=None,
+                        help="adjust the number of workers to the throughput and the available memory during the run, "
+                             "starting with the number chosen by the last autotuned run, see autotune.py")
+    parser.add_argument("--engine", choices=ENGINES,
+                        help=f"engine creating the customized pdfs, see overlay.py (default: {DEFAULT_ENGINE})")
+    parser.add_argument("--schedule", choices=SCHEDULES,
+                        help=f"order in which the pdfs are created, see scheduling.py (default: {DEFAULT_SCHEDULE})")
+    parser.add_argument("--compress", action="store_true", default=None,
+                        help="compress the created pdfs and store identical fonts/images once per pdf")
+    parser.add_argument("--profile", action="store_true", default=None,
+                        help="profile the run per stage and worker, reports are saved in the output root")
+    parser.add_argument("--profile-memory", action="store_true", default=None,
+                        help="additionally trace the memory allocations of the profiled run (slow)")
+    parser.add_argument("--trace", action="store_true", default=None,
+                        help="save the timeline of the run as a Chrome trace (trace_<timestamp>.json) in the output "
+                             "root")
+    parser.add_argument("--print-shop", action="store_true", default=None,
+                        help="additionally save the pdfs of the clients without mailing by email in one print file "
+                             "per advisor, see printshop.py")
+    parser.add_argument("--verify", action="store_true", default=None,
+                        help="check the created pdfs after the run (files, page counts, names and amounts) on all "
+                             "cores, see verification.py")
+    parser.add_argument("--watch", action="store_true", default=None,
+                        help=f"keep the pdfs up to date, while the data source, the templates or the standard pdfs "
+                             f"change (checked every {WATCH_INTERVAL} seconds, until Ctrl+C), see watch.py")
+    parser.add_argument("--dry-run", action="store_true", default=None,
+                        help="only merge the documents in memory and report missing fields and invalid values, "
+                             "without converting or writing files")
+    parser.add_argument("--queue-dir", type=Path,
+                        help="don't create the documents, but split the clients into shards in this shared directory "
+                             "for the workers (python -m dbcmailmerge.workqueue)")
+    parser.add_argument("--shard-size", type=int, help=f"number of clients per shard (default: {SHARD_SIZE})")
+    parser.add_argument("--quiet", action="store_true", help="don't print the progress")
+
+    return parser
+
+
+def resolve_runs(args):
+    """
+    Combines the config file and the command line arguments to the settings of each run.
+
+    Parameters
+    ----------
+    args : argparse.Namespace
+        The parsed command line arguments, see build_parser.
+
+    Returns
+    -------
+    runs : list of dict
+        One dict of settings per run, in the order of execution. Each dict contains a `name` and the keys of
+        REQUIRED_SETTINGS, `project_sheet`, `client_sheet`, `client_data_source`, `filters`, `client_ids`,
+        `doc_types` (resolved from the doc types and templates, see utility.select_doc_types), `standard_pdfs`,
+        `workers`, `backend`, `compress`, `engine`, `staging_dir`, `output_mode`, `snapshot_dir`, `profile`,
+        `profile_memory`, `trace`, `queue_dir`, `shard_size`, `schedule`, `print_shop`, `verify`, `watch`,
+        `autotune`, and `dry_run`.
+
+    Raises
+    ------
+    ConfigError
+        If a required setting is missing or a value is invalid.
+    """
+    overrides = {key: value for key, value in vars(args).items()
+                 if key not in ("config", "quiet") and value is not None}
+
+    if args.config is None:
+        runs = [dict(overrides, name="command line")]
+    else:
+        runs = [dict(section, **overrides) for section in read_config(args.config)]
+
+    return [resolve_run(run) for run in runs]
+
+
+def resolve_run(run):
+    """
+    Completes and checks the settings of one run, e.g. from a section of the config file or a job of the service.
+
+    Parameters
+    ----------
+    run : dict
+        The settings of the run, containing at least a `name`. Missing optional settings are set to their defaults.
+
+    Returns
+    -------
+    run : dict
+        The same dict, see resolve_runs for the keys.
+
+    Raises
+    ------
+    ConfigError
+        If a required setting is missing or a value is invalid.
+    """
+    missing = [key for key in REQUIRED_SETTINGS if not run.get(key)]
+    if missing:
+        raise ConfigError(f"Run `{run['name']}` is missing the setting(s): {', '.join(missing)}")
+
+    # excel files and SQLite databases contain several sheets/tables, CSV and Parquet files only one
+    run.setdefault("client_data_source", None)
+    sources = {"project_sheet": run["data_source"], "client_sheet": run["client_data_source"] or run["data_source"]}
+    for key, source in sources.items():
+        data_format = DATA_SOURCE_FORMATS.get(Path(source).suffix.lower())
+        if data_format is None:
+            raise ConfigError(f"Run `{run['name']}` uses the unsupported data source {source}")
+        if data_format in ("excel", "sqlite") and not run.get(key):
+            raise ConfigError(f"Run `{run['name']}` is missing the setting(s): {key}")
+        run.setdefault(key, None)
+
+    run.setdefault("filters", [])
+    run.setdefault("client_ids", [])
+    run.setdefault("standard_pdfs", [])
+    run["workers"] = int(run.get("workers", DEFAULT_WORKERS))
+    run.setdefault("backend", DEFAULT_BACKEND)
+    for key in ("compress", "profile", "profile_memory", "trace", "print_shop", "verify", "watch",
+                "autotune", "dry_run"):
+        run[key] = str(run.get(key, False)).lower() in ("true", "yes", "1", "on")
+    run.setdefault("engine", DEFAULT_ENGINE)
+    run.setdefault("staging_dir", STAGING_ROOT)
+    run.setdefault("output_mode", DEFAULT_OUTPUT_MODE)
+    run.setdefault("snapshot_dir", SNAPSHOT_DIR)
+    run.setdefault("queue_dir", None)
+    run.setdefault("schedule", DEFAULT_SCHEDULE)
+    run["shard_size"] = int(run.get("shard_size", SHARD_SIZE))
+
+    unknown = set(run["filters"]) - SELECTION_FILTERS.keys()
+    if unknown:
+        raise ConfigError(f"Run `{run['name']}` uses unknown filter(s): {', '.join(sorted(unknown))}")
+    if run["backend"] not in BACKENDS:
+        raise ConfigError(f"Run `{run['name']}` uses the unknown backend `{run['backend']}`")
+    if run["engine"] not in ENGINES:
+        raise ConfigError(f"Run `{run['name']}` uses the unknown engine `{run['engine']}`")
+    if run["output_mode"] not in OUTPUT_MODES:
+        raise ConfigError(f"Run `{run['name']}` uses the unknown output mode `{run['output_mode']}`")
+    if run["schedule"] not in SCHEDULES:
+        raise ConfigError(f"Run `{run['name']}` uses the unknown schedule `{run['schedule']}`")
+    if run["queue_dir"] is not None and run["output_mode"] != "folders":
+        raise ConfigError(f"Run `{run['name']}` uses a work queue, which only supports the output mode `folders`")
+    if run["queue_dir"] is not None and run["print_shop"]:
+        raise ConfigError(f"Run `{run['name']}` uses a work queue, which doesn't support print files")
+    if run["output_mode"] == "zip_per_advisor" and "run" in STANDARDS_BUNDLES.values():
+        raise ConfigError(f"Run `{run['name']}` bundles the standard pdfs once per run (see STANDARDS_BUNDLES), which "
+                          f"isn't supported by the output mode `zip_per_advisor`")
+
+    try:
+        run["doc_types"] = select_doc_types(run.get("doc_types"), run.pop("templates", None))
+    except ValueError as err:
+        raise ConfigError(f"Run `{run['name']}`: {err}") from err
+
+    # only the folder hierarchy keeps the existing pdfs, an archive or a print file would only contain the new ones
+    selective = run["client_ids"] or run["doc_types"] != list(TEMPLATES)
+    if selective and run["output_mode"] != "folders":
+        raise ConfigError(f"Run `{run['name']}` creates only some pdfs, which is only supported by the output mode "
+                          f"`folders`")
+    if run["client_ids"] and run["print_shop"]:
+        raise ConfigError(f"Run `{run['name']}` creates only the pdfs of some clients, which doesn't support print "
+                          f"files")
+    if run["verify"] and (run["queue_dir"] is not None or run["output_mode"] != "folders"):
+        raise ConfigError(f"Run `{run['name']}` can only be verified with the output mode `folders` and without a "
+                          f"work queue")
+    if run["autotune"] and (run["queue_dir"] is not None or run["watch"]):
+        raise ConfigError(f"Run `{run['name']}` can't be autotuned with a work queue or in the watch mode")
+    if run["watch"] and (run["queue_dir"] is not None or run["output_mode"] != "folders" or run["print_shop"]
+                         or run["doc_types"] != list(TEMPLATES)):
+        raise ConfigError(f"Run `{run['name']}` can only be watched with the output mode `folders`, all doc types "
+                          f"and without a work queue or print files")
+    if run["watch"] and (run["profile"] or run["profile_memory"] or run["trace"]):
+        raise ConfigError(f"Run `{run['name']}` can't be profiled or traced in the watch mode")
+
+    return run
+
+
+def read_config(config_path):
+    """
+    Reads the runs from an INI config file. See the module docstring for the format.
+
+    Parameters
+    ----------
+    config_path : pathlib.Path
+        Filepath to the config file.
+
+    Returns
+    -------
+    runs : list of dict
+        The settings per section, with parsed lists and absolute paths.
+
+    Raises
+    ------
+    ConfigError
+        If the file can't be read or contains no runs.
+    """
+    parser = configparser.ConfigParser()
+    if not parser.read(config_path, encoding="utf-8"):
+        raise ConfigError(f"Couldn't read the config file {config_path}")
+
+    base_dir = Path(config_path).resolve().parent
+
+    runs = []
+    for name in parser.sections():
+        section = parser[name]
+        run = {"name": name}
+
+        for key, value in section.items():
+            if key in PATH_SETTINGS:
+                run[key] = base_dir / value
+            elif key == "standard_pdfs":
+                run[key] = [base_dir / line.strip() for line in value.splitlines() if line.strip()]
+            elif key in ("filters", "doc_types", "templates", "client_ids"):
+                run[key] = value.replace(',', ' ').split()
+            else:
+                run[key] = value
+
+        runs.append(run)
+
+    if not runs:
+        raise ConfigError(f"The config file {config_path} doesn't contain any runs (sections).")
+
+    return runs
+
+
+def execute_run(run, progress_callback=None, converter=None, cache=None):
+    """
+    Loads the projects and their clients, selects the clients, and creates their documents.
+
+    If the project sheet contains several projects, the documents of all projects are created in one batch, see
+    batch.py. In that case, the client sheet may contain the placeholder `{project_id}`. If the run has a `queue_dir`,
+    the selected clients are only added to the work queue, the documents are created by the workers (see workqueue.py).
+    A dry run only validates the documents and prints the report (see validation.py). With `verify`, the created pdfs
+    are checked after the run and the report is printed (see verification.py).
+
+    Parameters
+    ----------
+    run : dict
+        The settings of the run, see resolve_runs.
+    progress_callback : callable or None, optional
+        Passed on to MailProject.create_batch_documents (default: None).
+    converter, cache
+        Passed on to batch.run_batch, e.g. the running pool and the cache of the service (default: None).
+
+    Returns
+    -------
+    selections : list of tuple
+        Contains the processed (MailProject, selected_clients) pairs.
+
+    Raises
+    ------
+    validation.ValidationError
+        If the dry run or the verification found errors.
+    """
+    from dbcmailmerge.batch import run_batch
+
+    selection_criteria = {key: SELECTION_FILTERS[key] for key in run["filters"]}
+    if run["client_ids"]:
+        selection_criteria["client_id"] = client_id_filter(run["client_ids"])
+
+    if run["dry_run"]:
+        from dbcmailmerge.batch import validate_batch
+        from dbcmailmerge.validation import ValidationError
+
+        selections, report = validate_batch(run["data_source"], run["project_sheet"], run["client_sheet"],
+                                            selection_criteria, run["snapshot_dir"], run["client_data_source"])
+        print(report.format(), end='', file=sys.stderr)
+        if not report.ok:
+            raise ValidationError(report)
+        return selections
+
+    if run["queue_dir"] is not None:
+        from dbcmailmerge.workqueue import enqueue_batch
+
+        return enqueue_batch(run["queue_dir"], run["data_source"], run["project_sheet"], run["client_sheet"],
+                             Path(run["output_root"]), run["standard_pdfs"], selection_criteria=selection_criteria,
+                             engine=run["engine"], compress=run["compress"], shard_size=run["shard_size"],
+                             snapshot_dir=run["snapshot_dir"], client_data_source=run["client_data_source"],
+                             schedule=run["schedule"], doc_types=run["doc_types"])
+
+    if run["watch"]:
+        from dbcmailmerge.watch import watch_batch
+
+        def print_update(update):
+            if isinstance(update, Exception):
+                print(f"Update of run `{run['name']}` failed: {update!r}", file=sys.stderr)
+            else:
+                print(f"Updated run `{run['name']}`: {update.created} created, {update.refreshed} refreshed, "
+                      f"{update.removed} removed", file=sys.stderr)
+
+        return watch_batch(run["data_source"], run["project_sheet"], run["client_sheet"], Path(run["output_root"]),
+                           run["standard_pdfs"], selection_criteria=selection_criteria,
+                           progress_callback=progress_callback, workers=run["workers"], backend=run["backend"],
+                           compress=run["compress"], engine=run["engine"], staging_root=run["staging_dir"],
+                           snapshot_dir=run["snapshot_dir"], client_data_source=run["client_data_source"],
+                           schedule=run["schedule"], update_callback=print_update)
+
+    selections = run_batch(run["data_source"], run["project_sheet"], run["client_sheet"], Path(run["output_root"]),
+                           run["standard_pdfs"], selection_criteria=selection_criteria,
+                           progress_callback=progress_callback, workers=run["workers"], backend=run["backend"],
+                           compress=run["compress"], engine=run["engine"], staging_root=run["staging_dir"],
+                           output_mode=run["output_mode"], snapshot_dir=run["snapshot_dir"],
+                           client_data_source=run["client_data_source"],
+                           profile=run["profile"] or run["profile_memory"], profile_memory=run["profile_memory"],
+                           trace=run["trace"], schedule=run["schedule"], print_shop=run["print_shop"],
+                           doc_types=run["doc_types"], converter=converter, cache=cache, autotune=run["autotune"])
+
+    if run["verify"]:
+        from dbcmailmerge.mailproject import MailProject
+        from dbcmailmerge.validation import ValidationError
+
+        report = MailProject.verify_batch_documents(selections, Path(run["output_root"]), run["standard_pdfs"])
+        print(report.format(), end='', file=sys.stderr)
+        if not report.ok:
+            raise ValidationError(report)
+
+    return selections
+
+
+def main(argv=None):
+    """
+    Entry point of the command line interface.
+
+    Parameters
+    ----------
+    argv : list of str or None, optional
+        The command line arguments without the program name (default: None, i.e., sys.argv[1:]).
+
+    Returns
+    -------
+    exit_code : int
+        0 if all runs succeeded, 1 if a run failed. Invalid settings exit with code 2 before any run is started.
+    """
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    try:
+        runs = resolve_runs(args)
+    except ConfigError as err:
+        parser.error(str(err))
+
+    from dbcmailmerge.progress import ConsoleProgressRenderer
+
+    for run in runs:
+        print(f"Starting run `{run['name']}`", file=sys.stderr)
+        progress_callback = None if args.quiet else ConsoleProgressRenderer(sys.stderr)
+
+        try:
+            selections = execute_run(run, progress_callback)
+        except Exception as err:
+            print(f"Run `{run['name']}` failed: {err!r}", file=sys.stderr)
+            return 1
+
+        finished = "Finished"
+        if run["dry_run"]:
+            finished = "Validated"
+        elif run["queue_dir"] is not None:
+            finished = "Enqueued"
+        elif run["watch"]:
+            finished = "Watched"
+        for project, selected_clients in selections:
+            print(f"{finished} run `{run['name']}`: {project} ({len(selected_clients)} clients)", file=sys.stderr)
+
+    return 0
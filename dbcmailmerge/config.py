@@ -29,6 +29,20 @@ INCLUDE_STANDARDS : dict
     is for internal use only, thus, it does not need standardized documents, such as general terms and conditions,
     since they are available for internal use anyways.
 
+SIZE_PROFILES, DOC_TYPE_SIZE_PROFILES : dict
+    The size profiles of the assembled pdfs and the profile used per doc_type (see assembly.py). A profile determines,
+    whether the content streams are compressed (`compress`), whether identical fonts and images are stored only once
+    per pdf (`dedup`), and whether the data of the pages, which isn't needed for viewing and printing (thumbnails,
+    metadata and private data of the authoring application), is removed (`strip`). All profiles are lossless. The
+    doc types with the profile None use the compression setting of the run (`--compress`).
+
+    For example, set `"offer_documents": "smallest"` for documents that are sent by email.
+
+BUNDLE_SCOPES, STANDARDS_BUNDLES : tuple, dict
+    Where the standard pdfs of a doc type (see INCLUDE_STANDARDS) are saved. None appends them to the pdf of each
+    client, `advisor` saves them once in the folder of each advisor and `run` once in the TOP_LEVEL_DIR. Bundled
+    standard pdfs are referenced by an index of the clients per advisor (see bundling.py).
+
 CONVERSION_MAP : dict
 
 FIELD_MAP_CLIENTS, FIELD_MAP_PROJECT : dict
@@ -54,6 +68,81 @@ FIELD_MAP_CLIENTS_REVERSED : dict
     should be determined, it used the advisor name, documents are aggregated per client. In order to get the
     advisor name of that specific client record, it's value for the advisor key has to accessed,
     but the key is in its original, untranslated format.
+
+REQUIRED_FIELDS : tuple
+    The client fields (internal names), which need a value for each selected client. Checked by the dry run
+    (see validation.py).
+
+SELECTION_FILTERS : dict
+    Contains attribute_name, filter_function pairs that can be used as selection_criteria in
+    MailProject.select_clients. The filters can be selected in run.py and in the command line interface (cli.py).
+
+DEFAULT_WORKERS, DEFAULT_BACKEND : int, str
+    Number of clients processed in parallel and the backend used for converting the created docx files to PDF
+    (see conversion.py) when creating the documents.
+
+AUTOTUNE_MIN_WORKERS, AUTOTUNE_MAX_WORKERS, AUTOTUNE_WINDOW, AUTOTUNE_MIN_GAIN : int, int, int, float
+    Settings of the autotuning of the workers (see autotune.py): the bounds of the number of active workers, the
+    number of pdfs per measurement, and the relative gain of the throughput, for which another worker is added.
+
+AUTOTUNE_LATENCY_TOLERANCE, AUTOTUNE_MIN_AVAILABLE_MEMORY, AUTOTUNE_FILE : float, int, pathlib.Path
+    A worker is removed, if the seconds per pdf rise by more than this factor at the same number of workers, or if
+    less than this number of bytes of memory is available (each LibreOffice instance needs about 200 MB). The chosen
+    number of workers per machine is saved in AUTOTUNE_FILE and used as the start of the next autotuned run.
+
+RECYCLE_AFTER_DOCUMENTS, RECYCLE_MAX_RSS : int or None
+    A running LibreOffice instance (`uno` backend) is restarted after this number of conversions or if its resident
+    memory exceeds this number of MB, so that its memory doesn't grow during long runs (see conversion.py). None
+    disables the check.
+
+WORKER_MEMORY_LIMIT, WORKER_CPU_LIMIT : int or None
+    OS resource limits of each LibreOffice process: the virtual memory in MB and the CPU time in seconds. A process
+    exceeding a limit is terminated by the OS, and the instance is restarted. Requires the `prlimit` command (Linux).
+    None disables the limit.
+
+ENGINES, DEFAULT_ENGINE : tuple, str
+    The engines for creating the customized pdfs. `libreoffice` merges and converts each document, `overlay` writes
+    the values onto templates that are rendered once per run (see overlay.py) and falls back to `libreoffice`.
+
+STAGING_ROOT, WRITE_BEHIND : str or None, bool
+    The local directory for the intermediate files of a run (None: the temp directory of the OS) and whether the
+    finished pdfs are transferred to the destination while the run continues or all at once at its end
+    (see output.py).
+
+OUTPUT_MODES, DEFAULT_OUTPUT_MODE : tuple, str
+    How the finished pdfs are saved: `folders` in the folder hierarchy (advisor/doc_type), `zip_per_advisor` in one
+    zip archive per advisor, `zip_per_run` in one zip archive per run (see output.py).
+
+DATE_COLUMNS : tuple
+    The columns of the data sources, which contain dates. Only used for formats that store dates as text (CSV, SQLite),
+    excel and Parquet files contain typed dates (see utility.parse_data_source).
+
+SNAPSHOT_DIR : str or None
+    Directory in which the parsed records of the data sources are cached, so that an unchanged workbook isn't parsed
+    again (see snapshot.py). None disables the cache.
+
+SCHEDULES, DEFAULT_SCHEDULE : tuple, str
+    The order in which the pdfs of a run are created: `data_source` client by client, `advisor` advisor by advisor
+    (see scheduling.py).
+
+PRINT_DOC_TYPES, PRINT_DUPLEX : tuple, bool
+    The doc types, which are collected into one print-ready pdf per advisor for the clients without mailing by email,
+    and whether each client is padded with a blank page to an even number of pages, so that each client starts on a
+    new sheet in duplex printing (see printshop.py).
+
+SHARD_SIZE, LEASE_TIMEOUT, HEARTBEAT_INTERVAL, QUEUE_POLL_INTERVAL, MAX_SHARD_ATTEMPTS : int
+    Settings of the distributed mode (see workqueue.py): the number of clients per shard, the seconds after which the
+    shard of a worker without heartbeat is reclaimed, the seconds between two heartbeats, the seconds an idle worker
+    waits before it looks for shards again, and how often a shard is reclaimed before it is given up.
+
+WATCH_INTERVAL, WATCH_STATE_FILE : int, str
+    Settings of the watch mode (see watch.py): the seconds between two checks of the data source, the templates and
+    the standard pdfs, and the name of the file in the output directory, in which the clients of the last update are
+    saved.
+
+SERVICE_HOST, SERVICE_PORT, SERVICE_HISTORY : str, int, int
+    Settings of the job service (see service.py): the address and the port it listens on (only local connections by
+    default, the service has no authentication), and the number of finished jobs whose status is kept.
 """
 import os
 from pathlib import Path
@@ -70,6 +159,15 @@ TEMPLATES = {"offer_documents": [base_path / "data/templates/cover_letter.docx",
 
 INCLUDE_STANDARDS = {"offer_documents": True, "appropriateness_test": False}
 
+SIZE_PROFILES = {"original": {"compress": False, "dedup": False, "strip": False},
+                 "compact": {"compress": True, "dedup": True, "strip": False},
+                 "smallest": {"compress": True, "dedup": True, "strip": True}}
+
+DOC_TYPE_SIZE_PROFILES = {"offer_documents": None, "appropriateness_test": None}
+
+BUNDLE_SCOPES = ("advisor", "run")
+STANDARDS_BUNDLES = {"offer_documents": None, "appropriateness_test": None}
+
 
 # Field Maps
 ############
@@ -102,6 +200,9 @@ FIELD_MAP_CLIENTS = {"db_id": "client_id",
 
 FIELD_MAP_CLIENTS_REVERSED = {value: key for key, value in FIELD_MAP_CLIENTS.items()}
 
+REQUIRED_FIELDS = ("client_id", "advisor", "first_name", "last_name", "salutation", "address_mailing_street",
+                   "address_mailing_zip", "address_mailing_city")
+
 FIELD_MAP_PROJECT = {"projektnummer": "project_id",
                      "projektname": "project_name",
 
@@ -113,3 +214,78 @@ FIELD_MAP_PROJECT = {"projektnummer": "project_id",
                      "emissionsvolumen_min": "issue_volume_min",
                      "emissionsvolumen_max": "issue_volume_max",
                      "sicherheiten": "collateral_string"}
+
+
+# Client Selection
+##################
+
+# evaluates to False for cells that had no value in the data source
+SELECTION_FILTERS = {"amount": lambda x: bool(x)}
+
+
+# Data Source
+#############
+
+DATE_COLUMNS = ("datum_emission", "datum_fälligkeit")
+
+SNAPSHOT_DIR = None
+
+
+# Document Creation
+###################
+
+DEFAULT_WORKERS = 1
+DEFAULT_BACKEND = "subprocess"
+
+AUTOTUNE_MIN_WORKERS = 1
+AUTOTUNE_MAX_WORKERS = os.cpu_count() or 1
+AUTOTUNE_WINDOW = 8  # pdfs
+AUTOTUNE_MIN_GAIN = 0.05
+AUTOTUNE_LATENCY_TOLERANCE = 1.5
+AUTOTUNE_MIN_AVAILABLE_MEMORY = 512 * 1024 ** 2  # bytes
+AUTOTUNE_FILE = Path.home() / ".dbcmailmerge_autotune.json"
+
+RECYCLE_AFTER_DOCUMENTS = 250  # conversions
+RECYCLE_MAX_RSS = 1024  # MB
+WORKER_MEMORY_LIMIT = None  # MB
+WORKER_CPU_LIMIT = None  # seconds
+
+ENGINES = ("libreoffice", "overlay")
+DEFAULT_ENGINE = "libreoffice"
+
+STAGING_ROOT = None
+WRITE_BEHIND = True
+
+OUTPUT_MODES = ("folders", "zip_per_advisor", "zip_per_run")
+DEFAULT_OUTPUT_MODE = "folders"
+
+SCHEDULES = ("data_source", "advisor")
+DEFAULT_SCHEDULE = "data_source"
+
+PRINT_DOC_TYPES = ("offer_documents",)
+PRINT_DUPLEX = True
+
+
+# Distributed Mode
+##################
+
+SHARD_SIZE = 50  # clients
+LEASE_TIMEOUT = 120  # seconds, has to be considerably larger than HEARTBEAT_INTERVAL
+HEARTBEAT_INTERVAL = 15  # seconds
+QUEUE_POLL_INTERVAL = 5  # seconds
+MAX_SHARD_ATTEMPTS = 3
+
+
+# Watch Mode
+############
+
+WATCH_INTERVAL = 10  # seconds
+WATCH_STATE_FILE = ".dbcmailmerge_watch.json"
+
+
+# Job Service
+#############
+
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8631
+SERVICE_HISTORY = 100  # finished jobs
@@ -0,0 +1,439 @@
+"""
+Author: David Meyer
+
+Description
+-----------
+Contains the ConverterPool, which converts the created docx files to PDF using one or more LibreOffice instances.
+
+LibreOffice refuses to run two instances on the same user profile; a conversion started while another instance
+(e.g., the user's own LibreOffice window) uses the profile silently fails. Therefore, each slot of the pool uses its
+own, isolated user profile, which allows running several conversions in parallel.
+
+Backends
+--------
+subprocess
+    Starts one headless LibreOffice process per conversion (see docx2pdfconverter.convert_to). Requires no additional
+    dependencies.
+uno
+    Keeps one headless LibreOffice instance per slot running and converts the documents through the UNO API. This saves
+    the start up of LibreOffice per document. Requires the `uno` python module, which is shipped with LibreOffice
+    (e.g., the `python3-uno` package on Debian/Ubuntu).
+
+Warm-up
+-------
+The first start of LibreOffice on a new user profile takes several seconds, since the profile is created, and with the
+`uno` backend, each slot starts its instance on its first conversion. `ConverterPool.warm_up` does this in background
+threads, e.g. while the data source is parsed and the user is prompted for the settings, so that the first conversion
+finds a warm slot. A conversion waits for the warm-up of its slot, instead of starting a second instance.
+
+Recycling and Resource Limits
+-----------------------------
+The memory of a running LibreOffice instance grows with every converted document, so long runs slow down or crash.
+With the `uno` backend, a slot restarts its instance after RECYCLE_AFTER_DOCUMENTS conversions or if the resident
+memory of the instance (including its child processes) exceeds RECYCLE_MAX_RSS (see config.py). The memory is read
+with the optional dependency psutil or from /proc. If the instance has died (e.g., it crashed or exceeded a resource
+limit), the slot starts a new instance and converts the document again, so the run continues. The `subprocess`
+backend starts a new process per conversion anyway.
+
+WORKER_MEMORY_LIMIT and WORKER_CPU_LIMIT cap the virtual memory and the CPU time of each LibreOffice process with OS
+resource limits, so that a runaway instance can't slow down the machine. The limits are set with the `prlimit`
+command (util-linux) before LibreOffice is started and also apply to its child processes.
+"""
+import queue
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from dbcmailmerge.config import RECYCLE_AFTER_DOCUMENTS, RECYCLE_MAX_RSS, WORKER_MEMORY_LIMIT, WORKER_CPU_LIMIT
+from dbcmailmerge.docx2pdfconverter import convert_to, libreoffice_exec, LibreOfficeError
+
+BACKENDS = ("subprocess", "uno")
+
+
+class ConverterPool:
+    """
+    Pool of isolated LibreOffice slots used for converting docx files to PDF. Thread-safe.
+
+    Parameters
+    ----------
+    size : int, optional
+        Number of slots, i.e., the maximum number of conversions running at the same time (default: 1).
+    backend : str, optional
+        One of BACKENDS (default: `subprocess`).
+    profile_root : pathlib.Path or pathlike str or None, optional
+        Directory in which the user profiles of the slots are created (default: None, i.e., a temporary directory
+        which is removed when the pool is closed).
+    timeout : float or None, optional
+        Maximum number of seconds per conversion (default: None).
+    recycle_after, max_rss : int or None, optional
+        See RECYCLE_AFTER_DOCUMENTS and RECYCLE_MAX_RSS in config.py (default: the values of config.py).
+    memory_limit, cpu_limit : int or None, optional
+        See WORKER_MEMORY_LIMIT and WORKER_CPU_LIMIT in config.py (default: the values of config.py).
+
+    Raises
+    ------
+    ValueError
+        If the backend is unknown, the size is smaller than 1, or resource limits are set without `prlimit`.
+    """
+    def __init__(self, size=1, backend="subprocess", profile_root=None, timeout=None,
+                 recycle_after=RECYCLE_AFTER_DOCUMENTS, max_rss=RECYCLE_MAX_RSS, memory_limit=WORKER_MEMORY_LIMIT,
+                 cpu_limit=WORKER_CPU_LIMIT):
+        if backend not in BACKENDS:
+            raise ValueError(f"Unknown conversion backend `{backend}`, use one of {BACKENDS}.")
+        if size < 1:
+            raise ValueError("The pool needs at least one slot.")
+
+        self.size = size
+        self.backend = backend
+        self.timeout = timeout
+        prefix = resource_limit_args(memory_limit, cpu_limit)
+
+        self.__remove_profile_root = profile_root is None
+        self.profile_root = Path(profile_root or tempfile.mkdtemp(prefix="dbcmailmerge_lo_"))
+
+        if backend == "uno":
+            self.__slots = [_UnoSlot(self.profile_root / f"slot_{index}", timeout, prefix, recycle_after, max_rss)
+                            for index in range(size)]
+        else:
+            self.__slots = [_SubprocessSlot(self.profile_root / f"slot_{index}", timeout, prefix)
+                            for index in range(size)]
+
+        # the most recently used slot first, so that the instances of unused slots aren't started (see autotune.py)
+        self.__idle = queue.LifoQueue()
+        for slot in reversed(self.__slots):
+            self.__idle.put(slot)
+
+        self.__warm_up_threads = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @property
+    def restarts(self):
+        """The number of instances, which have been restarted, since they have been recycled or have died."""
+        return sum(slot.restarts for slot in self.__slots)
+
+    def convert(self, folder, source):
+        """
+        Converts the file at `source` to PDF and saves it in `folder`. Blocks until a slot is available.
+
+        Parameters
+        ----------
+        folder : pathlib.Path or pathlike str
+            Directory in which the PDF should be saved.
+        source : pathlib.Path or pathlike str
+            The file that should be converted, e.g. a docx file.
+
+        Returns
+        -------
+        pdf_path : str
+            Filepath of the created PDF.
+
+        Raises
+        ------
+        LibreOfficeError
+            If LibreOffice could not convert the file.
+        """
+        slot = self.__idle.get()
+        try:
+            return slot.convert(folder, source)
+        finally:
+            self.__idle.put(slot)
+
+    def warm_up(self, count=None):
+        """
+        Starts the slots in background threads and returns immediately, see the module docstring.
+
+        Errors during the warm-up are ignored, the slot is started again by its first conversion, which raises the
+        error.
+
+        Parameters
+        ----------
+        count : int or None, optional
+            The number of slots, which should be started, e.g. the active workers of an autotuned run (default: None,
+            i.e., all slots).
+
+        Returns
+        -------
+        None
+        """
+        for index in range(min(count or self.size, self.size)):
+            thread = threading.Thread(target=self.__warm_up_slot, name=f"dbcmailmerge-warm-up-{index}", daemon=True)
+            thread.start()
+            self.__warm_up_threads.append(thread)
+
+    def __warm_up_slot(self):
+        # the slot is taken from the idle slots, so that no conversion uses it while it starts
+        slot = self.__idle.get()
+        try:
+            slot.warm_up()
+        except Exception:
+            pass
+        finally:
+            self.__idle.put(slot)
+
+    def close(self):
+        """Stops all running LibreOffice instances and removes the temporary user profiles."""
+        for thread in self.__warm_up_threads:
+            thread.join()
+
+        for slot in self.__slots:
+            slot.stop()
+
+        if self.__remove_profile_root:
+            shutil.rmtree(self.profile_root, ignore_errors=True)
+
+
+class _SubprocessSlot:
+    """Slot starting one LibreOffice process per conversion, using its own user profile."""
+    WARM_UP_TIMEOUT = 60  # seconds until the warm-up process has to exit
+
+    def __init__(self, profile_dir, timeout, prefix=()):
+        self.profile_dir = Path(profile_dir)
+        self.timeout = timeout
+        self.prefix = prefix
+        self.restarts = 0  # each conversion has its own process
+
+    def convert(self, folder, source):
+        return convert_to(folder, source, self.timeout, user_installation=self.profile_dir.resolve().as_uri(),
+                          prefix=self.prefix)
+
+    def warm_up(self):
+        if self.profile_dir.exists():
+            return
+
+        # creates the user profile and loads LibreOffice into the file system cache
+        args = list(self.prefix) + [libreoffice_exec(), f"-env:UserInstallation={self.profile_dir.resolve().as_uri()}",
+                                    "--headless", "--invisible", "--nologo", "--norestore", "--terminate_after_init"]
+        subprocess.run(args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=self.WARM_UP_TIMEOUT)
+
+    def stop(self):
+        pass
+
+
+class _UnoSlot:
+    """Slot keeping one LibreOffice instance running, which is controlled through the UNO API."""
+    START_UP_TIMEOUT = 60  # seconds until a started instance has to accept connections
+
+    def __init__(self, profile_dir, timeout, prefix=(), recycle_after=None, max_rss=None):
+        self.profile_dir = Path(profile_dir)
+        self.timeout = timeout
+        self.prefix = prefix
+        self.recycle_after = recycle_after
+        self.max_rss = max_rss
+        self.pipe_name = "dbcmailmerge_" + uuid.uuid4().hex
+
+        self.process = None
+        self.desktop = None
+        self.conversions = 0  # of the running instance
+        self.restarts = 0
+
+    def start(self):
+        uno = _import_uno()
+        from com.sun.star.connection import NoConnectException
+
+        args = list(self.prefix) + [libreoffice_exec(), "--headless", "--invisible", "--nologo", "--norestore",
+                                    "--nodefault", f"-env:UserInstallation={self.profile_dir.resolve().as_uri()}",
+                                    f"--accept=pipe,name={self.pipe_name};urp;StarOffice.ComponentContext"]
+        self.process = subprocess.Popen(args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self.conversions = 0
+
+        local_context = uno.getComponentContext()
+        resolver = local_context.ServiceManager.createInstanceWithContext("com.sun.star.bridge.UnoUrlResolver",
+                                                                          local_context)
+
+        # the instance needs a moment until it accepts connections, especially when the profile is created
+        deadline = time.monotonic() + self.START_UP_TIMEOUT
+        while True:
+            try:
+                context = resolver.resolve(f"uno:pipe,name={self.pipe_name};urp;StarOffice.ComponentContext")
+                break
+            except NoConnectException:
+                if self.process.poll() is not None or time.monotonic() > deadline:
+                    self.stop()
+                    raise LibreOfficeError("LibreOffice did not accept connections.")
+                time.sleep(0.25)
+
+        self.desktop = context.ServiceManager.createInstanceWithContext("com.sun.star.frame.Desktop", context)
+
+    def warm_up(self):
+        if self.desktop is None:
+            self.start()
+
+    def convert(self, folder, source):
+        if self.desktop is not None and self.process.poll() is not None:
+            # the instance has died since the last conversion, e.g. it has exceeded a resource limit
+            self.stop()
+            self.restarts += 1
+
+        try:
+            pdf_path = self.__convert(folder, source)
+        except Exception:
+            if not self.__has_died():
+                raise
+            # the instance has died during the conversion, the document is converted by a new instance
+            self.stop()
+            self.restarts += 1
+            pdf_path = self.__convert(folder, source)
+
+        self.conversions += 1
+        if self.__needs_recycling():
+            self.stop()
+            self.restarts += 1
+
+        return pdf_path
+
+    def __has_died(self):
+        # the connection may break shortly before the process has exited
+        if self.process is None:
+            return False
+        try:
+            self.process.wait(timeout=1)
+        except subprocess.TimeoutExpired:
+            return False
+        return True
+
+    def __needs_recycling(self):
+        if self.recycle_after is not None and self.conversions >= self.recycle_after:
+            return True
+        if self.max_rss is not None:
+            rss = process_tree_rss(self.process.pid)
+            return rss is not None and rss > self.max_rss
+        return False
+
+    def __convert(self, folder, source):
+        if self.desktop is None:
+            self.start()
+
+        out_path = Path(folder) / (Path(source).stem + ".pdf")
+
+        document = self.desktop.loadComponentFromURL(Path(source).resolve().as_uri(), "_blank", 0,
+                                                     (_property_value("Hidden", True),))
+        if document is None:
+            raise LibreOfficeError(f"LibreOffice could not load {source}.")
+
+        try:
+            document.storeToURL(out_path.resolve().as_uri(), (_property_value("FilterName", "writer_pdf_Export"),))
+        finally:
+            document.close(True)
+
+        return str(out_path)
+
+    def stop(self):
+        if self.desktop is not None:
+            try:
+                self.desktop.terminate()
+            except Exception:  # the instance is already gone, the connection is closed
+                pass
+            self.desktop = None
+
+        if self.process is not None:
+            try:
+                self.process.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self.process.kill()
+                self.process.wait()
+            self.process = None
+
+
+def resource_limit_args(memory_limit=None, cpu_limit=None):
+    """
+    Returns the prefix of a command, which starts the command with OS resource limits.
+
+    Parameters
+    ----------
+    memory_limit : int or None, optional
+        The maximum virtual memory in MB (default: None, i.e., unlimited).
+    cpu_limit : int or None, optional
+        The maximum CPU time in seconds (default: None, i.e., unlimited).
+
+    Returns
+    -------
+    prefix : list of str
+        Empty, if no limit is set.
+
+    Raises
+    ------
+    ValueError
+        If a limit is set, but the `prlimit` command isn't available (e.g., on Windows).
+    """
+    if memory_limit is None and cpu_limit is None:
+        return []
+
+    prlimit = shutil.which("prlimit")
+    if prlimit is None:
+        raise ValueError("The resource limits of the LibreOffice processes require the `prlimit` command "
+                         "(util-linux).")
+
+    prefix = [prlimit]
+    if memory_limit is not None:
+        prefix.append(f"--as={memory_limit * 1024 ** 2}")
+    if cpu_limit is not None:
+        prefix.append(f"--cpu={cpu_limit}")
+    return prefix + ["--"]
+
+
+def process_tree_rss(pid):
+    """
+    Returns the resident memory of a process and its child processes in MB.
+
+    Parameters
+    ----------
+    pid : int
+
+    Returns
+    -------
+    rss : float or None
+        None if the memory can't be read (neither psutil nor /proc are available, or the process has exited).
+    """
+    try:
+        import psutil
+    except ImportError:
+        pass
+    else:
+        try:
+            process = psutil.Process(pid)
+            processes = [process] + process.children(recursive=True)
+            return sum(process.memory_info().rss for process in processes) / 1024 ** 2
+        except psutil.Error:
+            return None
+
+    rss = 0  # kB
+    pids = [pid]
+    try:
+        while pids:
+            current = pids.pop()
+            with open(f"/proc/{current}/status", encoding="ascii") as status:
+                rss += sum(int(line.split()[1]) for line in status if line.startswith("VmRSS:"))
+            # the children are listed per thread, which has started them
+            for children_file in Path(f"/proc/{current}/task").glob("*/children"):
+                pids += [int(child) for child in children_file.read_text(encoding="ascii").split()]
+    except (OSError, ValueError):
+        return None
+
+    return rss / 1024
+
+
+def _import_uno():
+    try:
+        import uno
+    except ImportError as err:
+        raise ImportError("The `uno` backend requires the python UNO bindings shipped with LibreOffice "
+                          "(e.g., the python3-uno package). Use the `subprocess` backend instead.") from err
+    return uno
+
+
+def _property_value(name, value):
+    from com.sun.star.beans import PropertyValue
+
+    prop = PropertyValue()
+    prop.Name = name
+    prop.Value = value
+    return prop
@@ -18,9 +18,16 @@ import subprocess
 import re
 
 
-def convert_to(folder, source, timeout=None):
+def convert_to(folder, source, timeout=None, user_installation=None, prefix=()):
     args = [libreoffice_exec(), '--headless', '--convert-to', 'pdf', '--outdir', folder, source]
 
+    if user_installation is not None:
+        # file URI of a separate user profile, allows running several instances at the same time
+        args.insert(1, '-env:UserInstallation=' + user_installation)
+
+    # e.g. starts the process with resource limits (see conversion.resource_limit_args)
+    args = list(prefix) + args
+
     process = subprocess.run(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=timeout)
     filename = re.search('-> (.*?) using filter', process.stdout.decode())
 
@@ -0,0 +1,30 @@
+"""
+Author: David Meyer
+
+Description
+-----------
+Contains the helpers prompting the user through tkinter dialogues.
+
+Kept separate from utility.py, so that the non-interactive parts of the package (e.g., cli.py) never import tkinter.
+"""
+from pathlib import Path
+from tkinter import filedialog, Tk
+
+
+def prompt_filepath():
+    """
+    Prompts the user to select a directory and returns its absolute OS-specific filepath as a pathlib.Path object.
+
+    Returns
+    -------
+    hierarchy_root : pathlib.Path
+        Contains an absolute filepath.
+    """
+    # prevent second window pop up when prompting in askdirectory
+    root = Tk()
+    root.withdraw()
+
+    # receive 'root' directory path in which the folder hierarchy should be created,
+    hierarchy_root = Path(filedialog.askdirectory())
+
+    return hierarchy_root
@@ -7,14 +7,31 @@ Contains the main classes and business logic for creating a MailProject and corr
 
 In its current state, the business logic is tied into the classes and should be factored out in a future release
 to make the classes more maintainable and extendable.
+
+The heavy dependencies for creating the documents (docx-mailmerge/lxml, PyPDF2) are imported where they are used, so
+that loading projects or validating settings doesn't pay for their import.
 """
 import os
-from mailmerge import MailMerge
-from PyPDF2 import PdfFileMerger
+import threading
+import time
+from pathlib import Path
+from contextlib import ExitStack
+from concurrent.futures import ThreadPoolExecutor
 from dbcmailmerge.config import (FIELD_MAP_CLIENTS, FIELD_MAP_CLIENTS_REVERSED, FIELD_MAP_PROJECT,
-                                 TEMPLATES, INCLUDE_STANDARDS, CONVERSION_MAP)
-from dbcmailmerge.utility import translate_dict, create_folder_hierarchy, parse_excel
-from dbcmailmerge.docx2pdfconverter import convert_to
+                                 TEMPLATES, INCLUDE_STANDARDS, CONVERSION_MAP, DEFAULT_WORKERS, DEFAULT_BACKEND,
+                                 DEFAULT_ENGINE, DEFAULT_SCHEDULE, REQUIRED_FIELDS)
+from dbcmailmerge.utility import translate_dict, parse_data_source, select_doc_types
+from dbcmailmerge.conversion import ConverterPool
+from dbcmailmerge.cache import DocumentCache
+from dbcmailmerge.assembly import PdfAssembler
+from dbcmailmerge.bundling import StandardsBundler, appends_standards
+from dbcmailmerge.overlay import OverlayEngine
+from dbcmailmerge.output import create_output
+from dbcmailmerge.tracing import trace_span
+from dbcmailmerge.scheduling import schedule_jobs, standard_page_count
+from dbcmailmerge.progress import ProgressTracker
+from dbcmailmerge.validation import ValidationReport, check_required_values, check_filename
+from dbcmailmerge.verification import VERIFIED_FIELDS, ExpectedDocument, template_page_count, verify_documents
 
 
 class MailProject:
@@ -111,15 +128,24 @@ class MailProject:
         # Assumption: two projects are the same if their attributes are the same.
         return vars(self) == vars(other)
 
-    @classmethod
-    def from_excel(cls, project_data_path, project_data_sheet_name, project_field_map):
+    def to_record(self):
         """
-        Factory method to create 1 instance of cls per record of the data source.
+        Returns the project data without the client records, e.g., for sending the project to a worker process.
+
+        Returns
+        -------
+        record : dict
+            The keyword arguments for creating an equal instance, i.e., `MailProject(**project.to_record())`.
+        """
+        record = {key.replace("_MailProject__", ''): value for key, value in vars(self).items()}
+        del record["client_records"]
 
-        This function takes an excel file, processes the records, and the selects only the relevant columns, that are
-        also in the field_map. Since the names of the excel columns might change, but the program level attribute names
-        will stay the same, the map is also used to change the excel column names to the version used internally
-        in the program.
+        return record
+
+    @classmethod
+    def from_excel(cls, project_data_path, project_data_sheet_name, project_field_map, snapshot_cache=None):
+        """
+        Factory method to create 1 instance of cls per record of an excel sheet, see `from_data_source`.
 
         Parameters
         ----------
@@ -129,50 +155,123 @@ class MailProject:
             Filepath to the data source, has to be `.xlsx`.
         project_data_sheet_name : str
             The sheet name, in which the records for the object instantiation are stored.
+        project_field_map : dict
+            A dictionary containing the mapping of excel_column_name to class_attribute_name.
+        snapshot_cache : snapshot.SnapshotCache or None, optional
+            See `from_data_source` (default: None).
+
+        Returns
+        -------
+        instances : list of instances of cls or instance of cls
+            A list containing the created instances, if multiple records are in the data source, otherwise one instance.
+        """
+        return cls.from_data_source(project_data_path, project_data_sheet_name, project_field_map, snapshot_cache,
+                                    data_format="excel")
+
+    @classmethod
+    def from_csv(cls, project_data_path, project_field_map, snapshot_cache=None):
+        """Factory method to create 1 instance of cls per record of a CSV file, see `from_data_source`."""
+        return cls.from_data_source(project_data_path, None, project_field_map, snapshot_cache, data_format="csv")
+
+    @classmethod
+    def from_parquet(cls, project_data_path, project_field_map, snapshot_cache=None):
+        """Factory method to create 1 instance of cls per record of a Parquet file, see `from_data_source`."""
+        return cls.from_data_source(project_data_path, None, project_field_map, snapshot_cache,
+                                    data_format="parquet")
+
+    @classmethod
+    def from_sqlite(cls, project_data_path, project_table_name, project_field_map, snapshot_cache=None):
+        """Factory method to create 1 instance of cls per record of a SQLite table, see `from_data_source`."""
+        return cls.from_data_source(project_data_path, project_table_name, project_field_map, snapshot_cache,
+                                    data_format="sqlite")
+
+    @classmethod
+    def from_data_source(cls, project_data_path, project_data_sheet_name, project_field_map, snapshot_cache=None,
+                         data_format=None):
+        """
+        Factory method to create 1 instance of cls per record of the data source.
+
+        This function takes a data source (excel, CSV, Parquet, or SQLite, see utility.parse_data_source), processes
+        the records, and the selects only the relevant columns, that are also in the field_map. Since the names of the
+        excel columns might change, but the program level attribute names will stay the same, the map is also used to
+        change the excel column names to the version used internally in the program.
+
+        Parameters
+        ----------
+        cls : class
+            Class for instantiating objects per record.
+        project_data_path : pathlib.Path or pathlike str
+            Filepath to the data source, see utility.DATA_SOURCE_FORMATS for the supported suffixes.
+        project_data_sheet_name : str or None
+            The sheet name (excel) or table name (SQLite), in which the records for the object instantiation are
+            stored. Not used for CSV and Parquet files.
         project_field_map : dict
             A dictionary containing the mapping of excel_column_name to class_attribute_name.
             Class attribute names are used consistently throughout the project, however, excel column names might
             change more often. When a change occurs, only the field map in the config file has to be updated.
+        snapshot_cache : snapshot.SnapshotCache or None, optional
+            Loads the records from a snapshot, if the data source hasn't changed since it was stored (default: None,
+            i.e., the data source is always parsed).
+        data_format : str or None, optional
+            The format of the data source, see utility.parse_data_source (default: None, i.e., determined by the
+            suffix of the file).
 
         Returns
         -------
         instances : list of instances of cls or instance of cls
             A list containing the created instances, if multiple records are in the data source, otherwise one instance.
         """
-        # obtain DataFrame with only the columns of field_maps.keys()
-        data = parse_excel(project_data_path, project_data_sheet_name, project_field_map.keys())
+        records = None
+        if snapshot_cache is not None:
+            records = snapshot_cache.load("projects", project_data_path, project_data_sheet_name, project_field_map)
 
-        # Extract one or more records from the data source and instantiate one instance of cls per record
-        instances = []
-        for _, record in data.iterrows():
-            # Convert pandas series to dict for translation of excel column names to the version used internally
-            record = record.to_dict()
-            record = translate_dict(record, project_field_map)
+        if records is None:
+            # obtain DataFrame with only the columns of field_maps.keys()
+            data = parse_data_source(project_data_path, project_data_sheet_name, project_field_map.keys(), data_format)
+
+            records = []
+            for _, record in data.iterrows():
+                # Convert pandas series to dict for translation of excel column names to the version used internally
+                record = record.to_dict()
+                records.append(translate_dict(record, project_field_map))
+
+            if snapshot_cache is not None:
+                snapshot_cache.store("projects", project_data_path, project_data_sheet_name, project_field_map,
+                                     records)
 
-            instances.append(cls(**record))
+        # Instantiate one instance of cls per record
+        instances = [cls(**record) for record in records]
 
-        if len(data) > 1:
+        if len(records) > 1:
             return instances
         else:
             return instances[0]
 
-    def create_client_records(self, client_data_path, client_data_sheet_name, client_field_map):
+    def create_client_records(self, client_data_path, client_data_sheet_name, client_field_map, snapshot_cache=None,
+                              data_format=None):
         """
-        Method to load records into the class instance's client_records attribute based on a provided excel file.
+        Method to load records into the class instance's client_records attribute based on a provided data source.
 
-        Reads an excel file and processes its rows. All processed records are stored as a list of dicts in the
-        instance's client_records attribute.
+        Reads a data source (excel, CSV, Parquet, or SQLite, see utility.parse_data_source) and processes its rows.
+        All processed records are stored as a list of dicts in the instance's client_records attribute.
 
         Parameters
         ----------
         client_data_path : pathlib.Path or pathlike str
-            Filepath to the data source, has to be `.xlsx`.
-        client_data_sheet_name : str
-            The sheet name, in which the records for the object instantiation are stored.
+            Filepath to the data source, see utility.DATA_SOURCE_FORMATS for the supported suffixes.
+        client_data_sheet_name : str or None
+            The sheet name (excel) or table name (SQLite), in which the records for the object instantiation are
+            stored. Not used for CSV and Parquet files.
         client_field_map : dict
             A dictionary containing the mapping of excel_column_name to class_attribute_name.
             Class attribute names are used consistently throughout the project, however, excel column names might
             change more often. When a change occurs, only the field map in the config file has to be updated.
+        snapshot_cache : snapshot.SnapshotCache or None, optional
+            Loads the casted records from a snapshot, if the data source hasn't changed since it was stored
+            (default: None, i.e., the data source is always parsed).
+        data_format : str or None, optional
+            The format of the data source, see utility.parse_data_source (default: None, i.e., determined by the
+            suffix of the file).
 
         Returns
         -------
@@ -183,8 +282,19 @@ class MailProject:
         ValueError
             If the MailProject instance is not empty before calling this method.
         """
+        if self.__client_records:
+            # prevent override of the client_records stored in the MailProject instance.
+            raise ValueError("At least one client has already been added to this project.")
+
+        if snapshot_cache is not None:
+            client_records = snapshot_cache.load("clients", client_data_path, client_data_sheet_name,
+                                                 client_field_map, CONVERSION_MAP.keys())
+            if client_records is not None:
+                self.__client_records = client_records
+                return
+
         # obtain DataFrame with only the columns of field_maps.keys()
-        df = parse_excel(client_data_path, client_data_sheet_name, client_field_map)
+        df = parse_data_source(client_data_path, client_data_sheet_name, client_field_map, data_format)
 
         client_records = []
         for _, record in df.iterrows():
@@ -194,14 +304,13 @@ class MailProject:
 
             client_records.append(record)
 
-        if self.__client_records:
-            # prevent override of the client_records stored in the MailProject instance.
-            raise ValueError("At least one client has already been added to this project.")
-        else:
-            self.__client_records = client_records
-
+        self.__client_records = client_records
         self.__cast_client_records(True)
 
+        if snapshot_cache is not None:
+            snapshot_cache.store("clients", client_data_path, client_data_sheet_name, client_field_map,
+                                 self.__client_records, CONVERSION_MAP.keys())
+
     def __cast_client_records(self, silent=False):
         """
         Converts the instance attributes that are found in the CONVERSION MAP using the functions in the CONVERISON MAP.
@@ -310,7 +419,11 @@ class MailProject:
 
         return project_record
 
-    def create_client_documents(self, selected_clients, hierarchy_root, standard_pdfs):
+    def create_client_documents(self, selected_clients, hierarchy_root, standard_pdfs, progress_callback=None,
+                                workers=DEFAULT_WORKERS, backend=DEFAULT_BACKEND, converter=None, cache=None,
+                                assembler=None, engine=DEFAULT_ENGINE, output=None, profiler=None, tracer=None,
+                                schedule=DEFAULT_SCHEDULE, print_shop=None, doc_types=None, bundler=None,
+                                tuner=None):
         """
         Creates the customized docs, includes the standard pdfs where appropriate and saves the merged file as 1 PDF.
 
@@ -326,11 +439,398 @@ class MailProject:
             (see TEMPLATES.keys()).
         standard_pdfs : list of pathlib.Path or pathlike str
             File paths to the pdfs that should be included in the mail merge.
+        progress_callback : callable or None, optional
+            Called with a progress.ProgressSnapshot whenever a pipeline stage starts or a client is finished
+            (default: None). See progress.ConsoleProgressRenderer for a callback that prints to the console.
+        workers : int, optional
+            Number of clients processed in parallel, each with its own LibreOffice instance
+            (default: config.DEFAULT_WORKERS).
+        backend : str, optional
+            The conversion backend, one of conversion.BACKENDS (default: config.DEFAULT_BACKEND).
+        converter : conversion.ConverterPool or None, optional
+            A running pool that should be used for the conversion, e.g., shared by several projects (default: None,
+            i.e., a pool with `workers` slots and `backend` is started and closed for this call).
+        cache : cache.DocumentCache or None, optional
+            Cache for the templates and standard pdfs, e.g., shared by several projects (default: None, i.e., a new
+            cache is used for this call).
+        assembler : assembly.PdfAssembler or None, optional
+            Merges the pdfs per client and doc type, e.g., configured to compress the output (default: None, i.e.,
+            an assembler without compression using `cache`).
+        engine : str, optional
+            `libreoffice` merges and converts every document, `overlay` writes the values onto templates rendered
+            once per run where possible, see overlay.py (default: config.DEFAULT_ENGINE).
+        output : output.DirectoryOutput or output.ZipOutput or None, optional
+            Stages the intermediate files locally and saves the finished pdfs at `hierarchy_root`, which has to be
+            its destination root (default: None, i.e., the folder hierarchy with the settings of config.py is used
+            for this call, see output.create_output).
+        profiler : profiling.RunProfiler or None, optional
+            Profiles the pipeline stages of each worker (default: None, i.e., no profiling). The caller starts and
+            stops the profiler, which writes the reports.
+        tracer : tracing.TraceRecorder or None, optional
+            Records the formatting and the pipeline stages of each client as spans (default: None, i.e., no tracing).
+            The caller exports the trace, see tracing.py.
+        schedule : str, optional
+            The order in which the pdfs of the clients are created, one of config.SCHEDULES, see scheduling.py
+            (default: config.DEFAULT_SCHEDULE).
+        print_shop : printshop.PrintShop or None, optional
+            Collects the pdfs of the clients without mailing by email into one print file per advisor, which is saved
+            with the other pdfs at the end of the call (default: None, i.e., no print files), see printshop.py.
+        doc_types : list of str or None, optional
+            Only the pdfs of these doc types (keys of TEMPLATES) are created, the existing pdfs of the other doc types
+            are kept (default: None, i.e., all doc types). See utility.select_doc_types for selecting the doc types of
+            changed templates.
+        bundler : bundling.StandardsBundler or None, optional
+            Saves the standard pdfs of the doc types in STANDARDS_BUNDLES once per advisor or run, instead of
+            appending them to each pdf (default: None, i.e., a bundler with the settings of config.py), see
+            bundling.py.
+        tuner : autotune.ConcurrencyTuner or None, optional
+            Adjusts the number of active workers during the call, `workers` is ignored (default: None, i.e., `workers`
+            workers), see autotune.py. A pool started for this call has `tuner.max_workers` slots.
+
+        Returns
+        -------
+        None
+
+        Raises
+        ------
+        ValueError
+            If a doc type is unknown.
+        """
+        type(self).create_batch_documents([(self, selected_clients)], hierarchy_root, standard_pdfs,
+                                          progress_callback=progress_callback, workers=workers, backend=backend,
+                                          converter=converter, cache=cache, assembler=assembler, engine=engine,
+                                          output=output, profiler=profiler, tracer=tracer, schedule=schedule,
+                                          print_shop=print_shop, doc_types=doc_types, bundler=bundler, tuner=tuner)
+
+    @classmethod
+    def create_batch_documents(cls, selections, hierarchy_root, standard_pdfs, progress_callback=None,
+                               workers=DEFAULT_WORKERS, backend=DEFAULT_BACKEND, converter=None, cache=None,
+                               assembler=None, engine=DEFAULT_ENGINE, output=None, profiler=None, tracer=None,
+                               schedule=DEFAULT_SCHEDULE, print_shop=None, doc_types=None, bundler=None, tuner=None):
+        """
+        Creates the documents for the selected clients of several projects in one run.
+
+        All clients of all projects are processed by the same workers, the same converter pool, and the same cache.
+        This way, the LibreOffice instances are only started once and the workers don't run idle at the end of each
+        project. Each pdf (client and doc type) is a job of its own, the jobs are ordered by `schedule`. See
+        `create_client_documents` for the parameters not listed here.
+
+        Parameters
+        ----------
+        selections : list of tuple
+            Contains (MailProject, selected_clients) pairs. selected_clients is the list of client records for which
+            the documents of the project should be created.
 
         Returns
         -------
         None
         """
+        doc_types = select_doc_types(doc_types)
+        if cache is None:
+            cache = DocumentCache()
+        if assembler is None:
+            assembler = PdfAssembler(cache=cache)
+        if bundler is None:
+            bundler = StandardsBundler()
+
+        with ExitStack() as stack:
+            # entered first, so that the finished pdfs are transferred after the converter pool has been closed
+            if output is None:
+                output = stack.enter_context(create_output(hierarchy_root, tracer=tracer))
+
+            jobs = []
+            remaining = {}  # id(client_record): number of jobs of the client, that haven't been finished
+            for project, selected_clients in selections:
+                with trace_span(tracer, "format", project_id=project.project_id, clients=len(selected_clients)):
+                    for client_record in project.__create_merge_records(selected_clients, output):
+                        jobs += [(project, client_record, doc_type) for doc_type in doc_types]
+                        remaining[id(client_record)] = len(doc_types)
+
+            standard_pages = standard_page_count(standard_pdfs, cache) if schedule != "data_source" else 0
+            jobs = schedule_jobs(jobs, schedule, standard_pages)
+
+            if profiler is not None:
+                progress_callback = profiler.callback(progress_callback)
+            if tracer is not None:
+                progress_callback = tracer.callback(progress_callback)
+            tracker = ProgressTracker(len(remaining), progress_callback)
+            remaining_lock = threading.Lock()
+
+            if tuner is not None:
+                workers = tuner.max_workers
+            if converter is None:
+                converter = stack.enter_context(ConverterPool(workers, backend))
+
+            overlay = OverlayEngine(converter, cache) if engine == "overlay" else None
+
+            def process(job):
+                project, client_record, doc_type = job
+                project.__create_document(client_record, doc_type, standard_pdfs, output, tracker, converter, cache,
+                                          assembler, overlay, print_shop, bundler)
+
+                # a client is done, when the pdfs of all its doc types have been created
+                with remaining_lock:
+                    remaining[id(client_record)] -= 1
+                    client_done = not remaining[id(client_record)]
+                if client_done:
+                    tracker.client_done(client_record[FIELD_MAP_CLIENTS_REVERSED["client_id"]])
+
+            if tuner is not None:
+                untuned_process = process
+
+                def process(job):
+                    with tuner.slot():
+                        start = time.monotonic()
+                        untuned_process(job)
+                        tuner.record(time.monotonic() - start)
+
+            if workers == 1:
+                for job in jobs:
+                    process(job)
+            else:
+                # The conversion runs in a separate LibreOffice process per worker, threads are sufficient.
+                with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="dbcmailmerge-worker") as executor:
+                    futures = [executor.submit(process, job) for job in jobs]
+
+                    # re-raise the first error that occurred in one of the workers
+                    for future in futures:
+                        future.result()
+
+            if print_shop is not None:
+                with trace_span(tracer, "print_shop", files=len(print_shop.print_files)):
+                    print_shop.finish(output)
+
+            with trace_span(tracer, "bundle"):
+                bundler.finish(output, standard_pdfs, assembler)
+
+    def validate_client_documents(self, selected_clients, cache=None):
+        """
+        Dry run of `create_client_documents`, which reports the issues of the selected clients and the templates.
+
+        The clients are formatted and merged into the word templates in memory, no files are written and LibreOffice
+        isn't started. See validation.py for the checks.
+
+        Parameters
+        ----------
+        selected_clients : list of dicts
+            A list containing the client_records (dicts) that evaluate to True for the function in selection_criteria.
+        cache : cache.DocumentCache or None, optional
+            Cache for the templates (default: None, i.e., a new cache is used for this call).
+
+        Returns
+        -------
+        report : validation.ValidationReport
+        """
+        return type(self).validate_batch_documents([(self, selected_clients)], cache)
+
+    @classmethod
+    def validate_batch_documents(cls, selections, cache=None):
+        """
+        Dry run of `create_batch_documents`, see `validate_client_documents`.
+
+        Parameters
+        ----------
+        selections : list of tuple
+            Contains (MailProject, selected_clients) pairs.
+        cache : cache.DocumentCache or None, optional
+            Cache for the templates (default: None, i.e., a new cache is used for this call).
+
+        Returns
+        -------
+        report : validation.ValidationReport
+        """
+        from mailmerge import MailMerge
+
+        if cache is None:
+            cache = DocumentCache()
+        report = ValidationReport()
+
+        template_fields = {}
+        for template_paths in TEMPLATES.values():
+            for template_path in template_paths:
+                with MailMerge(cache.template(template_path)) as document:
+                    template_fields[template_path] = document.get_merge_fields()
+
+        unfilled_fields = set()  # (template_path, field), reported once per run
+        documents = {}  # lower-case path of a pdf (network shares are case-insensitive): client_id
+        for project, selected_clients in selections:
+            if not selected_clients:
+                report.add("warning", None, None, f"No clients are selected for project {project.project_id}.")
+
+            project_record = project.__create_project_record()
+            for client_record in selected_clients:
+                report.clients += 1
+                client_id = str(client_record.get("client_id"))
+
+                for field in check_required_values(client_record, REQUIRED_FIELDS):
+                    report.add("error", client_id, None, f"The required field `{field}` is empty.")
+
+                try:
+                    merge_record = project.__create_merge_record(client_record, project_record)
+                except (KeyError, TypeError, ValueError) as err:
+                    report.add("error", client_id, None, f"The client record can't be formatted: {err!r}")
+                    continue
+
+                for doc_type, template_paths in TEMPLATES.items():
+                    report.documents += 1
+
+                    relative_dir, filename = project.__document_path(merge_record, doc_type)
+                    advisor = merge_record[FIELD_MAP_CLIENTS_REVERSED["advisor"]]
+                    invalid_characters = check_filename(advisor) + check_filename(filename)
+                    if invalid_characters:
+                        report.add("error", client_id, doc_type,
+                                   f"The path of the pdf contains the invalid characters `{invalid_characters}`: "
+                                   f"{relative_dir / filename}.pdf")
+
+                    document_key = str(relative_dir / filename).lower()
+                    if document_key in documents:
+                        report.add("error", client_id, doc_type,
+                                   f"{filename}.pdf is also created for client {documents[document_key]} and would "
+                                   f"be overwritten.")
+                    documents.setdefault(document_key, client_id)
+
+                    for template_path in template_paths:
+                        for field in sorted(template_fields[template_path] - merge_record.keys()):
+                            if (template_path, field) not in unfilled_fields:
+                                unfilled_fields.add((template_path, field))
+                                report.add("error", None, doc_type, f"The merge field `{field}` of "
+                                                                    f"{template_path.name} isn't filled by the data.")
+
+                        try:
+                            with MailMerge(cache.template(template_path)) as document:
+                                document.merge(**merge_record)
+                        except (TypeError, ValueError) as err:  # e.g. control characters, which lxml rejects
+                            report.add("error", client_id, doc_type,
+                                       f"The values can't be merged into {template_path.name}: {err!r}")
+
+        return report
+
+    def document_paths(self, selected_clients):
+        """
+        Returns the locations of the pdfs of the selected clients, e.g., for removing the pdfs of a client.
+
+        Parameters
+        ----------
+        selected_clients : list of dicts
+            A list containing the client_records (dicts) that evaluate to True for the function in selection_criteria.
+
+        Returns
+        -------
+        document_paths : list of dicts
+            Contains one dict per client with doc_type, relative_file pairs. The files are relative to the hierarchy
+            root, e.g. `client_correspondence/Betreuer 1/offer_documents/Nr._141_Doe_John_1.pdf`.
+        """
+        project_record = self.__create_project_record()
+
+        document_paths = []
+        for client_record in selected_clients:
+            merge_record = self.__create_merge_record(client_record, project_record)
+
+            paths = {}
+            for doc_type in TEMPLATES.keys():
+                relative_dir, filename = self.__document_path(merge_record, doc_type)
+                paths[doc_type] = relative_dir / (filename + ".pdf")
+            document_paths.append(paths)
+
+        return document_paths
+
+    def verify_client_documents(self, selected_clients, hierarchy_root, standard_pdfs, workers=None, cache=None):
+        """
+        Checks the pdfs created by `create_client_documents` for the selected clients.
+
+        See verification.py for the checks. Only the folder hierarchy can be verified, not zip archives.
+
+        Parameters
+        ----------
+        selected_clients : list of dicts
+            A list containing the client_records (dicts) that evaluate to True for the function in selection_criteria.
+        hierarchy_root : pathlib.Path
+            The location of the TOP_LEVEL_DIR, in which the documents have been saved.
+        standard_pdfs : list of pathlib.Path or pathlike str
+            File paths to the pdfs that have been included in the mail merge.
+        workers : int or None, optional
+            The number of processes (default: None, i.e., one per core).
+        cache : cache.DocumentCache or None, optional
+            Cache for the templates and standard pdfs (default: None, i.e., a new cache is used for this call).
+
+        Returns
+        -------
+        report : validation.ValidationReport
+        """
+        return type(self).verify_batch_documents([(self, selected_clients)], hierarchy_root, standard_pdfs, workers,
+                                                 cache)
+
+    @classmethod
+    def verify_batch_documents(cls, selections, hierarchy_root, standard_pdfs, workers=None, cache=None):
+        """
+        Checks the pdfs created by `create_batch_documents`, see `verify_client_documents`.
+
+        Parameters
+        ----------
+        selections : list of tuple
+            Contains (MailProject, selected_clients) pairs.
+
+        Returns
+        -------
+        report : validation.ValidationReport
+        """
+        from mailmerge import MailMerge
+
+        if cache is None:
+            cache = DocumentCache()
+
+        template_fields = set()
+        customized_pages = {}  # doc_type: pages of the templates, None if unknown
+        for doc_type, template_paths in TEMPLATES.items():
+            for template_path in template_paths:
+                with MailMerge(cache.template(template_path)) as document:
+                    template_fields |= {(doc_type, field) for field in document.get_merge_fields()}
+
+            template_pages = [template_page_count(cache.template(template_path)) for template_path in template_paths]
+            customized_pages[doc_type] = None if None in template_pages else sum(template_pages)
+
+        standard_pages = standard_page_count(standard_pdfs, cache)
+
+        clients = 0
+        expected_documents = []
+        for project, selected_clients in selections:
+            project_record = project.__create_project_record()
+            for client_record in selected_clients:
+                clients += 1
+                merge_record = project.__create_merge_record(client_record, project_record)
+                client_id = merge_record[FIELD_MAP_CLIENTS_REVERSED["client_id"]]
+
+                for doc_type in TEMPLATES.keys():
+                    relative_dir, filename = project.__document_path(merge_record, doc_type)
+                    texts = tuple(merge_record[FIELD_MAP_CLIENTS_REVERSED[field]] for field in VERIFIED_FIELDS
+                                  if (doc_type, FIELD_MAP_CLIENTS_REVERSED[field]) in template_fields)
+                    # e.g. the placeholder of an empty amount
+                    texts = tuple(text for text in texts if any(character.isalnum() for character in text))
+
+                    expected_documents.append(ExpectedDocument(
+                        client_id, doc_type, Path(hierarchy_root) / relative_dir / (filename + ".pdf"),
+                        customized_pages[doc_type], standard_pages if appends_standards(doc_type) else 0, texts))
+
+        report = verify_documents(expected_documents, workers)
+        report.clients = clients
+        return report
+
+    def __create_merge_records(self, selected_clients, output):
+        """
+        Formats and translates the selected client records, adds the project data, and creates the folder hierarchy.
+
+        Parameters
+        ----------
+        selected_clients : list of dicts
+            A list containing the client_records (dicts) that evaluate to True for the function in selection_criteria.
+        output : output.DirectoryOutput
+            Creates the TOP_LEVEL_DIR and the folder hierarchy at its destination.
+
+        Returns
+        -------
+        merge_records : list of dicts
+            One record per client, which can be used for populating the placeholders in the word templates.
+        """
         project_record = self.__create_project_record()
 
         advisors = set()
@@ -339,88 +839,164 @@ class MailProject:
             # add client advisor for creation of sub_directories
             advisors.add(client_record["advisor"])
 
-            # Apply formatting to client record
-            client_record = self.__format_client_records(client_record)
+            merge_records.append(self.__create_merge_record(client_record, project_record))
 
-            # translate client to match placeholders in word
-            client_record = translate_dict(client_record, FIELD_MAP_CLIENTS, reverse=True)
+        # create folder hierarchy for the storage of the created documents
+        sub_directories = [list(advisors), INCLUDE_STANDARDS.keys()]
+        output.create_hierarchy(type(self).TOP_LEVEL_DIR, sub_directories)
 
-            # add project data
-            client_record.update(project_record)
+        return merge_records
 
-            merge_records.append(client_record)
+    def __create_merge_record(self, client_record, project_record):
+        """
+        Formats and translates one client record and adds the project data.
 
-        # create folder hierarchy for the storage of the created documents
-        sub_directories = [list(advisors), INCLUDE_STANDARDS.keys()]
-        create_folder_hierarchy(hierarchy_root, type(self).TOP_LEVEL_DIR, sub_directories)
+        Parameters
+        ----------
+        client_record : dict
+            The selected client record. It is not mutated.
+        project_record : dict
+            The formatted and translated project record, see `__create_project_record`.
+
+        Returns
+        -------
+        merge_record : dict
+            The record, which can be used for populating the placeholders in the word templates.
+        """
+        # Apply formatting to client record
+        client_record = self.__format_client_records(client_record)
+
+        # translate client to match placeholders in word
+        client_record = translate_dict(client_record, FIELD_MAP_CLIENTS, reverse=True)
+
+        # add project data
+        client_record.update(project_record)
+
+        return client_record
+
+    def __document_path(self, client_record, doc_type):
+        """
+        Returns the location of the pdf of a doc type for a client.
 
-        for client_record in merge_records:
-            self.__create_client_document(client_record, standard_pdfs, hierarchy_root)
+        Parameters
+        ----------
+        client_record : dict
+            The merge record of the client, see `__create_merge_record`.
+        doc_type : str
+            One of TEMPLATES.keys().
 
-    def __create_client_document(self, client_record, standard_pdfs, hierarchy_root):
+        Returns
+        -------
+        relative_dir : pathlib.Path
+            The directory of the pdf relative to the destination root (TOP_LEVEL_DIR/advisor/doc_type).
+        filename : str
+            The name of the pdf without the suffix.
+        """
+        # Create path to location where the file should be saved, relative to the destination root
+        relative_dir = (Path(type(self).TOP_LEVEL_DIR)
+                        / client_record[FIELD_MAP_CLIENTS_REVERSED["advisor"]]
+                        / doc_type)
+
+        filename = ("Nr._"
+                    + str(self.project_id)
+                    + '_'
+                    + client_record[FIELD_MAP_CLIENTS_REVERSED["last_name"]]
+                    + '_'
+                    + client_record[FIELD_MAP_CLIENTS_REVERSED["first_name"]]
+                    + '_'
+                    + client_record[FIELD_MAP_CLIENTS_REVERSED["client_id"]]).replace(' ', '_')
+
+        return relative_dir, filename
+
+    def __create_document(self, client_record, doc_type, standard_pdfs, output, tracker, converter, cache, assembler,
+                          overlay, print_shop, bundler):
         """
+        Creates the pdf of one doc type for one client (one job of the run, see scheduling.py).
 
         Parameters
         ----------
         client_record : dict
             The dict represents a client record. A record contains information pertaining to a client,
             e.g., the id, the address, the subscription amount etc.
+        doc_type : str
+            One of TEMPLATES.keys().
         standard_pdfs : list of pathlib.Path or pathlike str
                 File paths to the pdfs that should be included in the mail merge.
-        hierarchy_root : pathlib.Path
-            The location in which the TOP_LEVEL_DIR should be created, which in turn will be used
-            to store all created documents. The files will be saved first by advisor, and within advisor by doc type
+        output : output.DirectoryOutput
+            Provides the local directories for the intermediate files and transfers the merged pdfs to the
+            destination. The files will be saved first by advisor, and within advisor by doc type
             (see TEMPLATES.keys()).
+        tracker : progress.ProgressTracker
+            Receives the start of each pipeline stage.
+        converter : conversion.ConverterPool
+            Used for converting the created docx files to PDF.
+        cache : cache.DocumentCache
+            Provides the templates.
+        assembler : assembly.PdfAssembler
+            Merges the converted pdfs and the standard pdfs into the final pdf.
+        overlay : overlay.OverlayEngine or None
+            Creates the customized pdfs of the templates that allow it without LibreOffice. None if every document
+            should be converted by LibreOffice.
+        print_shop : printshop.PrintShop or None
+            Receives the finished pdf before it is published, if it belongs into a print file.
+        bundler : bundling.StandardsBundler
+            Receives the finished pdf, if the standard pdfs of the doc type are bundled instead of being appended.
 
         Returns
         -------
         None
         """
-        for doc_type in TEMPLATES.keys():
-            created_documents_paths = []
-            for template_path in TEMPLATES[doc_type]:
-                with MailMerge(template_path) as document:
-                    # copy word template and replace placeholders with client instance data and project data
-                    document.merge(**client_record)
+        from mailmerge import MailMerge
+
+        client_id = client_record[FIELD_MAP_CLIENTS_REVERSED["client_id"]]
+        relative_dir, filename = self.__document_path(client_record, doc_type)
 
-                    # Create path to location where the file should be saved
-                    out_path = (hierarchy_root
-                                / type(self).TOP_LEVEL_DIR
-                                / client_record[FIELD_MAP_CLIENTS_REVERSED["advisor"]]
-                                / doc_type)
+        # all intermediate files are written to the local staging directory
+        out_path = output.local_dir(relative_dir)
 
-                    # Name used for saving the file in order to be able to distinguish documents that were
-                    # created based on different templates.
-                    template_name = template_path.parts[-1].replace(".docx", '')
+        created_documents_paths = []
+        for template_path in TEMPLATES[doc_type]:
+            # Name used for saving the file in order to be able to distinguish documents that were
+            # created based on different templates.
+            template_name = template_path.parts[-1].replace(".docx", '')
 
-                    filename = ("Nr._"
-                                + str(self.project_id)
-                                + '_'
-                                + client_record[FIELD_MAP_CLIENTS_REVERSED["last_name"]]
-                                + '_'
-                                + client_record[FIELD_MAP_CLIENTS_REVERSED["first_name"]]
-                                + '_'
-                                + client_record[FIELD_MAP_CLIENTS_REVERSED["client_id"]]).replace(' ', '_')
+            out_path_full = out_path / (filename + '_' + template_name + ".docx")
 
-                    out_path_full = out_path / (filename + '_' + template_name + ".docx")
+            # collect the pdf file path so that they can be removed later on when all pdfs per client are merged
+            created_documents_paths.append(out_path_full.with_suffix('.pdf'))  # replace docx with pdf
 
-                    # TODO Bottleneck here, file is written, read, converted, saved, deleted. Conversion takes long.
+            # write the values onto the pre-rendered template, if the template allows it (see overlay.py)
+            if overlay is not None:
+                tracker.stage(client_id, "stamp")
+                if overlay.render(template_path, client_record, out_path_full.with_suffix('.pdf')):
+                    continue
 
-                    # save document in folder hierarchy as docx
-                    document.write(out_path_full)
+            tracker.stage(client_id, "merge")
+            with MailMerge(cache.template(template_path)) as document:
+                # copy word template and replace placeholders with client instance data and project data
+                document.merge(**client_record)
 
-                    # convert docx to pdf
-                    convert_to(out_path, out_path_full)
+                # TODO Bottleneck here, file is written, read, converted, saved, deleted. Conversion takes long.
 
-                    # delete docx because it is not required for the final output
-                    os.remove(out_path_full)
+                # save document in folder hierarchy as docx
+                document.write(out_path_full)
 
-                    # collect recently created pdf file path so that they can be removed later on when all pdfs
-                    # per client are merged
-                    created_documents_paths.append(out_path_full.with_suffix('.pdf'))  # replace docx with pdf
+            # convert docx to pdf
+            tracker.stage(client_id, "convert")
+            converter.convert(out_path, out_path_full)
 
-            self.__merge_pdfs_and_remove(created_documents_paths, standard_pdfs, out_path, filename,
-                                         INCLUDE_STANDARDS[doc_type])
+            # delete docx because it is not required for the final output
+            os.remove(out_path_full)
+
+        # merge the customized pdfs and, where required, the standard pdfs, and remove the customized pdfs
+        tracker.stage(client_id, "assemble")
+        standards = standard_pdfs if appends_standards(doc_type, bundler.scopes) else []
+        assembler.assemble(created_documents_paths, standards, out_path / (filename + ".pdf"), doc_type=doc_type)
+        if bundler.bundles(doc_type):
+            bundler.add(relative_dir.parent, doc_type, client_id, filename + ".pdf")
+        if print_shop is not None and print_shop.accepts(client_record, doc_type):
+            print_shop.add(output, relative_dir.parent, doc_type, filename, out_path / (filename + ".pdf"))
+        output.publish(relative_dir / (filename + ".pdf"))
 
     def __format_client_records(self, client_record):
         """
@@ -460,49 +1036,3 @@ class MailProject:
 
         client_record = {key: str(value) for key, value in client_record.items()}  # cast to str for MailMerge
         return client_record
-
-    @staticmethod
-    def __merge_pdfs_and_remove(customized_documents_paths, standard_pdfs, out_path, filename, include_standards=False):
-        """
-        Merges the pdfs at the provided filepaths together into one file, and removes the unmerged versions.
-
-        Parameters
-        ----------
-        customized_documents_paths : list
-            Contains the filepaths to the recently created pdfs. Each element represents one pdf. All elements of the
-            list correspond to one specific client. The list is not mutated.
-        standard_pdfs : list of pathlib.Path or pathlike str
-                File paths to the pdfs that should be included in the mail merge.
-        out_path : pathlib.Path
-            Path to the folder where the merged pdfs should be saved.
-        filename : str
-            Name for the to be saved pdf file
-        include_standards : bool, optional
-            Indicates if the standard_pdfs should be included at the end of the customized and merged pdfs.
-            Refer to the docs in config.py for an example.
-        Returns
-        -------
-        None
-        """
-        merger = PdfFileMerger()
-
-        all_documents = customized_documents_paths.copy()
-
-        if include_standards:
-            all_documents.extend(standard_pdfs)
-
-        for document in all_documents:
-            # The reference to the file descriptor is reassigned in each loop, but a reference to each
-            # descriptor is kept in the merger object. The descriptors are closed at the end when
-            # merger.close() is called
-            # See: https://pythonhosted.org/PyPDF2/PdfFileMerger.html
-            in_pdf = open(document, "rb")
-            merger.append(in_pdf)
-
-        with open(out_path / (filename + ".pdf"), "wb") as out_pdf:
-            merger.write(out_pdf)
-            merger.close()  # closes all file descriptors (input and output)
-
-        # delete old in_pdfs
-        for document in customized_documents_paths:
-            os.remove(document)
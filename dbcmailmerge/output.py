@@ -0,0 +1,341 @@
+"""
+Author: David Meyer
+
+Description
+-----------
+Contains the outputs, which separate the intermediate files of a run from its destination.
+
+The destination of the documents is usually a network share, on which every write, rename and delete is a round-trip.
+Therefore, the docx files, the converted pdfs and the assembled pdfs are written to a local staging directory, which
+mirrors the folder hierarchy of the destination. Only the finished pdfs are transferred to the destination:
+    - write-behind (default): a background thread transfers each pdf as soon as it is published, while the workers
+      continue with the next clients,
+    - bulk: all pdfs are transferred when the output is closed.
+
+A pdf is moved with a rename if the staging directory is on the same file system as the destination. Otherwise, it is
+copied to a temporary `.part` file in the target directory, which is renamed afterwards. Either way, readers of the
+destination never see partially written files.
+
+Instead of the folder hierarchy, the ZipOutput streams the finished pdfs into one zip archive per advisor or one per
+run (see OUTPUT_MODES in config.py). Writing one large file sequentially is cheaper for network storage and backup
+systems than writing hundreds of small files. The archives are written as `.part` files and renamed when the output is
+closed.
+
+If a tracing.TraceRecorder is passed, each transfer is recorded as a `write` span of the transferring thread.
+"""
+import os
+import queue
+import shutil
+import zipfile
+import tempfile
+import threading
+from pathlib import Path
+
+from dbcmailmerge.config import STAGING_ROOT, WRITE_BEHIND, DEFAULT_OUTPUT_MODE
+from dbcmailmerge.utility import create_folder_hierarchy
+from dbcmailmerge.tracing import trace_span
+
+COPY_BUFFER_SIZE = 1024 * 1024  # bytes
+
+# number of leading parts of the relative path of a pdf, which determine its archive
+ARCHIVE_DEPTHS = {"zip_per_run": 1, "zip_per_advisor": 2}
+
+
+def create_output(destination_root, output_mode=DEFAULT_OUTPUT_MODE, staging_root=STAGING_ROOT,
+                  write_behind=WRITE_BEHIND, tracer=None):
+    """
+    Creates the output for an output mode.
+
+    Parameters
+    ----------
+    destination_root : pathlib.Path
+        The directory in which the finished files or archives should be saved.
+    output_mode : str, optional
+        One of config.OUTPUT_MODES (default: config.DEFAULT_OUTPUT_MODE).
+    staging_root, write_behind, tracer
+        See DirectoryOutput.
+
+    Returns
+    -------
+    output : DirectoryOutput or ZipOutput
+
+    Raises
+    ------
+    ValueError
+        If the output mode is unknown.
+    """
+    if output_mode == "folders":
+        return DirectoryOutput(destination_root, staging_root, write_behind, tracer)
+    if output_mode in ARCHIVE_DEPTHS:
+        return ZipOutput(destination_root, ARCHIVE_DEPTHS[output_mode], staging_root, write_behind, tracer)
+    raise ValueError(f"Unknown output mode `{output_mode}`")
+
+
+class DirectoryOutput:
+    """
+    Stages the files of a run locally and transfers the finished files to the destination. Thread-safe.
+
+    Use the output as a context manager, so that all published files are transferred and the staging directory is
+    removed at the end of the run.
+
+    Parameters
+    ----------
+    destination_root : pathlib.Path
+        The directory in which the finished files should be saved, e.g., the `hierarchy_root` on a network share.
+    staging_root : pathlib.Path or None, optional
+        Local directory in which a temporary staging directory is created (default: config.STAGING_ROOT).
+    write_behind : bool, optional
+        Transfers the files in a background thread as soon as they are published, instead of all at once when
+        the output is closed (default: config.WRITE_BEHIND).
+    tracer : tracing.TraceRecorder or None, optional
+        Records the transfers as `write` spans (default: None).
+    """
+    def __init__(self, destination_root, staging_root=STAGING_ROOT, write_behind=WRITE_BEHIND, tracer=None):
+        self.destination_root = Path(destination_root)
+        self.staging_dir = Path(tempfile.mkdtemp(prefix="dbcmailmerge_staging_", dir=staging_root))
+        self.write_behind = write_behind
+        self.tracer = tracer
+
+        self.__pending = queue.Queue()
+        self.__errors = []
+        self.__closed = False
+        self.__transferred = 0
+
+        self.__thread = None
+        if write_behind:
+            self.__thread = threading.Thread(target=self.__transfer_pending, name="dbcmailmerge-write-behind",
+                                             daemon=True)
+            self.__thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def transferred(self):
+        """The number of files, that have been transferred to the destination."""
+        return self.__transferred
+
+    def create_hierarchy(self, top_level_dir, sub_directories):
+        """
+        Creates the folder hierarchy for the documents at the destination, see utility.create_folder_hierarchy.
+
+        Returns
+        -------
+        None
+        """
+        create_folder_hierarchy(self.destination_root, top_level_dir, sub_directories)
+
+    def local_dir(self, relative_dir):
+        """
+        Returns the staging directory for `relative_dir` and creates it, if necessary.
+
+        Parameters
+        ----------
+        relative_dir : pathlib.Path or pathlike str
+            The directory relative to the destination root, e.g. `client_correspondence/Betreuer 1/offer_documents`.
+
+        Returns
+        -------
+        local_dir : pathlib.Path
+        """
+        local_dir = self.staging_dir / relative_dir
+        local_dir.mkdir(parents=True, exist_ok=True)
+        return local_dir
+
+    def publish(self, relative_file):
+        """
+        Transfers a finished file from the staging directory to the destination.
+
+        Parameters
+        ----------
+        relative_file : pathlib.Path or pathlike str
+            The file relative to the destination root. It has to be written to the same path relative to the
+            staging directory (see local_dir) before it is published.
+
+        Returns
+        -------
+        None
+
+        Raises
+        ------
+        RuntimeError
+            If the output is closed or a previous transfer failed.
+        """
+        if self.__closed:
+            raise RuntimeError("The output is closed, no more files can be published.")
+        if self.__errors:
+            raise RuntimeError("A previous transfer to the destination failed.") from self.__errors[0]
+
+        self.__pending.put(Path(relative_file))
+
+    def flush(self):
+        """
+        Blocks until the files, that have been published, have been transferred (or their transfer has failed).
+
+        Returns
+        -------
+        None
+        """
+        if self.__thread is not None:
+            self.__pending.join()
+        else:
+            self.__pending.put(None)
+            self.__transfer_pending()
+
+    def close(self):
+        """
+        Transfers the remaining published files and removes the staging directory.
+
+        Returns
+        -------
+        None
+
+        Raises
+        ------
+        Exception
+            The first error that occurred during a transfer, e.g. an OSError. The staging directory is kept in that
+            case, so that the created files are not lost.
+        """
+        if self.__closed:
+            return
+        self.__closed = True
+
+        if self.__thread is not None:
+            self.__pending.put(None)
+            self.__thread.join()
+        else:
+            self.__pending.put(None)
+            self.__transfer_pending()
+
+        try:
+            self._finish()
+        except Exception as err:
+            self.__errors.append(err)
+
+        if self.__errors:
+            raise self.__errors[0]
+
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
+
+    def _transfer(self, relative_file):
+        # called by one thread at a time, see __transfer_pending
+        transfer(self.staging_dir / relative_file, self.destination_root / relative_file)
+
+    def _finish(self):
+        # called after all published files have been transferred
+        pass
+
+    def __transfer_pending(self):
+        while True:
+            relative_file = self.__pending.get()
+            if relative_file is None:
+                self.__pending.task_done()
+                return
+
+            try:
+                with trace_span(self.tracer, "write", file=relative_file.name):
+                    self._transfer(relative_file)
+                self.__transferred += 1
+            except Exception as err:
+                # keeps draining the queue, so that close() doesn't wait for a dead thread and reports the error
+                self.__errors.append(err)
+            finally:
+                self.__pending.task_done()
+
+
+class ZipOutput(DirectoryOutput):
+    """
+    Stages the files of a run locally and streams the finished files into zip archives at the destination.
+
+    The archive of a file is determined by the first `archive_depth` parts of its relative path, the remaining parts
+    are its name in the archive. For example, `client_correspondence/Betreuer 1/offer_documents/Nr._141_Doe.pdf` is
+    stored as `offer_documents/Nr._141_Doe.pdf` in `client_correspondence/Betreuer 1.zip` with depth 2 (per advisor),
+    and as `Betreuer 1/offer_documents/Nr._141_Doe.pdf` in `client_correspondence.zip` with depth 1 (per run).
+
+    Parameters
+    ----------
+    destination_root : pathlib.Path
+        The directory in which the archives should be saved.
+    archive_depth : int, optional
+        See above (default: 2).
+    staging_root, write_behind, tracer
+        See DirectoryOutput.
+    """
+    def __init__(self, destination_root, archive_depth=2, staging_root=STAGING_ROOT, write_behind=WRITE_BEHIND,
+                 tracer=None):
+        self.archive_depth = archive_depth
+        self.__archives = {}
+
+        super().__init__(destination_root, staging_root, write_behind, tracer)
+
+    @property
+    def archive_paths(self):
+        """The filepaths of the archives, that have been created (after the output is closed)."""
+        return sorted(self.__archives)
+
+    def create_hierarchy(self, top_level_dir, sub_directories):
+        """The folder hierarchy is kept in the archives, no folders are created at the destination."""
+        pass
+
+    def _transfer(self, relative_file):
+        parts = Path(relative_file).parts
+        archive_dir = self.destination_root.joinpath(*parts[:self.archive_depth])
+        archive_path = archive_dir.with_name(archive_dir.name + ".zip")  # advisor names may contain dots
+
+        archive = self.__archives.get(archive_path)
+        if archive is None:
+            archive_path.parent.mkdir(parents=True, exist_ok=True)
+            archive = zipfile.ZipFile(_partial(archive_path), "w", compression=zipfile.ZIP_DEFLATED)
+            self.__archives[archive_path] = archive
+
+        staged_file = self.staging_dir / relative_file
+        archive.write(staged_file, arcname='/'.join(parts[self.archive_depth:]))
+        os.remove(staged_file)
+
+    def _finish(self):
+        for archive_path, archive in self.__archives.items():
+            archive.close()
+            os.replace(_partial(archive_path), archive_path)
+
+
+def _partial(path):
+    return path.with_name(path.name + ".part")
+
+
+def transfer(source, target):
+    """
+    Moves `source` to `target` without exposing a partially written `target`.
+
+    Parameters
+    ----------
+    source : pathlib.Path
+        The file in the staging directory.
+    target : pathlib.Path
+        The file at the destination. Its directory is created, if necessary, an existing file is replaced.
+
+    Returns
+    -------
+    None
+    """
+    target.parent.mkdir(parents=True, exist_ok=True)
+
+    try:
+        os.replace(source, target)
+        return
+    except OSError:
+        pass  # different file systems, e.g., a local disk and a network share
+
+    partial_file = _partial(target)
+    try:
+        with open(source, "rb") as src, open(partial_file, "wb") as dst:
+            shutil.copyfileobj(src, dst, COPY_BUFFER_SIZE)
+        os.replace(partial_file, target)
+    except BaseException:
+        if partial_file.exists():
+            os.remove(partial_file)
+        raise
+
+    os.remove(source)
@@ -0,0 +1,613 @@
+"""
+Author: David Meyer
+
+Description
+-----------
+Contains the OverlayEngine, which creates the customized pdfs without a LibreOffice conversion per client.
+
+Each word template is converted to PDF only three times per run:
+    1. with a short marker per merge field, e.g. `ZQX000`,
+    2. with a long marker per merge field, e.g. `ZQX000WWWWWWWWWWWWWWWWWWWW`,
+    3. with empty merge fields.
+The lines containing markers in the first rendering are the lines that are personalized. If all other text is at the
+same position in the three renderings, and the personalized lines start at the same position, the length of the
+values doesn't move the rest of the document (no reflow). In that case, the personalized lines are removed from the
+third rendering, which becomes the base pdf for all clients, and each client's pdf is created by writing the
+personalized lines with the formatted values (see MailProject.__format_client_records) onto the base pdf. Writing text
+onto a page takes milliseconds, compared to seconds for a LibreOffice conversion.
+
+Templates with reflowing fields (e.g., a field inside a paragraph of running text or centered lines), and client
+values whose line breaks differ from the first client's, are not stamped. A personalized line is also not stamped if
+it is wider than the same line in the second rendering (the marker box), since it would run past the margin or over
+other text, e.g. a long street name. For those, `render` returns False and the caller falls back to the regular merge
+and conversion.
+
+The personalized lines are written in Helvetica at the font size of the line, so the font of the template should be a
+similar sans-serif font (e.g., Arial). Characters outside of cp1252 are replaced by `?`.
+
+Locating the markers requires the optional dependency pdfminer.six (`pip install pdfminer.six`).
+"""
+import io
+import re
+import tempfile
+import threading
+from pathlib import Path
+
+from dbcmailmerge.assembly import write_atomic
+
+MARKER_PREFIX = "ZQX"
+MARKER_PADDING = 'W' * 20
+MARKER_PATTERN = re.compile(MARKER_PREFIX + r"(\d{3})W*")
+POSITION_TOLERANCE = 0.5  # points
+
+OVERLAY_FONT_NAME = "/FDbcOverlay"
+
+
+class OverlayEngine:
+    """
+    Personalizes pre-rendered templates by writing the merge values onto the pdf. Thread-safe.
+
+    Parameters
+    ----------
+    converter : conversion.ConverterPool
+        Used for rendering each template once per run.
+    cache : cache.DocumentCache
+        Provides the templates.
+
+    Raises
+    ------
+    ImportError
+        If pdfminer.six is not installed.
+    """
+    def __init__(self, converter, cache):
+        _import_pdfminer()
+
+        self.converter = converter
+        self.cache = cache
+
+        self.__templates = {}
+        self.__locks = {}
+        self.__lock = threading.Lock()
+
+    def render(self, template_path, merge_record, out_file):
+        """
+        Writes the pdf of the template personalized with `merge_record` to `out_file`, if the template allows it.
+
+        The template is prepared on the first call, using `merge_record` to determine which fields end with
+        line breaks.
+
+        Parameters
+        ----------
+        template_path : pathlib.Path
+            Filepath to the word template.
+        merge_record : dict
+            The values for the merge fields of the template (see MailProject.__create_merge_records).
+        out_file : pathlib.Path
+            Filepath of the created pdf.
+
+        Returns
+        -------
+        rendered : bool
+            False if the template or the record can't be stamped, the pdf has to be created by LibreOffice then.
+        """
+        template = self.prepare(template_path, merge_record)
+        if template is None:
+            return False
+        return template.render(merge_record, out_file)
+
+    def prepare(self, template_path, sample_record):
+        """
+        Renders the template and locates its merge fields. Only the first call per template renders.
+
+        Parameters
+        ----------
+        template_path : pathlib.Path
+            Filepath to the word template.
+        sample_record : dict
+            A merge record that is used to determine the line breaks of the merge fields.
+
+        Returns
+        -------
+        template : OverlayTemplate or None
+            None if the fields of the template reflow the text.
+        """
+        key = Path(template_path).resolve()
+
+        with self.__lock:
+            lock = self.__locks.setdefault(key, threading.Lock())
+
+        with lock:
+            if key not in self.__templates:
+                self.__templates[key] = self.__prepare(template_path, sample_record)
+            return self.__templates[key]
+
+    def __prepare(self, template_path, sample_record):
+        with tempfile.TemporaryDirectory(prefix="dbcmailmerge_overlay_") as work_dir:
+            work_dir = Path(work_dir)
+
+            fields = self.__merge_fields(template_path)
+            shapes = {field: newline_shape(str(sample_record.get(field, ''))) for field in fields}
+            if None in shapes.values():
+                return None  # a value with a line break in the middle can't be stamped
+            markers = {field: f"{MARKER_PREFIX}{index:03d}" for index, field in enumerate(sorted(fields))}
+
+            renderings = {}
+            variants = {"short": lambda field: markers[field],
+                        "long": lambda field: markers[field] + MARKER_PADDING,
+                        "base": lambda field: ''}
+            for name, marker in variants.items():
+                values = {field: '\n' * shapes[field][0] + marker(field) + '\n' * shapes[field][1]
+                          for field in fields}
+                renderings[name] = self.__render(template_path, values, work_dir / name)
+
+        lines, _ = find_lines(renderings["short"])
+        baselines = [(page, y) for page, y, _, _, _ in lines]
+
+        # the surrounding text must not move, whatever the length of the values
+        long_lines, _ = find_lines(renderings["long"])
+        if not positions_match([line[:3] for line in lines], [line[:3] for line in long_lines]):
+            return None
+
+        layouts = [text_layout(renderings[name], baselines) for name in variants]
+        if not layouts[0] == layouts[1] == layouts[2]:
+            return None
+
+        base_pdf = remove_lines(renderings["base"], baselines)
+        if base_pdf is None:
+            return None
+
+        index_to_field = {int(marker[len(MARKER_PREFIX):]): field for field, marker in markers.items()}
+        stamped_lines = [(page, x, y, size, split_line(text, index_to_field)) for page, y, x, size, text in lines]
+        max_widths = [end - x if end is not None else None
+                      for (_, _, x, _, _), end in zip(lines, line_ends(renderings["long"], baselines))]
+
+        return OverlayTemplate(base_pdf, stamped_lines, shapes, max_widths)
+
+    def __merge_fields(self, template_path):
+        from mailmerge import MailMerge
+
+        with MailMerge(self.cache.template(template_path)) as document:
+            return document.get_merge_fields()
+
+    def __render(self, template_path, values, work_dir):
+        from mailmerge import MailMerge
+
+        work_dir.mkdir()
+        docx_path = work_dir / Path(template_path).name
+
+        with MailMerge(self.cache.template(template_path)) as document:
+            document.merge(**values)
+            document.write(docx_path)
+
+        pdf_path = self.converter.convert(work_dir, docx_path)
+        return Path(pdf_path).read_bytes()
+
+
+class OverlayTemplate:
+    """
+    A rendered template without its personalized lines and the content of these lines.
+
+    Parameters
+    ----------
+    base_pdf : bytes
+        The rendered template without the personalized lines.
+    lines : list of tuple
+        Contains (page_index, x, y, font_size, parts) per personalized line. x and y are the start of the baseline in
+        pdf points, parts is a list of the literal text (str) and the merge fields ((field,) tuples) of the line.
+    shapes : dict
+        Contains the (leading, trailing) line breaks of each field, see newline_shape.
+    max_widths : list of float or None, optional
+        The maximum width of each line in pdf points, e.g. the width of the line rendered with long markers, None
+        for no limit (default: None, i.e., the widths aren't checked).
+    """
+    def __init__(self, base_pdf, lines, shapes, max_widths=None):
+        self.base_pdf = base_pdf
+        self.lines = lines
+        self.shapes = shapes
+        self.max_widths = max_widths if max_widths is not None else [None] * len(lines)
+
+    def render(self, merge_record, out_file):
+        """
+        Writes the base pdf with the personalized lines filled with the values of `merge_record` to `out_file`.
+
+        Returns
+        -------
+        rendered : bool
+            False if a value has other line breaks than the prepared field or a line is wider than its maximum width,
+            nothing is written in that case.
+        """
+        from PyPDF2 import PdfFileReader, PdfFileWriter
+
+        values = {}
+        for field, shape in self.shapes.items():
+            value = str(merge_record.get(field, ''))
+            if newline_shape(value) != shape:
+                return False
+            values[field] = value.strip('\n')
+
+        line_texts = [''.join(part if isinstance(part, str) else values[part[0]] for part in parts)
+                      for _, _, _, _, parts in self.lines]
+        for (_, _, _, size, _), text, max_width in zip(self.lines, line_texts, self.max_widths):
+            if max_width is not None and text_width(text, size) > max_width + POSITION_TOLERANCE:
+                return False
+
+        # a new reader per client, PyPDF2's writer modifies the objects of the reader
+        reader = PdfFileReader(io.BytesIO(self.base_pdf), strict=False)
+        writer = PdfFileWriter()
+
+        for page_index in range(reader.getNumPages()):
+            page = reader.getPage(page_index)
+
+            texts = []
+            for (line_page, x, y, size, _), text in zip(self.lines, line_texts):
+                if line_page == page_index and text.strip():
+                    texts.append((x, y, size, text))
+
+            if texts:
+                page.mergePage(text_overlay_page(page, texts))
+            writer.addPage(page)
+
+        write_atomic(writer, out_file)
+        return True
+
+
+def newline_shape(value):
+    """
+    Returns the number of leading and trailing line breaks of `value`, or None if it has a line break in between.
+
+    Parameters
+    ----------
+    value : str
+        The formatted value of a merge field.
+
+    Returns
+    -------
+    shape : tuple of int or None
+        (leading, trailing) line breaks.
+    """
+    stripped = value.strip('\n')
+    if '\n' in stripped:
+        return None
+    return len(value) - len(value.lstrip('\n')), len(value) - len(value.rstrip('\n'))
+
+
+def page_characters(pdf_bytes):
+    """
+    Extracts the characters of a pdf in content stream order.
+
+    Parameters
+    ----------
+    pdf_bytes : bytes
+        The pdf.
+
+    Returns
+    -------
+    pages : list of list
+        Contains one list of (character, x, baseline_y, font_size) per page.
+    """
+    from pdfminer.high_level import extract_pages
+    from pdfminer.layout import LTChar
+
+    pages = []
+    for page in extract_pages(io.BytesIO(pdf_bytes), laparams=None):
+        pages.append([(item.get_text()[:1] or ' ', item.matrix[4], item.matrix[5], item.size)
+                      for item in _walk(page) if isinstance(item, LTChar)])
+    return pages
+
+
+def find_lines(pdf_bytes):
+    """
+    Finds the lines containing markers in a rendered template.
+
+    Parameters
+    ----------
+    pdf_bytes : bytes
+        The template rendered with markers.
+
+    Returns
+    -------
+    lines, pages : list of tuple, list of list
+        lines contains (page_index, baseline_y, x, font_size, text) per line with at least one marker, sorted by page
+        and position. pages is the result of page_characters.
+    """
+    pages = page_characters(pdf_bytes)
+
+    lines = []
+    for page_index, chars in enumerate(pages):
+        by_baseline = {}
+        for char in chars:
+            by_baseline.setdefault(round(char[2], 1), []).append(char)
+
+        for baseline, line_chars in by_baseline.items():
+            line_chars.sort(key=lambda char: char[1])
+            text = line_chars[0][0]
+            for previous, char in zip(line_chars, line_chars[1:]):
+                # spaces might be rendered as a gap instead of a glyph
+                gap = char[1] - previous[1]
+                if gap > 1.5 * previous[3] and not text.endswith(' ') and char[0] != ' ':
+                    text += ' '
+                text += char[0]
+
+            if MARKER_PATTERN.search(text):
+                size = max(char[3] for char in line_chars)
+                lines.append((page_index, baseline, line_chars[0][1], size, text.strip()))
+
+    lines.sort(key=lambda line: (line[0], -line[1], line[2]))
+    return lines, pages
+
+
+def line_ends(pdf_bytes, baselines):
+    """
+    Returns the right end of the text on each of the `baselines`.
+
+    Parameters
+    ----------
+    pdf_bytes : bytes
+        The rendered template, e.g. with long markers.
+    baselines : list of tuple
+        Contains (page_index, baseline_y) of the personalized lines.
+
+    Returns
+    -------
+    ends : list of float or None
+        The largest x of a character on each baseline in pdf points, None if there is no character on the baseline.
+    """
+    from pdfminer.high_level import extract_pages
+    from pdfminer.layout import LTChar
+
+    ends = [None] * len(baselines)
+    for page_index, page in enumerate(extract_pages(io.BytesIO(pdf_bytes), laparams=None)):
+        for item in _walk(page):
+            if not isinstance(item, LTChar):
+                continue
+            for index, (line_page, baseline) in enumerate(baselines):
+                if line_page == page_index and abs(item.matrix[5] - baseline) <= POSITION_TOLERANCE:
+                    ends[index] = item.x1 if ends[index] is None else max(ends[index], item.x1)
+    return ends
+
+
+def text_width(text, size):
+    """
+    Returns the width of `text` written in Helvetica at `size`, see text_overlay_page.
+
+    Parameters
+    ----------
+    text : str
+    size : float
+        The font size in points.
+
+    Returns
+    -------
+    width : float
+        The width in pdf points. Characters outside of cp1252 are measured as `?`, as they are written.
+    """
+    from pdfminer.fontmetrics import FONT_METRICS
+
+    _, widths = FONT_METRICS["Helvetica"]
+    written = text.encode("cp1252", errors="replace").decode("cp1252", errors="replace")
+    return sum(widths.get(char, widths['?']) for char in written) * size / 1000
+
+
+def text_layout(pdf_bytes, baselines):
+    """
+    Returns the position of every character, which is not on one of the `baselines`.
+
+    Parameters
+    ----------
+    pdf_bytes : bytes
+        The rendered template.
+    baselines : list of tuple
+        Contains (page_index, baseline_y) of the personalized lines.
+
+    Returns
+    -------
+    layout : list of tuple
+        Contains (page_index, character, x, y) rounded to 0.1 points.
+    """
+    layout = []
+    for page_index, chars in enumerate(page_characters(pdf_bytes)):
+        for text, x, y, _ in chars:
+            if not _on_baseline(page_index, y, baselines):
+                layout.append((page_index, text, round(x, 1), round(y, 1)))
+    return layout
+
+
+def positions_match(positions, other_positions):
+    """Returns True if both lists contain the same (page_index, y, x) positions, see POSITION_TOLERANCE."""
+    if len(positions) != len(other_positions):
+        return False
+
+    for (page, y, x), (other_page, other_y, other_x) in zip(positions, other_positions):
+        if page != other_page or abs(x - other_x) > POSITION_TOLERANCE or abs(y - other_y) > POSITION_TOLERANCE:
+            return False
+
+    return True
+
+
+def split_line(text, index_to_field):
+    """
+    Splits the text of a line into literal text and merge fields.
+
+    Parameters
+    ----------
+    text : str
+        The text of a line rendered with short markers, e.g. `Projekt Nr. ZQX004: ZQX005`.
+    index_to_field : dict
+        Maps the index of a marker to the name of its merge field.
+
+    Returns
+    -------
+    parts : list
+        Contains the literal text as str and the merge fields as (field,) tuples,
+        e.g. ['Projekt Nr. ', ('projektnummer',), ': ', ('projektname',)].
+    """
+    parts = []
+    position = 0
+    for match in MARKER_PATTERN.finditer(text):
+        if match.start() > position:
+            parts.append(text[position:match.start()])
+        parts.append((index_to_field[int(match.group(1))],))
+        position = match.end()
+
+    if position < len(text):
+        parts.append(text[position:])
+    return parts
+
+
+def remove_lines(pdf_bytes, baselines):
+    """
+    Removes the text drawn on the `baselines` from a pdf and verifies that no other text has been removed.
+
+    Parameters
+    ----------
+    pdf_bytes : bytes
+        The rendered template with empty merge fields.
+    baselines : list of tuple
+        Contains (page_index, baseline_y) of the personalized lines.
+
+    Returns
+    -------
+    pdf_bytes : bytes or None
+        The pdf without the lines, None if the lines couldn't be removed exactly, e.g., because the text is drawn in
+        a form XObject.
+    """
+    from PyPDF2 import PdfFileReader, PdfFileWriter
+    from PyPDF2.pdf import ContentStream
+    from PyPDF2.generic import NameObject
+
+    reader = PdfFileReader(io.BytesIO(pdf_bytes), strict=False)
+    writer = PdfFileWriter()
+
+    for page_index in range(reader.getNumPages()):
+        page = reader.getPage(page_index)
+        page_baselines = [y for page_number, y in baselines if page_number == page_index]
+
+        if page_baselines and page.getContents() is not None:
+            content = ContentStream(page.getContents(), reader)
+            content.operations = [operation for operation, y in _text_baselines(content.operations)
+                                  if y is None or not any(abs(y - baseline) <= POSITION_TOLERANCE
+                                                          for baseline in page_baselines)]
+            page[NameObject("/Contents")] = content
+        writer.addPage(page)
+
+    out = io.BytesIO()
+    writer.write(out)
+    cleaned = out.getvalue()
+
+    # nothing may be left on the baselines and all other text has to be unchanged
+    remaining = [(page_index, y) for page_index, chars in enumerate(page_characters(cleaned))
+                 for _, _, y, _ in chars if _on_baseline(page_index, y, baselines)]
+    if remaining or text_layout(cleaned, baselines) != text_layout(pdf_bytes, baselines):
+        return None
+
+    return cleaned
+
+
+def _text_baselines(operations):
+    # yields (operation, baseline_y) of each operation, baseline_y is None for operations not showing text
+    identity = [1, 0, 0, 1, 0, 0]
+    ctm, ctm_stack = identity, []
+    text_matrix = line_matrix = identity
+    leading = 0
+
+    for operands, operator in operations:
+        baseline = None
+
+        if operator == b"q":
+            ctm_stack.append(ctm)
+        elif operator == b"Q":
+            ctm = ctm_stack.pop() if ctm_stack else identity
+        elif operator == b"cm":
+            ctm = _multiply([float(value) for value in operands], ctm)
+        elif operator == b"BT":
+            text_matrix = line_matrix = identity
+        elif operator == b"Tm":
+            text_matrix = line_matrix = [float(value) for value in operands]
+        elif operator in (b"Td", b"TD"):
+            if operator == b"TD":
+                leading = -float(operands[1])
+            text_matrix = line_matrix = _multiply([1, 0, 0, 1, float(operands[0]), float(operands[1])], line_matrix)
+        elif operator == b"TL":
+            leading = float(operands[0])
+        elif operator in (b"T*", b"'", b'"'):
+            text_matrix = line_matrix = _multiply([1, 0, 0, 1, 0, -leading], line_matrix)
+
+        if operator in (b"Tj", b"TJ", b"'", b'"'):
+            baseline = _multiply(text_matrix, ctm)[5]
+
+        yield (operands, operator), baseline
+
+
+def _multiply(first, second):
+    a1, b1, c1, d1, e1, f1 = first
+    a2, b2, c2, d2, e2, f2 = second
+    return [a1 * a2 + b1 * c2, a1 * b2 + b1 * d2,
+            c1 * a2 + d1 * c2, c1 * b2 + d1 * d2,
+            e1 * a2 + f1 * c2 + e2, e1 * b2 + f1 * d2 + f2]
+
+
+def _on_baseline(page_index, y, baselines):
+    return any(page_index == page and abs(y - baseline) <= POSITION_TOLERANCE for page, baseline in baselines)
+
+
+def text_overlay_page(page, texts):
+    """
+    Creates a transparent page of the size of `page` containing the texts.
+
+    Parameters
+    ----------
+    page : PyPDF2.pdf.PageObject
+        The page, which should receive the overlay.
+    texts : list of tuple
+        Contains (x, y, font_size, text) per text.
+
+    Returns
+    -------
+    overlay : PyPDF2.pdf.PageObject
+        The page, which can be merged onto `page` with page.mergePage.
+    """
+    from PyPDF2.pdf import PageObject
+    from PyPDF2.generic import DictionaryObject, NameObject, DecodedStreamObject
+
+    overlay = PageObject.createBlankPage(width=page.mediaBox.getWidth(), height=page.mediaBox.getHeight())
+
+    font = DictionaryObject({NameObject("/Type"): NameObject("/Font"),
+                             NameObject("/Subtype"): NameObject("/Type1"),
+                             NameObject("/BaseFont"): NameObject("/Helvetica"),
+                             NameObject("/Encoding"): NameObject("/WinAnsiEncoding")})
+    overlay[NameObject("/Resources")] = DictionaryObject(
+        {NameObject("/Font"): DictionaryObject({NameObject(OVERLAY_FONT_NAME): font})})
+
+    operations = [b"BT 0 g"]
+    for x, y, size, text in texts:
+        operations.append(f"{OVERLAY_FONT_NAME} {size:.2f} Tf 1 0 0 1 {x:.2f} {y:.2f} Tm".encode("ascii")
+                          + b" (" + _pdf_string(text) + b") Tj")
+    operations.append(b"ET")
+
+    contents = DecodedStreamObject()
+    contents.setData(b"\n".join(operations))
+    overlay[NameObject("/Contents")] = contents
+
+    return overlay
+
+
+def _pdf_string(text):
+    encoded = text.encode("cp1252", errors="replace")
+    return encoded.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+
+
+def _walk(item):
+    # yields the layout objects of a pdfminer page in content stream order
+    for child in item:
+        yield child
+        if hasattr(child, "__iter__"):
+            yield from _walk(child)
+
+
+def _import_pdfminer():
+    try:
+        import pdfminer
+    except ImportError as err:
+        raise ImportError("The overlay engine requires pdfminer.six (pip install pdfminer.six). "
+                          "Use the `libreoffice` engine instead.") from err
+    return pdfminer
@@ -0,0 +1,341 @@
+"""
+Author: David Meyer
+
+Description
+-----------
+Contains the PrintShop, which collects the pdfs of the postal mailings into one print-ready pdf per advisor.
+
+Clients without mailing by email (`mailing_as_email` is false) receive their documents by post. Instead of handing
+hundreds of single pdfs to the print shop, the PrintShop appends the finished pdf of each postal client (for the doc
+types in PRINT_DOC_TYPES, see config.py) to the print file of its advisor, e.g.
+`client_correspondence/Betreuer 1/print_offer_documents.pdf`. Each client gets a bookmark, and with PRINT_DUPLEX each
+client is padded with a blank page to an even number of pages, so that no sheet contains pages of two clients.
+
+The pages are appended while the run continues, as soon as the pdf of a client has been assembled, so the clients are
+in the order in which they have been finished (with one worker, the order of the schedule). Each client pdf is read
+once and its objects are written to the end of the print file in the staging directory of the output right away
+(see _PrintFile), so only the positions of the written objects are kept in memory, not the pages. When the run has
+finished, the page tree, the bookmarks and the cross-reference table are appended, and the print files are
+transferred like the other pdfs (see output.py). Identical streams, e.g. the fonts and images of the standard pdfs,
+are stored once per print file.
+"""
+import io
+import os
+import hashlib
+import threading
+from pathlib import Path
+
+from dbcmailmerge.config import FIELD_MAP_CLIENTS_REVERSED, PRINT_DOC_TYPES, PRINT_DUPLEX
+
+PRINT_FILE_NAME = "print_{doc_type}.pdf"
+
+# values of `mailing_as_email` (as formatted for the merge), which mean that the documents are sent by post
+POSTAL_VALUES = ('', "0", "0.0", "false", "no", "nan", "none")
+
+
+class PrintShop:
+    """
+    Collects the finished pdfs of the postal clients into one print file per advisor and doc type. Thread-safe, one
+    instance is shared by all workers of a run.
+
+    Parameters
+    ----------
+    duplex : bool, optional
+        Pads each client with a blank page to an even number of pages (default: config.PRINT_DUPLEX).
+    doc_types : iterable of str, optional
+        The doc types, which are collected (default: config.PRINT_DOC_TYPES).
+    """
+    def __init__(self, duplex=PRINT_DUPLEX, doc_types=PRINT_DOC_TYPES):
+        self.duplex = duplex
+        self.doc_types = tuple(doc_types)
+
+        self.__lock = threading.Lock()
+        self.__files = {}  # relative path of the print file: _PrintFile
+
+    @property
+    def print_files(self):
+        """Contains relative path, number of clients pairs of the print files, that have been started."""
+        with self.__lock:
+            return {relative_file: print_file.clients for relative_file, print_file in self.__files.items()}
+
+    def accepts(self, merge_record, doc_type):
+        """
+        Returns True, if the pdf of `doc_type` for the client of `merge_record` belongs into a print file.
+
+        Parameters
+        ----------
+        merge_record : dict
+            The merge record of the client (original field names, values formatted as str).
+        doc_type : str
+            One of TEMPLATES.keys().
+
+        Returns
+        -------
+        accepts : bool
+        """
+        return doc_type in self.doc_types and is_postal(merge_record)
+
+    def add(self, output, advisor_dir, doc_type, title, pdf_path):
+        """
+        Appends the pages of a finished client pdf to the print file of its advisor and doc type.
+
+        The pdf is read completely before the method returns, so it can be published (i.e., moved) afterwards.
+
+        Parameters
+        ----------
+        output : output.DirectoryOutput or output.ZipOutput
+            The output of the run, the print file is written to its staging directory.
+        advisor_dir : pathlib.Path or pathlike str
+            The directory of the advisor relative to the destination root, the print file is saved in it.
+        doc_type : str
+            The doc type of the pdf.
+        title : str
+            The title of the bookmark of the client.
+        pdf_path : pathlib.Path or pathlike str
+            Filepath of the finished pdf of the client.
+
+        Returns
+        -------
+        None
+        """
+        from PyPDF2 import PdfFileReader
+
+        relative_file = Path(advisor_dir) / PRINT_FILE_NAME.format(doc_type=doc_type)
+        with self.__lock:
+            print_file = self.__files.get(relative_file)
+            if print_file is None:
+                staged_file = output.local_dir(relative_file.parent) / (relative_file.name + ".part")
+                print_file = self.__files[relative_file] = _PrintFile(staged_file)
+
+        # one file per advisor, the workers of the other advisors aren't blocked
+        with print_file.lock, open(pdf_path, "rb") as pdf_file:
+            print_file.append(PdfFileReader(pdf_file, strict=False), title, self.duplex)
+
+    def finish(self, output):
+        """
+        Writes the print files to the staging directory of `output` and publishes them.
+
+        Parameters
+        ----------
+        output : output.DirectoryOutput or output.ZipOutput
+            The output of the run, which transfers the print files to the destination.
+
+        Returns
+        -------
+        None
+        """
+        with self.__lock:
+            files, self.__files = self.__files, {}
+
+        for relative_file, print_file in files.items():
+            with print_file.lock:
+                print_file.close()
+            os.replace(print_file.path, output.local_dir(relative_file.parent) / relative_file.name)
+            output.publish(relative_file)
+
+
+def is_postal(merge_record):
+    """
+    Returns True, if the documents of the client are sent by post, i.e., `mailing_as_email` is false.
+
+    Parameters
+    ----------
+    merge_record : dict
+        The merge record of the client (original field names, values formatted as str).
+
+    Returns
+    -------
+    is_postal : bool
+    """
+    return str(merge_record[FIELD_MAP_CLIENTS_REVERSED["mailing_as_email"]]).strip().lower() in POSTAL_VALUES
+
+
+class _PrintFile:
+    """
+    A print file, which is written while the clients are appended. Not thread-safe, use `lock`.
+
+    The objects of each client pdf, which are reachable from its pages, are copied to the end of the file with new
+    object numbers, byte-identical streams are written once. Only the offsets of the objects, the page numbers and
+    the bookmarks are kept until `close` writes the page tree, the bookmarks and the cross-reference table.
+
+    Parameters
+    ----------
+    path : pathlib.Path
+        The file, which is created.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.clients = 0
+        self.lock = threading.Lock()
+
+        self.__file = open(path, "wb")
+        self.__file.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        self.__offsets = []  # object number - 1: offset in the file, None while reserved
+        self.__streams = {}  # sha256 of a written stream: object number
+        self.__pages = []  # object numbers of the pages
+        self.__bookmarks = []  # (title, object number of the first page of the client)
+        self.__media_box = None  # of the last page, used for the blank pages
+        self.__pages_number = self.__reserve()
+
+    def append(self, reader, title, duplex):
+        """
+        Appends the pages of a client pdf and a bookmark to the file.
+
+        Parameters
+        ----------
+        reader : PyPDF2.PdfFileReader
+            The pdf of the client, it isn't referenced after the method has returned.
+        title : str
+            The title of the bookmark.
+        duplex : bool
+            Appends a blank page, if the pdf has an odd number of pages.
+
+        Returns
+        -------
+        None
+        """
+        from PyPDF2.generic import DictionaryObject, NameObject, IndirectObject
+
+        pages = [reader.getPage(page_number) for page_number in range(reader.getNumPages())]
+
+        # references to the pages, e.g. of links, point to the copied pages
+        numbers = {}
+        for page in pages:
+            number = self.__reserve()
+            if getattr(page, "indirectRef", None) is not None:
+                numbers[(page.indirectRef.idnum, page.indirectRef.generation)] = number
+            self.__pages.append(number)
+
+        for page, number in zip(pages, self.__pages[-len(pages):]):
+            copied = DictionaryObject({key: self.__copy(value, numbers) for key, value in page.items()
+                                       if key != "/Parent"})
+            copied[NameObject("/Parent")] = IndirectObject(self.__pages_number, 0, None)
+            self.__write(number, copied)
+            self.__media_box = copied.get("/MediaBox", self.__media_box)
+
+        if pages:
+            self.__bookmarks.append((title, self.__pages[-len(pages)]))
+        if duplex and len(pages) % 2:
+            self.__append_blank_page()
+
+        self.clients += 1
+
+    def close(self):
+        """Writes the page tree, the bookmarks, the catalog, and the cross-reference table, and closes the file."""
+        from PyPDF2.generic import (DictionaryObject, ArrayObject, NameObject, NumberObject, IndirectObject,
+                                    TextStringObject, createStringObject)
+
+        def reference(number):
+            return IndirectObject(number, 0, None)
+
+        self.__write(self.__pages_number, DictionaryObject({
+            NameObject("/Type"): NameObject("/Pages"),
+            NameObject("/Kids"): ArrayObject(reference(number) for number in self.__pages),
+            NameObject("/Count"): NumberObject(len(self.__pages))}))
+
+        outlines_number = self.__reserve()
+        bookmark_numbers = [self.__reserve() for _ in self.__bookmarks]
+        for index, ((title, page_number), number) in enumerate(zip(self.__bookmarks, bookmark_numbers)):
+            bookmark = DictionaryObject({
+                NameObject("/Title"): createStringObject(title) if title else TextStringObject(''),
+                NameObject("/Parent"): reference(outlines_number),
+                NameObject("/Dest"): ArrayObject([reference(page_number), NameObject("/Fit")])})
+            if index > 0:
+                bookmark[NameObject("/Prev")] = reference(bookmark_numbers[index - 1])
+            if index < len(bookmark_numbers) - 1:
+                bookmark[NameObject("/Next")] = reference(bookmark_numbers[index + 1])
+            self.__write(number, bookmark)
+
+        outlines = DictionaryObject({NameObject("/Type"): NameObject("/Outlines"),
+                                     NameObject("/Count"): NumberObject(len(bookmark_numbers))})
+        if bookmark_numbers:
+            outlines[NameObject("/First")] = reference(bookmark_numbers[0])
+            outlines[NameObject("/Last")] = reference(bookmark_numbers[-1])
+        self.__write(outlines_number, outlines)
+
+        # show the bookmarks of the clients when the file is opened
+        catalog_number = self.__reserve()
+        self.__write(catalog_number, DictionaryObject({NameObject("/Type"): NameObject("/Catalog"),
+                                                       NameObject("/Pages"): reference(self.__pages_number),
+                                                       NameObject("/Outlines"): reference(outlines_number),
+                                                       NameObject("/PageMode"): NameObject("/UseOutlines")}))
+
+        xref_offset = self.__file.tell()
+        self.__file.write(f"xref\n0 {len(self.__offsets) + 1}\n0000000000 65535 f \n".encode("ascii"))
+        for offset in self.__offsets:
+            self.__file.write(f"{offset:010d} 00000 n \n".encode("ascii"))
+        trailer = DictionaryObject({NameObject("/Size"): NumberObject(len(self.__offsets) + 1),
+                                    NameObject("/Root"): reference(catalog_number)})
+        self.__file.write(b"trailer\n")
+        trailer.writeToStream(self.__file, None)
+        self.__file.write(f"\nstartxref\n{xref_offset}\n%%EOF\n".encode("ascii"))
+        self.__file.close()
+
+    def __append_blank_page(self):
+        from PyPDF2.generic import DictionaryObject, NameObject, IndirectObject
+
+        # same size as the last page of the client
+        number = self.__reserve()
+        self.__write(number, DictionaryObject({NameObject("/Type"): NameObject("/Page"),
+                                               NameObject("/Parent"): IndirectObject(self.__pages_number, 0, None),
+                                               NameObject("/MediaBox"): self.__media_box,
+                                               NameObject("/Resources"): DictionaryObject()}))
+        self.__pages.append(number)
+
+    def __copy(self, value, numbers):
+        # copies a value of the client pdf, the referenced objects are written to the file first
+        from PyPDF2.generic import DictionaryObject, ArrayObject, IndirectObject, StreamObject
+
+        if isinstance(value, IndirectObject):
+            key = (value.idnum, value.generation)
+            if key not in numbers:
+                target = value.getObject()
+                if isinstance(target, StreamObject):
+                    numbers[key] = None  # in progress, see below
+                    self.__copy_stream(target, key, numbers)
+                else:
+                    numbers[key] = self.__reserve()
+                    self.__write(numbers[key], self.__copy(target, numbers))
+            if numbers[key] is None:
+                numbers[key] = self.__reserve()  # a stream, which references itself
+            return IndirectObject(numbers[key], 0, None)
+
+        if isinstance(value, StreamObject):
+            raise ValueError("Streams have to be indirect objects.")
+        if isinstance(value, DictionaryObject):
+            return DictionaryObject({key: self.__copy(item, numbers) for key, item in value.items()})
+        if isinstance(value, ArrayObject):
+            return ArrayObject(self.__copy(item, numbers) for item in value)
+        return value
+
+    def __copy_stream(self, stream, key, numbers):
+        copied = type(stream)()
+        copied._data = stream._data
+        copied.update({name: self.__copy(item, numbers) for name, item in stream.items()})
+
+        data = io.BytesIO()
+        copied.writeToStream(data, None)
+        data = data.getvalue()
+
+        if numbers[key] is not None:
+            self.__write(numbers[key], data)  # referenced by itself, can't be shared
+            return
+
+        digest = hashlib.sha256(data).digest()
+        if digest not in self.__streams:
+            self.__streams[digest] = self.__reserve()
+            self.__write(self.__streams[digest], data)
+        numbers[key] = self.__streams[digest]
+
+    def __reserve(self):
+        self.__offsets.append(None)
+        return len(self.__offsets)
+
+    def __write(self, number, value):
+        self.__offsets[number - 1] = self.__file.tell()
+        self.__file.write(f"{number} 0 obj\n".encode("ascii"))
+        if isinstance(value, bytes):
+            self.__file.write(value)
+        else:
+            value.writeToStream(self.__file, None)
+        self.__file.write(b"\nendobj\n")
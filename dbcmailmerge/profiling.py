@@ -0,0 +1,330 @@
+"""
+Author: David Meyer
+
+Description
+-----------
+Contains the RunProfiler, which profiles a document run per pipeline stage and per worker.
+
+The workers report the start of each pipeline stage (`merge`, `convert`, `assemble`, ...) to the ProgressTracker. The
+profiler is used as (or wraps) the progress callback and switches the cProfile profiler of the reporting thread to
+the profiler of the new stage. This way, each worker thread has one profiler per stage, and the time spent in
+docx-mailmerge/lxml, PyPDF2, pandas, and the conversion subprocess can be attributed to the stages and workers. The
+thread, which starts the profiler, is profiled as the stage `main` outside of the pipeline stages (e.g., while the
+data source is loaded).
+
+When the profiler is stopped, the following files are written to its output directory:
+    - `stage_<stage>.prof` per stage (all workers), `worker_<thread>.prof` per thread (all stages), and `total.prof`,
+      which can be inspected with pstats, snakeviz, etc.,
+    - `report.txt` containing the wall time per stage, the time per package, and the most expensive functions per
+      stage.
+If memory profiling is enabled, tracemalloc traces the allocations, and the report contains the peak memory and the
+largest allocation sites of the largest memory sample (taken at the stage boundaries).
+
+Tracing slows a run down considerably, so only use the profiler to investigate slow runs. On Python 3.12 and later,
+only one cProfile profiler can be active at a time. Stages of other threads that start while a stage is profiled are
+only timed, they are marked as `partially profiled` in the report.
+"""
+import io
+import re
+import time
+import pstats
+import cProfile
+import threading
+import tracemalloc
+from pathlib import Path
+from collections import defaultdict
+
+TOP_FUNCTIONS = 25
+MEMORY_FRAMES = 10  # frames stored per allocation by tracemalloc
+MEMORY_SAMPLE_GROWTH = 1.1  # a new memory sample is taken, if the traced memory grew by 10% since the last sample
+
+# a function belongs to the first package, whose name is part of its filename (or description for C functions)
+PACKAGE_GROUPS = (("mailmerge", "docx-mailmerge"),
+                  ("lxml", "lxml"),
+                  ("PyPDF2", "PyPDF2"),
+                  ("pdfminer", "pdfminer"),
+                  ("pandas", "pandas"),
+                  ("numpy", "numpy"),
+                  ("openpyxl", "openpyxl"),
+                  ("xlrd", "xlrd"),
+                  ("subprocess", "conversion subprocess"),
+                  ("uno", "LibreOffice (uno)"),
+                  ("dbcmailmerge", "dbcmailmerge"))
+
+
+def default_profile_dir(output_root):
+    """Returns the directory for the reports of a run started now, `<output_root>/profile_<yyyymmdd_hhmmss>`."""
+    return Path(output_root) / time.strftime("profile_%Y%m%d_%H%M%S")
+
+
+class RunProfiler:
+    """
+    Profiles a document run per pipeline stage and per worker thread. Thread-safe.
+
+    Use the profiler as a context manager and pass `callback()` as the progress callback of the run, see
+    MailProject.create_batch_documents.
+
+    Parameters
+    ----------
+    out_dir : pathlib.Path or pathlike str
+        The directory for the reports, created if necessary.
+    memory : bool, optional
+        Traces the memory allocations with tracemalloc (default: False).
+    top : int, optional
+        Number of functions listed per stage in the report (default: TOP_FUNCTIONS).
+    """
+    def __init__(self, out_dir, memory=False, top=TOP_FUNCTIONS):
+        self.out_dir = Path(out_dir)
+        self.memory = memory
+        self.top = top
+
+        self.__profiles = {}  # (thread_name, stage): cProfile.Profile
+        self.__wall_times = defaultdict(float)  # stage: seconds, summed over all threads
+        self.__calls = defaultdict(int)  # stage: number of times the stage has been started
+        self.__unprofiled = set()  # stages, which couldn't be profiled every time
+        self.__memory_sample = None
+        self.__memory_sample_size = 0
+        self.__memory_peak = 0
+
+        self.__local = threading.local()
+        self.__lock = threading.Lock()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def start(self):
+        """Starts profiling the calling thread as the stage `main` (and tracing the memory, if enabled)."""
+        if self.memory:
+            tracemalloc.start(MEMORY_FRAMES)
+
+        self.__local.base_stage = "main"
+        self.switch("main")
+
+    def stop(self):
+        """
+        Stops profiling and writes the reports, see the module docstring.
+
+        Returns
+        -------
+        report_path : pathlib.Path
+            The filepath of `report.txt`.
+        """
+        self.switch(None)
+
+        if self.memory:
+            self.__sample_memory()
+            self.__memory_peak = max(self.__memory_peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.stop()
+
+        return self.write_reports()
+
+    def callback(self, progress_callback=None):
+        """
+        Returns a progress callback, which switches the profiler of the reporting thread to the reported stage.
+
+        Parameters
+        ----------
+        progress_callback : callable or None, optional
+            Receives the snapshots after the switch, e.g., a progress.ConsoleProgressRenderer (default: None).
+
+        Returns
+        -------
+        callback : callable
+            The callback for the progress.ProgressTracker of the run.
+        """
+        def switch_and_forward(snapshot):
+            if snapshot.stage == "done":
+                # between two clients, the thread is profiled as its base stage (`main` or not at all)
+                self.switch(getattr(self.__local, "base_stage", None))
+            elif snapshot.stage is not None:
+                self.switch(snapshot.stage)
+
+            if progress_callback is not None:
+                progress_callback(snapshot)
+
+        return switch_and_forward
+
+    def switch(self, stage):
+        """
+        Stops profiling the current stage of the calling thread and starts profiling `stage`.
+
+        Parameters
+        ----------
+        stage : str or None
+            The name of the stage, None stops profiling the calling thread.
+
+        Returns
+        -------
+        None
+        """
+        now = time.perf_counter()
+
+        current = getattr(self.__local, "current", None)
+        if current is not None:
+            current_stage, profile, started = current
+            if profile is not None:
+                profile.disable()
+            with self.__lock:
+                self.__wall_times[current_stage] += now - started
+        self.__local.current = None
+
+        if stage is None:
+            return
+
+        if self.memory:
+            self.__sample_memory()
+
+        key = (threading.current_thread().name, stage)
+        with self.__lock:
+            profile = self.__profiles.setdefault(key, cProfile.Profile())
+            self.__calls[stage] += 1
+
+        try:
+            profile.enable()
+        except ValueError:
+            # another profiler is active, see the module docstring
+            profile = None
+            with self.__lock:
+                self.__unprofiled.add(stage)
+
+        self.__local.current = (stage, profile, time.perf_counter())
+
+    def write_reports(self):
+        """
+        Writes the `.prof` files and `report.txt` to the output directory. Called by `stop`.
+
+        Returns
+        -------
+        report_path : pathlib.Path
+        """
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+
+        with self.__lock:
+            profiles = dict(self.__profiles)
+
+        by_stage = defaultdict(list)
+        by_thread = defaultdict(list)
+        for (thread_name, stage), profile in profiles.items():
+            by_stage[stage].append(profile)
+            by_thread[thread_name].append(profile)
+
+        stage_stats = {stage: _merge_stats(stage_profiles) for stage, stage_profiles in by_stage.items()}
+        for stage, stats in stage_stats.items():
+            if stats is not None:
+                stats.dump_stats(self.out_dir / f"stage_{_file_name(stage)}.prof")
+        for thread_name, thread_profiles in by_thread.items():
+            stats = _merge_stats(thread_profiles)
+            if stats is not None:
+                stats.dump_stats(self.out_dir / f"worker_{_file_name(thread_name)}.prof")
+        total = _merge_stats(list(profiles.values()))
+        if total is not None:
+            total.dump_stats(self.out_dir / "total.prof")
+
+        report_path = self.out_dir / "report.txt"
+        report_path.write_text(self.format_report(stage_stats, total), encoding="utf-8")
+        return report_path
+
+    def format_report(self, stage_stats, total):
+        """Formats the text report from the merged pstats.Stats per stage and of all stages (None if empty)."""
+        lines = ["Wall time per stage (summed over all workers)",
+                 f"{'stage':<16}{'calls':>8}{'seconds':>12}"]
+        for stage, seconds in sorted(self.__wall_times.items(), key=lambda item: -item[1]):
+            note = "  (partially profiled)" if stage in self.__unprofiled else ''
+            lines.append(f"{stage:<16}{self.__calls[stage]:>8}{seconds:>12.2f}{note}")
+
+        if total is not None:
+            lines += ['', "Own time per package (all stages, C functions are attributed to their caller)",
+                      f"{'package':<24}{'seconds':>12}"]
+            for package, seconds in sorted(package_times(total).items(), key=lambda item: -item[1]):
+                lines.append(f"{package:<24}{seconds:>12.2f}")
+
+        for stage, stats in sorted(stage_stats.items()):
+            if stats is None:
+                continue
+            stream = io.StringIO()
+            stats.stream = stream
+            stats.sort_stats("cumulative").print_stats(self.top)
+            lines += ['', f"== {stage}: top {self.top} functions by cumulative time ==", stream.getvalue().strip()]
+
+        if self.memory:
+            lines += ['', f"Peak traced memory: {self.__memory_peak / 2 ** 20:.1f} MiB"]
+            if self.__memory_sample is not None:
+                lines.append(f"Largest allocation sites at the largest sample "
+                             f"({self.__memory_sample_size / 2 ** 20:.1f} MiB):")
+                for statistic in self.__memory_sample.statistics("lineno")[:self.top]:
+                    lines.append(f"    {statistic}")
+
+        return '\n'.join(lines) + '\n'
+
+    def __sample_memory(self):
+        current, peak = tracemalloc.get_traced_memory()
+
+        with self.__lock:
+            self.__memory_peak = max(self.__memory_peak, peak)
+            if current <= self.__memory_sample_size * MEMORY_SAMPLE_GROWTH:
+                return
+            self.__memory_sample_size = current
+
+        sample = tracemalloc.take_snapshot()
+        with self.__lock:
+            self.__memory_sample = sample
+
+
+def package_times(stats):
+    """
+    Sums the own time of the functions in `stats` per package, see PACKAGE_GROUPS.
+
+    Parameters
+    ----------
+    stats : pstats.Stats
+        The profile.
+
+    Returns
+    -------
+    times : dict
+        package: seconds. Functions of other packages are summed as `other`.
+    """
+    times = defaultdict(float)
+
+    for (filename, _, function_name), (_, _, own_time, _, callers) in stats.stats.items():
+        package = _package(filename + ' ' + function_name)
+
+        # C functions, e.g. waiting for the conversion subprocess, belong to the package of their main caller
+        if package is None and filename == '~' and callers:
+            caller = max(callers.items(), key=lambda item: item[1][3])[0]
+            package = _package(caller[0] + ' ' + caller[2])
+
+        times[package or "other"] += own_time
+
+    return dict(times)
+
+
+def _package(description):
+    for needle, package in PACKAGE_GROUPS:
+        if needle in description:
+            return package
+    return None
+
+
+def _merge_stats(profiles):
+    profiles = [profile for profile in profiles if _has_stats(profile)]
+    if not profiles:
+        return None
+
+    stats = pstats.Stats(profiles[0])
+    for profile in profiles[1:]:
+        stats.add(profile)
+    return stats
+
+
+def _has_stats(profile):
+    profile.create_stats()
+    return bool(profile.stats)
+
+
+def _file_name(name):
+    return re.sub(r"[^\w.-]", '_', name)
@@ -0,0 +1,209 @@
+"""
+Author: David Meyer
+
+Description
+-----------
+Contains the progress reporting used while the documents of a MailProject are created.
+
+`MailProject.create_client_documents` reports every pipeline stage and every finished client to a ProgressTracker.
+The tracker computes the number of finished clients, a moving-average throughput, and an ETA, and forwards a
+ProgressSnapshot to a user-provided callback. ConsoleProgressRenderer is such a callback and is used by run.py.
+
+The tracker is thread-safe, so it can be shared by all workers of a parallel run as well as used by the sequential
+path.
+"""
+import sys
+import time
+import threading
+from collections import deque, namedtuple
+
+# Snapshot of the state of a run, passed to the progress callback on every update
+# done : int, number of clients for which all documents have been created
+# total : int, number of clients selected for the run
+# client_id : str or None, the client the update refers to
+# stage : str or None, the pipeline stage that has been started, e.g. `merge`, `convert`, `assemble`, or `done`
+# throughput : float or None, clients per second (moving average over the last completions)
+# eta : float or None, estimated seconds until the run is finished
+# elapsed : float, seconds since the start of the run
+# idle : float, seconds since the last client has been finished (or since the start), helps to spot stalls
+ProgressSnapshot = namedtuple("ProgressSnapshot", ["done", "total", "client_id", "stage", "throughput", "eta",
+                                                   "elapsed", "idle"])
+
+
+class ProgressTracker:
+    """
+    Tracks the progress of a document run and forwards snapshots to a callback.
+
+    Parameters
+    ----------
+    total : int
+        Number of clients for which documents will be created.
+    callback : callable or None, optional
+        Called with a ProgressSnapshot each time a stage starts or a client is finished (default: None, i.e.,
+        progress is tracked but not reported).
+    window : int, optional
+        Number of the most recent client completions used for the moving-average throughput (default: 10).
+    clock : callable, optional
+        Returns the current time in seconds (default: time.monotonic). Mainly used for testing.
+    """
+    def __init__(self, total, callback=None, window=10, clock=time.monotonic):
+        self.total = total
+        self.callback = callback
+        self.clock = clock
+
+        self.__done = 0
+        self.__start = clock()
+        self.__last_completion = self.__start
+        self.__completions = deque([self.__start], maxlen=window + 1)
+        self.__lock = threading.Lock()
+
+    @property
+    def done(self):
+        return self.__done
+
+    def stage(self, client_id, stage):
+        """
+        Reports that the pipeline stage `stage` has been started for the client with `client_id`.
+
+        Parameters
+        ----------
+        client_id : str
+            The id of the client which is processed.
+        stage : str
+            Name of the stage, e.g., `merge`, `convert`, or `assemble`.
+
+        Returns
+        -------
+        None
+        """
+        with self.__lock:
+            snapshot = self.__snapshot(client_id, stage)
+        self.__notify(snapshot)
+
+    def client_done(self, client_id):
+        """
+        Reports that all documents for the client with `client_id` have been created.
+
+        Parameters
+        ----------
+        client_id : str
+            The id of the finished client.
+
+        Returns
+        -------
+        None
+        """
+        with self.__lock:
+            now = self.clock()
+            self.__done += 1
+            self.__last_completion = now
+            self.__completions.append(now)
+            snapshot = self.__snapshot(client_id, "done", now)
+        self.__notify(snapshot)
+
+    def snapshot(self):
+        """Returns the current ProgressSnapshot without notifying the callback."""
+        with self.__lock:
+            return self.__snapshot(None, None)
+
+    def __snapshot(self, client_id, stage, now=None):
+        # Needs to be called while holding the lock
+        if now is None:
+            now = self.clock()
+
+        # moving average over the most recent completions, the start of the run counts as the first data point
+        throughput = None
+        span = self.__completions[-1] - self.__completions[0]
+        if len(self.__completions) > 1 and span > 0:
+            throughput = (len(self.__completions) - 1) / span
+
+        eta = None
+        if throughput:
+            eta = (self.total - self.__done) / throughput
+
+        return ProgressSnapshot(self.__done, self.total, client_id, stage, throughput, eta,
+                                now - self.__start, now - self.__last_completion)
+
+    def __notify(self, snapshot):
+        if self.callback is not None:
+            self.callback(snapshot)
+
+
+class ConsoleProgressRenderer:
+    """
+    Callback for ProgressTracker, which renders the progress of a run as a single, updating line in the console.
+
+    Parameters
+    ----------
+    stream : file-like object, optional
+        Where the progress line is written to (default: sys.stdout).
+    stall_after : float, optional
+        Number of seconds without a finished client after which the line is marked as stalled (default: 120).
+    """
+    def __init__(self, stream=None, stall_after=120):
+        self.stream = stream if stream is not None else sys.stdout
+        self.stall_after = stall_after
+        self.__width = 0
+
+    def __call__(self, snapshot):
+        line = self.format(snapshot)
+
+        # pad with whitespace to overwrite leftovers of a previous, longer line
+        padding = ' ' * max(self.__width - len(line), 0)
+        self.__width = len(line)
+
+        end = '\n' if snapshot.done == snapshot.total and snapshot.stage == "done" else ''
+        self.stream.write('\r' + line + padding + end)
+        self.stream.flush()
+
+    def format(self, snapshot):
+        """
+        Formats a ProgressSnapshot as a single line.
+
+        Parameters
+        ----------
+        snapshot : ProgressSnapshot
+            The snapshot to be formatted.
+
+        Returns
+        -------
+        line : str
+            For example, `12/150 clients | convert client 17 | 0.45 clients/s | ETA 05:07 | elapsed 00:27`
+        """
+        parts = [f"{snapshot.done}/{snapshot.total} clients"]
+
+        if snapshot.stage and snapshot.stage != "done":
+            parts.append(f"{snapshot.stage} client {snapshot.client_id}")
+
+        if snapshot.throughput:
+            parts.append(f"{snapshot.throughput:.2f} clients/s")
+            parts.append(f"ETA {format_duration(snapshot.eta)}")
+
+        parts.append(f"elapsed {format_duration(snapshot.elapsed)}")
+
+        if snapshot.idle >= self.stall_after and snapshot.done < snapshot.total:
+            parts.append(f"STALLED? no client finished for {format_duration(snapshot.idle)}")
+
+        return " | ".join(parts)
+
+
+def format_duration(seconds):
+    """
+    Formats a duration in seconds as `mm:ss` or `h:mm:ss` for durations of one hour or longer.
+
+    Parameters
+    ----------
+    seconds : float
+        The duration in seconds.
+
+    Returns
+    -------
+    duration : str
+        The formatted duration, e.g. `05:07` or `1:02:03`.
+    """
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes:02d}:{seconds:02d}"
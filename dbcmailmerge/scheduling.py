@@ -0,0 +1,117 @@
+"""
+Author: David Meyer
+
+Description
+-----------
+Contains the scheduling of the document jobs of a run.
+
+A job creates the pdf of one doc type for one client (see MailProject.create_batch_documents). The workers take the
+jobs in the order of the schedule (see SCHEDULES in config.py):
+    - `data_source`: in the order of the data source, client by client (the default),
+    - `advisor`: advisor by advisor, starting with the advisor with the least work, and client by client per advisor.
+      The folders of the advisors are finished one after another, so the advisors can start reviewing their documents
+      while the run continues.
+The jobs of a client always stay together, so the clients are finished steadily during the run (see progress.py).
+
+The cost of a job is estimated from its doc type (see estimate_cost): each template is merged and converted, and the
+pages of the standard pdfs are appended, if the doc type includes them and doesn't bundle them (see
+INCLUDE_STANDARDS and bundling.py). Since every client of a run receives the same doc types, the cost of all clients
+is the same; ordering the clients by their cost (longest first) wouldn't change the order.
+"""
+from collections import defaultdict
+
+from dbcmailmerge.config import TEMPLATES, FIELD_MAP_CLIENTS_REVERSED
+from dbcmailmerge.bundling import appends_standards
+
+TEMPLATE_COST = 1.0  # relative cost of merging and converting a template
+PAGE_COST = 0.02  # relative cost of appending one page of a standard pdf
+
+
+def standard_page_count(standard_pdfs, cache):
+    """
+    Returns the number of pages of the standard pdfs.
+
+    Parameters
+    ----------
+    standard_pdfs : list of pathlib.Path or pathlike str
+        File paths to the standard pdfs.
+    cache : cache.DocumentCache
+        Provides the standard pdfs.
+
+    Returns
+    -------
+    pages : int
+    """
+    from PyPDF2 import PdfFileReader
+
+    return sum(PdfFileReader(cache.standard_pdf(pdf_path), strict=False).getNumPages() for pdf_path in standard_pdfs)
+
+
+def estimate_cost(doc_type, standard_pages):
+    """
+    Estimates the relative cost of creating the pdf of a doc type for one client.
+
+    Parameters
+    ----------
+    doc_type : str
+        One of TEMPLATES.keys().
+    standard_pages : int
+        The number of pages of the standard pdfs, see standard_page_count.
+
+    Returns
+    -------
+    cost : float
+        TEMPLATE_COST per template and PAGE_COST per appended page.
+    """
+    cost = len(TEMPLATES[doc_type]) * TEMPLATE_COST
+    if appends_standards(doc_type):
+        cost += standard_pages * PAGE_COST
+
+    return cost
+
+
+def schedule_jobs(jobs, schedule, standard_pages=0):
+    """
+    Orders the jobs of a run according to a schedule, see the module docstring.
+
+    Parameters
+    ----------
+    jobs : list of tuple
+        Contains one (MailProject, merge_record, doc_type) triple per job, in the order of the data source.
+    schedule : str
+        One of config.SCHEDULES.
+    standard_pages : int, optional
+        The number of pages of the standard pdfs, see standard_page_count (default: 0).
+
+    Returns
+    -------
+    jobs : list of tuple
+        The jobs in the order in which they should be processed.
+
+    Raises
+    ------
+    ValueError
+        If the schedule is unknown.
+    """
+    if schedule == "data_source":
+        return list(jobs)
+
+    if schedule == "advisor":
+        advisor_costs = defaultdict(float)
+        first_jobs = {}
+        for index, (_, merge_record, doc_type) in enumerate(jobs):
+            advisor = _advisor(merge_record)
+            advisor_costs[advisor] += estimate_cost(doc_type, standard_pages)
+            first_jobs.setdefault(advisor, index)
+
+        # advisors with the same amount of work in the order of the data source, the jobs of one advisor stay together
+        # in the order of the data source
+        order = sorted(range(len(jobs)), key=lambda index: (advisor_costs[_advisor(jobs[index][1])],
+                                                            first_jobs[_advisor(jobs[index][1])], index))
+        return [jobs[index] for index in order]
+
+    raise ValueError(f"Unknown schedule `{schedule}`")
+
+
+def _advisor(merge_record):
+    return merge_record[FIELD_MAP_CLIENTS_REVERSED["advisor"]]
@@ -0,0 +1,378 @@
+"""
+Author: David Meyer
+
+Description
+-----------
+Contains the job service, a local HTTP server that creates the documents of the runs submitted by several operators.
+
+Every run of the command line interface starts a new interpreter, imports pandas, starts LibreOffice, and reads the
+templates and standard pdfs again, which takes longer than creating the documents of a small run. The service is
+started once (`python -m dbcmailmerge.service`) and keeps a warm converter pool and the template/standard pdf cache
+(see cache.DocumentCache) for all jobs. The cache is renewed when a template or a standard pdf has changed.
+
+A job contains the settings of one run as JSON, with the keys of a section of the config file (see cli.py), e.g.
+
+    {"name": "project_141", "data_source": "/srv/data/q4.xlsx", "project_sheet": "project_data",
+     "client_sheet": "client_data", "output_root": "/srv/mailings", "filters": ["amount"],
+     "standard_pdfs": ["/srv/data/pib.pdf", "/srv/data/factsheet.pdf"]}
+
+Relative paths are resolved relative to the working directory of the service. `workers` and `backend` are set by the
+service, and the watch mode isn't supported. The jobs are queued and executed one after the other, each job uses all
+workers of the pool. The service provides the endpoints
+    - POST /jobs: submits a job, returns its status (202) or the invalid setting (400),
+    - GET /jobs: the status of all jobs, GET /jobs/<id>: the status of one job (state, progress, error),
+    - GET /metrics: the number of jobs per state, the processed clients, the busy time, and the cached files.
+
+The service listens on SERVICE_HOST:SERVICE_PORT (see config.py). It has no authentication and by default only
+accepts local connections.
+"""
+import sys
+import json
+import time
+import queue
+import argparse
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+from dbcmailmerge.config import (TEMPLATES, DEFAULT_WORKERS, DEFAULT_BACKEND, SERVICE_HOST, SERVICE_PORT,
+                                 SERVICE_HISTORY)
+from dbcmailmerge.cache import DocumentCache
+from dbcmailmerge.cli import PATH_SETTINGS, ConfigError, resolve_run, execute_run
+from dbcmailmerge.conversion import BACKENDS, ConverterPool
+from dbcmailmerge.validation import ValidationError
+from dbcmailmerge.watch import file_state
+
+JOB_STATES = ("queued", "running", "finished", "failed")
+LIST_SETTINGS = ("filters", "doc_types", "templates", "client_ids")
+
+
+class Job:
+    """
+    A submitted run and its status.
+
+    Attributes
+    ----------
+    job_id : str
+    run : dict
+        The settings of the run, see cli.resolve_runs.
+    state : str
+        One of JOB_STATES.
+    progress : progress.ProgressSnapshot or None
+        The last progress of the running job.
+    clients : int or None
+        The number of processed clients of the finished job.
+    error, report : str or None
+        The error of the failed job, and the report, if the dry run or the verification found errors.
+    """
+    def __init__(self, job_id, run):
+        self.job_id = job_id
+        self.run = run
+        self.state = "queued"
+        self.submitted = datetime.now()
+        self.started = None
+        self.finished = None
+        self.progress = None
+        self.clients = None
+        self.error = None
+        self.report = None
+
+    def status(self):
+        """Returns the status as a JSON serializable dict."""
+        status = {"id": self.job_id, "name": self.run["name"], "state": self.state}
+        for key in ("submitted", "started", "finished"):
+            timestamp = getattr(self, key)
+            status[key] = timestamp.isoformat(timespec="seconds") if timestamp is not None else None
+        if self.progress is not None:
+            status.update(done=self.progress.done, total=self.progress.total, eta=self.progress.eta)
+        status.update(clients=self.clients, error=self.error, report=self.report)
+        return status
+
+
+class JobService:
+    """
+    Executes the submitted jobs one after the other with a shared converter pool and cache, see the module docstring.
+
+    Parameters
+    ----------
+    workers : int, optional
+        The number of parallel workers and LibreOffice instances (default: config.DEFAULT_WORKERS).
+    backend : str, optional
+        The conversion backend, see conversion.ConverterPool (default: config.DEFAULT_BACKEND).
+    history : int, optional
+        The number of finished jobs, whose status is kept (default: config.SERVICE_HISTORY).
+    """
+    def __init__(self, workers=DEFAULT_WORKERS, backend=DEFAULT_BACKEND, history=SERVICE_HISTORY):
+        self.workers = workers
+        self.backend = backend
+        self.history = history
+
+        self.__converter = ConverterPool(workers, backend)
+        self.__cache = DocumentCache()
+        self.__cached_files = {}
+
+        self.__jobs = OrderedDict()
+        self.__queue = queue.Queue()
+        self.__lock = threading.Lock()
+        self.__next_id = 1
+        self.__runner = threading.Thread(target=self.__run_jobs, name="dbcmailmerge-service", daemon=True)
+
+        self.__start = time.monotonic()
+        self.__clients = 0
+        self.__busy = 0.0
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def start(self):
+        """Starts LibreOffice in the background and the execution of the jobs."""
+        self.__converter.warm_up()
+        self.__runner.start()
+
+    def close(self):
+        """Finishes the running job, fails the queued jobs, and stops the converter pool."""
+        while True:
+            try:
+                job = self.__queue.get_nowait()
+            except queue.Empty:
+                break
+            if job is not None:
+                with self.__lock:
+                    job.state, job.finished, job.error = "failed", datetime.now(), "The service has been stopped."
+        self.__queue.put(None)
+        if self.__runner.is_alive():
+            self.__runner.join()
+        self.__converter.close()
+
+    def submit(self, settings):
+        """
+        Checks the settings of a run and queues it.
+
+        Parameters
+        ----------
+        settings : dict
+            The settings of the run, see the module docstring.
+
+        Returns
+        -------
+        status : dict
+            The status of the queued job, see Job.status.
+
+        Raises
+        ------
+        cli.ConfigError
+            If a setting is missing or invalid.
+        """
+        if not isinstance(settings, dict):
+            raise ConfigError("The job has to be a JSON object containing the settings of the run.")
+
+        with self.__lock:
+            job_id = str(self.__next_id)
+            self.__next_id += 1
+
+        run = {"name": f"job {job_id}"}
+        for key, value in settings.items():
+            if key in PATH_SETTINGS:
+                run[key] = Path(value).resolve() if value is not None else None
+            elif key == "standard_pdfs":
+                run[key] = [Path(path).resolve() for path in _as_list(value)]
+            elif key in LIST_SETTINGS:
+                run[key] = [str(item) for item in _as_list(value)]
+            else:
+                run[key] = value
+        run.update(workers=self.workers, backend=self.backend)
+
+        run = resolve_run(run)
+        if run["watch"]:
+            raise ConfigError(f"Run `{run['name']}` can't be watched by the service")
+
+        job = Job(job_id, run)
+        with self.__lock:
+            self.__jobs[job_id] = job
+        self.__queue.put(job)
+
+        return job.status()
+
+    def status(self, job_id):
+        """Returns the status of a job (see Job.status), None if the job doesn't exist."""
+        with self.__lock:
+            job = self.__jobs.get(job_id)
+            return job.status() if job is not None else None
+
+    def jobs(self):
+        """Returns the status of all jobs in the order of submission."""
+        with self.__lock:
+            return [job.status() for job in self.__jobs.values()]
+
+    def metrics(self):
+        """
+        Returns the metrics of the service.
+
+        Returns
+        -------
+        metrics : dict
+            Contains the `uptime` and the `busy` seconds (executing jobs), the number of `jobs` per state (of the kept
+            jobs), the number of processed `clients`, the number of `cached_files`, `workers`, and `backend`.
+        """
+        with self.__lock:
+            jobs = {state: 0 for state in JOB_STATES}
+            for job in self.__jobs.values():
+                jobs[job.state] += 1
+            return {"uptime": time.monotonic() - self.__start, "busy": self.__busy, "jobs": jobs,
+                    "clients": self.__clients, "cached_files": len(self.__cache), "workers": self.workers,
+                    "backend": self.backend}
+
+    def __run_jobs(self):
+        while True:
+            job = self.__queue.get()
+            if job is None:
+                return
+            self.__run_job(job)
+
+    def __run_job(self, job):
+        with self.__lock:
+            job.state, job.started = "running", datetime.now()
+        start = time.monotonic()
+
+        def progress_callback(snapshot):
+            job.progress = snapshot
+
+        state = "failed"
+        try:
+            selections = execute_run(job.run, progress_callback, self.__converter, self.__current_cache(job.run))
+        except ValidationError as err:
+            job.error, job.report = str(err), err.report.format()
+        except Exception as err:
+            job.error = repr(err)
+        else:
+            state = "finished"
+            job.clients = sum(len(selected_clients) for _, selected_clients in selections)
+
+        with self.__lock:
+            job.state, job.finished = state, datetime.now()
+            self.__busy += time.monotonic() - start
+            self.__clients += job.clients or 0
+
+            done = [job_id for job_id, kept_job in self.__jobs.items() if kept_job.finished is not None]
+            for job_id in done[:max(0, len(done) - self.history)]:
+                del self.__jobs[job_id]
+
+    def __current_cache(self, run):
+        """Returns the cache, a new one if one of the cached templates or standard pdfs has changed."""
+        paths = [template_path for template_paths in TEMPLATES.values() for template_path in template_paths]
+        files = file_state(paths + list(run["standard_pdfs"]))
+        if any(self.__cached_files.get(path, state) != state for path, state in files.items()):
+            self.__cache = DocumentCache()
+            self.__cached_files = {}
+        self.__cached_files.update(files)
+        return self.__cache
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    """Maps the endpoints to the JobService of the server, see the module docstring."""
+    def do_GET(self):
+        service = self.server.service
+        parts = self.path.strip('/').split('/')
+
+        if parts == ["jobs"]:
+            self.__respond(HTTPStatus.OK, service.jobs())
+        elif len(parts) == 2 and parts[0] == "jobs":
+            status = service.status(parts[1])
+            if status is None:
+                self.__respond(HTTPStatus.NOT_FOUND, {"error": f"The job {parts[1]} doesn't exist."})
+            else:
+                self.__respond(HTTPStatus.OK, status)
+        elif parts == ["metrics"]:
+            self.__respond(HTTPStatus.OK, service.metrics())
+        else:
+            self.__respond(HTTPStatus.NOT_FOUND, {"error": f"Unknown endpoint {self.path}"})
+
+    def do_POST(self):
+        if self.path.strip('/') != "jobs":
+            self.__respond(HTTPStatus.NOT_FOUND, {"error": f"Unknown endpoint {self.path}"})
+            return
+
+        try:
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            status = self.server.service.submit(json.loads(body or b"null"))
+        except (ValueError, TypeError, ConfigError) as err:  # json.JSONDecodeError is a ValueError
+            self.__respond(HTTPStatus.BAD_REQUEST, {"error": str(err)})
+        else:
+            self.__respond(HTTPStatus.ACCEPTED, status)
+
+    def __respond(self, status, data):
+        body = json.dumps(data).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def create_server(service, host=SERVICE_HOST, port=SERVICE_PORT):
+    """
+    Creates the HTTP server of a started JobService. Port 0 selects a free port (see `server.server_address`).
+
+    Returns
+    -------
+    server : http.server.ThreadingHTTPServer
+        Handles each request in a thread, call `serve_forever` to start it.
+    """
+    server = ThreadingHTTPServer((host, port), _RequestHandler)
+    server.service = service
+    return server
+
+
+def main(argv=None):
+    """
+    Entry point of the service, `python -m dbcmailmerge.service`.
+
+    Parameters
+    ----------
+    argv : list of str or None, optional
+        The command line arguments without the program name (default: None, i.e., sys.argv[1:]).
+
+    Returns
+    -------
+    exit_code : int
+    """
+    parser = argparse.ArgumentParser(prog="python -m dbcmailmerge.service",
+                                     description="Creates the documents of the submitted jobs with a warm converter "
+                                                 "pool and cache.")
+    parser.add_argument("--host", default=SERVICE_HOST, help=f"address to listen on (default: {SERVICE_HOST})")
+    parser.add_argument("--port", type=int, default=SERVICE_PORT, help=f"port to listen on (default: {SERVICE_PORT})")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help=f"number of parallel workers (default: {DEFAULT_WORKERS})")
+    parser.add_argument("--backend", choices=BACKENDS, default=DEFAULT_BACKEND,
+                        help=f"conversion backend (default: {DEFAULT_BACKEND})")
+    args = parser.parse_args(argv)
+
+    with JobService(args.workers, args.backend) as service:
+        server = create_server(service, args.host, args.port)
+        print(f"Listening on http://{args.host}:{server.server_address[1]}", file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+
+    return 0
+
+
+def _as_list(value):
+    """Returns the items of a JSON list, or of a string separated by commas or whitespace (as in the config file)."""
+    if isinstance(value, str):
+        return value.replace(',', ' ').split()
+    return list(value or [])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
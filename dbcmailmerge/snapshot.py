@@ -0,0 +1,136 @@
+"""
+Author: David Meyer
+
+Description
+-----------
+Contains the SnapshotCache, which stores the parsed records of a data source, so that an unchanged workbook doesn't
+have to be parsed again.
+
+Reading an xlsx file with pandas is by far the slowest step of loading a project. The cache stores the records after
+parsing, date formatting, translation, and casting (see CONVERSION_MAP) as a pickle file per workbook, sheet, and field
+map. A snapshot is only used if the content of the workbook (sha256), the sheet name, the field map, and the casted
+fields are the same as when it was stored. Changing the workbook therefore never returns outdated records.
+
+The cache is opt-in: pass a SnapshotCache to MailProject.from_excel/create_client_records, or use the `--snapshot-dir`
+option of the command line interface. Only use directories for the cache, to which no one else can write, since
+pickle files can execute code when they are loaded.
+"""
+import os
+import pickle
+import hashlib
+import threading
+from pathlib import Path
+
+# increase if the format of the stored records changes, so that old snapshots are ignored
+SNAPSHOT_VERSION = 1
+
+HASH_CHUNK_SIZE = 1024 * 1024  # bytes
+
+
+class SnapshotCache:
+    """
+    Stores and loads the records of data sources. Thread-safe.
+
+    Parameters
+    ----------
+    cache_dir : pathlib.Path or pathlike str
+        The directory for the snapshots, created if necessary.
+    """
+    def __init__(self, cache_dir):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+        self.hits = 0
+        self.misses = 0
+
+        self.__file_hashes = {}
+        self.__lock = threading.Lock()
+
+    def load(self, kind, data_path, sheet_name, field_map, casted_fields=()):
+        """
+        Returns the stored records of a sheet, if the snapshot is up to date.
+
+        Parameters
+        ----------
+        kind : str
+            The kind of records, e.g. `projects` or `clients`.
+        data_path : pathlib.Path or pathlike str
+            Filepath to the data source.
+        sheet_name : str
+            The sheet name of the records.
+        field_map : dict
+            The field map used for selecting and translating the columns.
+        casted_fields : iterable of str, optional
+            The fields that have been casted, e.g. CONVERSION_MAP.keys() (default: ()).
+
+        Returns
+        -------
+        records : list of dict or None
+            None if there is no snapshot for the current workbook and settings.
+        """
+        snapshot_path = self.__snapshot_path(kind, data_path, sheet_name, field_map, casted_fields)
+
+        try:
+            with open(snapshot_path, "rb") as snapshot:
+                records = pickle.load(snapshot)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            with self.__lock:
+                self.misses += 1
+            return None
+
+        with self.__lock:
+            self.hits += 1
+        return records
+
+    def store(self, kind, data_path, sheet_name, field_map, records, casted_fields=()):
+        """
+        Stores the records of a sheet. See `load` for the parameters.
+
+        Returns
+        -------
+        snapshot_path : pathlib.Path
+            The filepath of the snapshot.
+        """
+        snapshot_path = self.__snapshot_path(kind, data_path, sheet_name, field_map, casted_fields)
+        partial_path = snapshot_path.with_name(f"{snapshot_path.name}.{threading.get_ident()}.part")
+
+        with open(partial_path, "wb") as snapshot:
+            pickle.dump(records, snapshot, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(partial_path, snapshot_path)
+
+        return snapshot_path
+
+    def file_hash(self, data_path):
+        """
+        Returns the sha256 of the content of a file. Only hashes the file again, if its size or mtime changed.
+
+        Parameters
+        ----------
+        data_path : pathlib.Path or pathlike str
+            Filepath to the data source.
+
+        Returns
+        -------
+        digest : str
+        """
+        data_path = Path(data_path).resolve()
+        stat = data_path.stat()
+        stamp = (data_path, stat.st_size, stat.st_mtime_ns)
+
+        with self.__lock:
+            if stamp in self.__file_hashes:
+                return self.__file_hashes[stamp]
+
+        digest = hashlib.sha256()
+        with open(data_path, "rb") as data_file:
+            for chunk in iter(lambda: data_file.read(HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+
+        with self.__lock:
+            self.__file_hashes[stamp] = digest.hexdigest()
+        return digest.hexdigest()
+
+    def __snapshot_path(self, kind, data_path, sheet_name, field_map, casted_fields):
+        settings = repr((SNAPSHOT_VERSION, kind, sheet_name, sorted(field_map.items()), sorted(casted_fields)))
+        key = hashlib.sha256((self.file_hash(data_path) + settings).encode()).hexdigest()
+        return self.cache_dir / f"{kind}_{key[:32]}.pickle"
@@ -0,0 +1,179 @@
+"""
+Author: David Meyer
+
+Description
+-----------
+Contains the TraceRecorder, which records the timeline of a document run and exports it in the Chrome trace event
+format.
+
+Each span covers one stage of one client (or of the run) on one thread:
+    - `load`: loading the data source (batch mode),
+    - `format`: formatting the client records of a project,
+    - `stamp`, `merge`, `convert`, `assemble`: the pipeline stages per client (see MailProject.__create_document),
+      `convert` includes waiting for a free LibreOffice instance,
+    - `write`: transferring a finished pdf to the destination (see output.py).
+The pipeline stages are recorded from the progress updates, like the profiler in profiling.py, the other spans are
+recorded where they happen.
+
+The exported file can be opened in chrome://tracing, https://ui.perfetto.dev, or speedscope. Each worker thread is
+shown as its own track, so idle gaps and waits on LibreOffice or on the disk are visible in the timeline.
+"""
+import os
+import json
+import time
+import threading
+from pathlib import Path
+from contextlib import contextmanager, nullcontext
+
+TRACE_CATEGORY = "dbcmailmerge"
+
+
+def default_trace_file(output_root):
+    """Returns the filepath for the trace of a run started now, `<output_root>/trace_<yyyymmdd_hhmmss>.json`."""
+    return Path(output_root) / time.strftime("trace_%Y%m%d_%H%M%S.json")
+
+
+class TraceRecorder:
+    """
+    Records spans per thread and exports them as Chrome trace events. Thread-safe.
+
+    Parameters
+    ----------
+    clock : callable, optional
+        Returns the current time in seconds (default: time.perf_counter). Mainly used for testing.
+    """
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+
+        self.__start = clock()
+        self.__events = []
+        self.__threads = {}  # tid: thread name
+        self.__local = threading.local()
+        self.__lock = threading.Lock()
+
+    @property
+    def events(self):
+        """The recorded complete events (`ph` = `X`), see `export`."""
+        with self.__lock:
+            return list(self.__events)
+
+    def callback(self, progress_callback=None):
+        """
+        Returns a progress callback, which records a span per client and stage on the reporting thread.
+
+        Parameters
+        ----------
+        progress_callback : callable or None, optional
+            Receives the snapshots after they have been recorded (default: None).
+
+        Returns
+        -------
+        callback : callable
+            The callback for the progress.ProgressTracker of the run.
+        """
+        def record_and_forward(snapshot):
+            if snapshot.stage == "done":
+                self.end()
+            elif snapshot.stage is not None:
+                self.begin(snapshot.stage, client_id=snapshot.client_id)
+
+            if progress_callback is not None:
+                progress_callback(snapshot)
+
+        return record_and_forward
+
+    def begin(self, name, **args):
+        """
+        Ends the open span of the calling thread (see `end`) and begins the span `name`.
+
+        Parameters
+        ----------
+        name : str
+            Name of the span, e.g., the stage.
+        **args
+            Shown with the span, e.g., the client_id.
+
+        Returns
+        -------
+        None
+        """
+        self.end()
+        self.__local.open_span = (name, args, self.clock())
+
+    def end(self):
+        """Ends the open span of the calling thread, if any."""
+        open_span = getattr(self.__local, "open_span", None)
+        if open_span is None:
+            return
+
+        self.__local.open_span = None
+        name, args, started = open_span
+        self.__record(name, args, started, self.clock())
+
+    @contextmanager
+    def span(self, name, **args):
+        """
+        Records a span for the duration of the `with` block, independent of the open span of the thread.
+
+        Parameters
+        ----------
+        name : str
+            Name of the span.
+        **args
+            Shown with the span.
+        """
+        started = self.clock()
+        try:
+            yield
+        finally:
+            self.__record(name, args, started, self.clock())
+
+    def export(self, trace_file):
+        """
+        Writes the recorded spans in the Chrome trace event format (JSON object format).
+
+        Parameters
+        ----------
+        trace_file : pathlib.Path or pathlike str
+            Filepath of the trace, usually with the suffix `.json`.
+
+        Returns
+        -------
+        trace_file : pathlib.Path
+        """
+        trace_file = Path(trace_file)
+        pid = os.getpid()
+
+        with self.__lock:
+            events = list(self.__events)
+            threads = dict(self.__threads)
+
+        metadata = [{"name": "process_name", "ph": "M", "pid": pid, "tid": 0, "args": {"name": "dbcmailmerge"}}]
+        metadata += [{"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": thread_name}}
+                     for tid, thread_name in threads.items()]
+
+        trace_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(trace_file, 'w', encoding="utf-8") as out_file:
+            json.dump({"traceEvents": metadata + [dict(event, pid=pid) for event in events],
+                       "displayTimeUnit": "ms"}, out_file)
+
+        return trace_file
+
+    def __record(self, name, args, started, ended):
+        thread = threading.current_thread()
+        tid = threading.get_native_id()
+
+        event = {"name": name, "cat": TRACE_CATEGORY, "ph": "X", "tid": tid,
+                 "ts": (started - self.__start) * 1e6, "dur": (ended - started) * 1e6,  # microseconds
+                 "args": {key: str(value) for key, value in args.items()}}
+
+        with self.__lock:
+            self.__threads[tid] = thread.name
+            self.__events.append(event)
+
+
+def trace_span(tracer, name, **args):
+    """Returns `tracer.span(name, **args)`, or a context manager doing nothing if `tracer` is None."""
+    if tracer is None:
+        return nullcontext()
+    return tracer.span(name, **args)
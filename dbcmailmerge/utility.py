@@ -5,32 +5,39 @@ Description
 -----------
 Contains various helper that are used by the Mailproject class and the main program run.py.
 
-Includes functions for creating file hierarchies, translation dictionary keys, and parsing excel files.
+Includes functions for creating file hierarchies, translation dictionary keys, parsing the data sources, and selecting
+the documents of a selective regeneration.
+
+Data Sources
+------------
+Besides excel files, the records can be read from CSV files, Parquet files, and SQLite databases (see
+DATA_SOURCE_FORMATS), which are considerably faster to read. parse_data_source selects the parser by the suffix of the
+file. All parsers select the columns of the field list, fill empty cells with empty strings, and format the dates
+in the same way, so that the records are identical to the ones of the excel file. Since CSV and SQLite store dates as
+text, the columns in config.DATE_COLUMNS are parsed as ISO 8601 dates (e.g. `2019-06-30`) for these formats. CSV files
+and SQLite tables are read in chunks of CHUNK_SIZE rows.
+
+The columns, which are casted to str by config.CONVERSION_MAP (zip codes, depot number, BIC), are read as text, so that
+leading zeros are kept (e.g., the zip code `01067`). Numbers in these columns (e.g., an INTEGER column of a SQLite
+table or a number cell of an excel sheet) are converted to text without decimal places.
+
+Heavy dependencies (pandas, numpy) are imported where they are used, so that importing this module stays fast.
+The GUI helpers are found in gui.py.
 """
-import pandas as pd
-import numpy as np
+import re
 from pathlib import Path
-from tkinter import filedialog, Tk
 from itertools import product
 
+from dbcmailmerge.config import DATE_COLUMNS, TEMPLATES, CONVERSION_MAP, FIELD_MAP_CLIENTS
 
-def prompt_filepath():
-    """
-    Prompts the user to select a directory and returns its absolute OS-specific filepath as a pathlib.Path object.
+# suffix: format of the supported data sources
+DATA_SOURCE_FORMATS = {".xlsx": "excel", ".csv": "csv", ".parquet": "parquet",
+                       ".sqlite": "sqlite", ".sqlite3": "sqlite", ".db": "sqlite"}
 
-    Returns
-    -------
-    hierarchy_root : pathlib.Path
-        Contains an absolute filepath.
-    """
-    # prevent second window pop up when prompting in askdirectory
-    root = Tk()
-    root.withdraw()
+CHUNK_SIZE = 50000  # rows
 
-    # receive 'root' directory path in which the folder hierarchy should be created,
-    hierarchy_root = Path(filedialog.askdirectory())
-
-    return hierarchy_root
+# e.g. 2019-06-30, 2019-06-30 00:00:00, or 2019-06-30T12:00:00.000
+ISO_DATE_PATTERN = re.compile(r"^\d{4}-\d{2}-\d{2}([ T]\d{2}:\d{2}(:\d{2}(\.\d+)?)?)?$")
 
 
 def create_folder_hierarchy(hierarchy_root, top_level_dir, sub_directories):
@@ -115,9 +122,150 @@ def parse_excel(filepath, sheet_name, field_list):
         The df with the selected columns.
     """
     # TODO add tests
+    import pandas as pd
+
     # Extract only relevant fields: all fields in field_list
-    df = pd.read_excel(filepath, sheet_name)[field_list]
-    df.fillna('', inplace=True)  # fill NaN with empty string so comparisons for the entire instance works
+    df = pd.read_excel(filepath, sheet_name)[list(field_list)]
+
+    return format_data_frame(df, text_columns(field_list))
+
+
+def parse_data_source(filepath, sheet_name, field_list, data_format=None):
+    """
+    Constructs a DataFrame from the provided data source, using the parser for the format of the file.
+
+    Parameters
+    ----------
+    filepath : pathlib.Path or pathlike str
+        Filepath to the data source, one of the suffixes in DATA_SOURCE_FORMATS.
+    sheet_name : str or None
+        Name of the excel sheet or the SQLite table. Not used for CSV and Parquet files, which contain one table.
+    field_list : list of str
+        Contains the names of the columns, that should be included in the DataFrame
+    data_format : str or None, optional
+        One of the values of DATA_SOURCE_FORMATS (default: None, i.e., determined by the suffix of the file).
+
+    Returns
+    -------
+    df : pandas.DataFrame
+        The df with the selected columns.
+
+    Raises
+    ------
+    ValueError
+        If the format of the file is not supported.
+    """
+    if data_format is None:
+        data_format = DATA_SOURCE_FORMATS.get(Path(filepath).suffix.lower())
+
+    if data_format == "excel":
+        return parse_excel(filepath, sheet_name, field_list)
+    if data_format == "csv":
+        return parse_csv(filepath, field_list)
+    if data_format == "parquet":
+        return parse_parquet(filepath, field_list)
+    if data_format == "sqlite":
+        return parse_sqlite(filepath, sheet_name, field_list)
+
+    raise ValueError(f"The format of {filepath} is not supported, use one of {', '.join(DATA_SOURCE_FORMATS)}")
+
+
+def parse_csv(filepath, field_list, chunk_size=CHUNK_SIZE):
+    """
+    Constructs a DataFrame from a CSV file (utf-8, comma separated, with header), see parse_data_source.
+
+    Only the columns in `field_list` are parsed, the file is read in chunks of `chunk_size` rows.
+    """
+    import pandas as pd
+
+    columns = list(field_list)
+    chunks = pd.read_csv(filepath, usecols=columns, chunksize=chunk_size, encoding="utf-8",
+                         dtype={column: str for column in text_columns(field_list)})
+    df = pd.concat(list(chunks), ignore_index=True)[columns]
+
+    return format_data_frame(parse_date_columns(df), text_columns(field_list))
+
+
+def parse_parquet(filepath, field_list):
+    """
+    Constructs a DataFrame from a Parquet file, see parse_data_source. Requires pyarrow or fastparquet.
+
+    Only the columns in `field_list` are read from the file.
+    """
+    import pandas as pd
+
+    columns = list(field_list)
+    df = pd.read_parquet(filepath, columns=columns)[columns]
+
+    return format_data_frame(df, text_columns(field_list))
+
+
+def parse_sqlite(filepath, table_name, field_list, chunk_size=CHUNK_SIZE):
+    """
+    Constructs a DataFrame from a table of a SQLite database, see parse_data_source.
+
+    Only the columns in `field_list` are queried, the rows are fetched in chunks of `chunk_size` rows.
+    """
+    import sqlite3
+    import pandas as pd
+
+    columns = list(field_list)
+    query = "SELECT {} FROM {}".format(', '.join(_quote_identifier(column) for column in columns),
+                                       _quote_identifier(table_name))
+
+    # read-only, the data source is never modified
+    with sqlite3.connect(Path(filepath).resolve().as_uri() + "?mode=ro", uri=True) as connection:
+        chunks = list(pd.read_sql_query(query, connection, chunksize=chunk_size))
+
+    df = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=columns)
+
+    return format_data_frame(parse_date_columns(df), text_columns(field_list))
+
+
+def parse_date_columns(df):
+    """
+    Parses the columns of `df`, which are in config.DATE_COLUMNS and contain ISO 8601 dates, as datetime.
+
+    Columns with other values, e.g. dates that have already been formatted as 31.12.2019, are not changed.
+    """
+    import pandas as pd
+
+    for column in DATE_COLUMNS:
+        if column in df and pd.api.types.is_string_dtype(df[column]):
+            values = df[column].dropna()
+            # pd.to_datetime would parse 01.02.2019 as January 2
+            if values.map(lambda value: bool(ISO_DATE_PATTERN.match(str(value)))).all():
+                try:
+                    df[column] = pd.to_datetime(df[column])
+                except ValueError:
+                    pass
+
+    return df
+
+
+def format_data_frame(df, text_column_names=()):
+    """
+    Fills empty cells with empty strings and formats the dates of a DataFrame, see parse_data_source.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        The parsed data source, modified in place.
+    text_column_names : iterable of str, optional
+        The columns, whose values are converted to text, see text_columns (default: ()).
+
+    Returns
+    -------
+    df : pandas.DataFrame
+    """
+    import numpy as np
+
+    # fill NaN with empty string so comparisons for the entire instance works, columns with NaN become object columns
+    for column in df.columns[df.isna().any()]:
+        df[column] = df[column].astype(object).where(df[column].notna(), '')
+
+    for column in text_column_names:
+        df[column] = df[column].map(_to_text).astype(object)
 
     # format datetime
     df_dates = df.select_dtypes([np.datetime64])
@@ -127,6 +275,35 @@ def parse_excel(filepath, sheet_name, field_list):
     return df
 
 
+def text_columns(field_list):
+    """
+    Returns the columns of `field_list`, which are casted to str by config.CONVERSION_MAP.
+
+    Parameters
+    ----------
+    field_list : dict or list of str
+        The field map of the data source (column name: internal name) or its column names, which are translated with
+        config.FIELD_MAP_CLIENTS.
+
+    Returns
+    -------
+    columns : list of str
+    """
+    field_map = field_list if isinstance(field_list, dict) else FIELD_MAP_CLIENTS
+    return [column for column in field_list if CONVERSION_MAP.get(field_map.get(column)) is str]
+
+
+def _to_text(value):
+    """Returns `value` as str, numbers without decimal places (e.g., 1067.0 -> 1067)."""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _quote_identifier(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
 def translate_dict(in_dict, field_map, reverse=False):
     """
     Translates the keys of a dictionary to the values in field map.
@@ -171,3 +348,68 @@ def translate_dict(in_dict, field_map, reverse=False):
     return new_dict
 
 
+def select_doc_types(doc_types=None, templates=None):
+    """
+    Returns the doc types, which have to be created again after the given doc types or templates have changed.
+
+    A pdf is assembled from all templates of its doc type, therefore a changed template requires all pdfs of the doc
+    types, which contain the template.
+
+    Parameters
+    ----------
+    doc_types : iterable of str or None, optional
+        Keys of TEMPLATES (default: None).
+    templates : iterable of str or None, optional
+        Filenames of templates with or without suffix, e.g. `appropriateness_test.docx` (default: None).
+
+    Returns
+    -------
+    doc_types : list of str
+        The selected doc types in the order of TEMPLATES. All doc types, if neither doc types nor templates are given.
+
+    Raises
+    ------
+    ValueError
+        If a doc type or a template is unknown.
+    """
+    if doc_types is None and templates is None:
+        return list(TEMPLATES.keys())
+
+    doc_types = set(doc_types or [])
+    unknown = doc_types - TEMPLATES.keys()
+
+    for template in templates or []:
+        containing = [doc_type for doc_type, template_paths in TEMPLATES.items()
+                      if any(template in (template_path.name, template_path.stem) for template_path in template_paths)]
+        if not containing:
+            unknown.add(template)
+        doc_types.update(containing)
+
+    if unknown:
+        raise ValueError(f"Unknown doc type(s) or template(s): {', '.join(sorted(unknown))}")
+
+    return [doc_type for doc_type in TEMPLATES.keys() if doc_type in doc_types]
+
+
+def client_id_filter(client_ids):
+    """
+    Creates a selection filter for the client_id, which can be used in MailProject.select_clients.
+
+    Parameters
+    ----------
+    client_ids : iterable
+        The ids of the clients, which should be selected. Compared as str, i.e., `7` selects the client_id 7 (also if
+        it has been read as the float 7.0).
+
+    Returns
+    -------
+    selection_filter : callable
+        Returns True for the selected client ids.
+    """
+    client_ids = {_client_id_key(client_id) for client_id in client_ids}
+    return lambda client_id: _client_id_key(client_id) in client_ids
+
+
+def _client_id_key(client_id):
+    key = str(client_id).strip()
+    return key[:-2] if key.endswith(".0") else key
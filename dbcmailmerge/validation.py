@@ -0,0 +1,124 @@
+"""
+Author: David Meyer
+
+Description
+-----------
+Contains the report of a dry run, see MailProject.validate_batch_documents.
+
+A dry run formats the selected clients and merges their records into the word templates in memory, without writing
+files or starting LibreOffice. It finds the errors that would otherwise only show up after the conversion of the whole
+run, or not at all:
+    - merge fields of a template, which aren't filled by the data (e.g., a typo in the template or the field map),
+    - empty values of the fields in REQUIRED_FIELDS (see config.py),
+    - client records, which can't be formatted or merged (e.g., text in the amount column or control characters),
+    - pdfs of different clients with the same filepath, which would overwrite each other, and filenames with characters
+      that aren't allowed in filenames.
+"""
+import re
+from collections import namedtuple
+
+# characters, which aren't allowed in the filenames of Windows or of network shares
+INVALID_FILENAME_CHARACTERS = re.compile(r'[<>:"/\\|?*\x00-\x1f]')
+
+# An issue found by a dry run
+# severity : str, `error` (the run would fail or create wrong documents) or `warning`
+# client_id : str or None, the client the issue refers to, None for issues of a template
+# doc_type : str or None, the doc type the issue refers to
+# message : str
+ValidationIssue = namedtuple("ValidationIssue", ["severity", "client_id", "doc_type", "message"])
+
+
+class ValidationError(Exception):
+    """Raised if a dry run or a verification found errors. The ValidationReport is passed as `report`."""
+    def __init__(self, report):
+        super().__init__(f"The {report.title.lower()} found {len(report.errors)} error(s).")
+        self.report = report
+
+
+class ValidationReport:
+    """
+    Collects the issues found by a dry run or by the verification of the created pdfs (see verification.py).
+
+    Parameters
+    ----------
+    title : str, optional
+        The first word(s) of the summary line (default: `Dry run`).
+
+    Attributes
+    ----------
+    issues : list of ValidationIssue
+        All issues in the order they have been found.
+    clients : int
+        The number of validated clients.
+    documents : int
+        The number of validated pdfs (client and doc type).
+    """
+    def __init__(self, title="Dry run"):
+        self.title = title
+        self.issues = []
+        self.clients = 0
+        self.documents = 0
+
+    @property
+    def errors(self):
+        return [issue for issue in self.issues if issue.severity == "error"]
+
+    @property
+    def warnings(self):
+        return [issue for issue in self.issues if issue.severity == "warning"]
+
+    @property
+    def ok(self):
+        """True if no errors have been found."""
+        return not self.errors
+
+    def add(self, severity, client_id, doc_type, message):
+        """Adds an issue, see ValidationIssue for the parameters."""
+        self.issues.append(ValidationIssue(severity, client_id, doc_type, message))
+
+    def format(self):
+        """Returns the report as text, one line per issue."""
+        lines = [f"{self.title}: {self.clients} clients, {self.documents} documents, {len(self.errors)} error(s), "
+                 f"{len(self.warnings)} warning(s)"]
+        for issue in self.issues:
+            location = ', '.join(part for part in (f"client {issue.client_id}" if issue.client_id is not None else None,
+                                                   issue.doc_type) if part)
+            lines.append(f"{issue.severity.upper()}: {location + ': ' if location else ''}{issue.message}")
+
+        return '\n'.join(lines) + '\n'
+
+
+def check_required_values(client_record, required_fields):
+    """
+    Returns the required fields without a value.
+
+    Parameters
+    ----------
+    client_record : dict
+        The selected client record (internal field names, see FIELD_MAP_CLIENTS).
+    required_fields : iterable of str
+        The internal names of the required fields.
+
+    Returns
+    -------
+    empty_fields : list of str
+        Missing fields and fields containing an empty string or only whitespace.
+    """
+    return [field for field in required_fields if not str(client_record.get(field, '')).strip()]
+
+
+def check_filename(filename):
+    """
+    Returns the characters of `filename`, which aren't allowed in filenames.
+
+    Parameters
+    ----------
+    filename : str
+        The filename or a folder name of a pdf, e.g. the advisor.
+
+    Returns
+    -------
+    characters : str
+        The invalid characters in the order of their first occurrence, empty if the filename is valid.
+    """
+    return ''.join(dict.fromkeys(INVALID_FILENAME_CHARACTERS.findall(filename)))
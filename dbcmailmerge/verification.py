@@ -0,0 +1,158 @@
+"""
+Author: David Meyer
+
+Description
+-----------
+Contains the verification of the created pdfs, see MailProject.verify_batch_documents.
+
+After a run, the folder hierarchy of the destination (TOP_LEVEL_DIR/advisor/doc_type) is checked against the selected
+clients. For each client and doc type in TEMPLATES, the verification checks that
+    - the pdf exists (its filename contains the client_id),
+    - its page count matches the page count of the templates plus the pages of the standard pdfs (if the doc type
+      includes them, see INCLUDE_STANDARDS). The page count of a template is read from the document properties,
+      which word updates when the template is saved,
+    - the text of its customized pages contains the values of VERIFIED_FIELDS, which are merge fields of the
+      templates of the doc type (e.g., the name and the formatted amount of the client). Whitespace is ignored, since
+      the values may be broken across lines.
+
+Parsing pdfs is CPU-bound, therefore the pdfs are verified in parallel processes, by default one per core. Extracting
+the text requires the optional dependency pdfminer.six (`pip install pdfminer.six`).
+"""
+import io
+import os
+import re
+import zipfile
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+from dbcmailmerge.validation import ValidationReport
+
+# the fields (internal names), whose values are searched in the text of the customized pages
+VERIFIED_FIELDS = ("first_name", "last_name", "amount")
+
+PAGES_PATTERN = re.compile(rb"<Pages>(\d+)</Pages>")
+
+# A pdf, that should have been created
+# client_id : str
+# doc_type : str
+# pdf_path : pathlib.Path, the absolute filepath of the pdf
+# customized_pages : int or None, the number of pages of the templates, None if unknown
+# standard_pages : int, the number of pages of the appended standard pdfs
+# texts : tuple of str, the values, which should be contained in the customized pages
+ExpectedDocument = namedtuple("ExpectedDocument", ["client_id", "doc_type", "pdf_path", "customized_pages",
+                                                   "standard_pages", "texts"])
+
+
+def template_page_count(template):
+    """
+    Returns the page count of a word template, as saved in its document properties.
+
+    Parameters
+    ----------
+    template : io.BytesIO or pathlike str
+        The docx template, e.g. from cache.DocumentCache.template.
+
+    Returns
+    -------
+    pages : int or None
+        None if the template doesn't contain the page count (e.g., created by another application).
+    """
+    with zipfile.ZipFile(template) as docx:
+        try:
+            match = PAGES_PATTERN.search(docx.read("docProps/app.xml"))
+        except KeyError:
+            return None
+    return int(match.group(1)) if match else None
+
+
+def verify_document(expected):
+    """
+    Checks one created pdf. Runs in a worker process, see verify_documents.
+
+    Parameters
+    ----------
+    expected : ExpectedDocument
+
+    Returns
+    -------
+    errors : list of str
+        The error messages, empty if the pdf is correct.
+    """
+    from PyPDF2 import PdfFileReader
+    from PyPDF2.utils import PdfReadError
+    from pdfminer.high_level import extract_text
+
+    try:
+        with open(expected.pdf_path, "rb") as pdf_file:
+            pdf_bytes = pdf_file.read()
+    except FileNotFoundError:
+        return [f"{expected.pdf_path.name} doesn't exist."]
+
+    try:
+        page_count = PdfFileReader(io.BytesIO(pdf_bytes), strict=False).getNumPages()
+    except (PdfReadError, ValueError) as err:
+        return [f"{expected.pdf_path.name} can't be read: {err!r}"]
+
+    errors = []
+    if expected.customized_pages is not None:
+        expected_pages = expected.customized_pages + expected.standard_pages
+        if page_count != expected_pages:
+            errors.append(f"{expected.pdf_path.name} has {page_count} pages instead of {expected_pages}.")
+
+    customized_pages = max(page_count - expected.standard_pages, 1)
+    text = _normalize(extract_text(io.BytesIO(pdf_bytes), page_numbers=range(customized_pages)))
+    for value in expected.texts:
+        if _normalize(value) not in text:
+            errors.append(f"{expected.pdf_path.name} doesn't contain `{value}`.")
+
+    return errors
+
+
+def verify_documents(expected_documents, workers=None):
+    """
+    Checks the created pdfs in parallel processes.
+
+    Parameters
+    ----------
+    expected_documents : list of ExpectedDocument
+        The pdfs, which should have been created.
+    workers : int or None, optional
+        The number of processes (default: None, i.e., one per core). With 1, the pdfs are checked in this process.
+
+    Returns
+    -------
+    report : validation.ValidationReport
+        Contains one error per failed check. `documents` is the number of checked pdfs, `clients` isn't set.
+
+    Raises
+    ------
+    ImportError
+        If pdfminer.six is not installed.
+    """
+    try:
+        import pdfminer  # noqa: F401
+    except ImportError as err:
+        raise ImportError("The verification requires pdfminer.six (pip install pdfminer.six).") from err
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    if workers == 1 or len(expected_documents) < 2:
+        results = [verify_document(expected) for expected in expected_documents]
+    else:
+        # several pdfs per task, so that the processes don't wait for the transfer of each small task
+        chunksize = max(1, len(expected_documents) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = list(executor.map(verify_document, expected_documents, chunksize=chunksize))
+
+    report = ValidationReport(title="Verification")
+    report.documents = len(expected_documents)
+    for expected, errors in zip(expected_documents, results):
+        for message in errors:
+            report.add("error", expected.client_id, expected.doc_type, message)
+
+    return report
+
+
+def _normalize(text):
+    return ''.join(text.split())
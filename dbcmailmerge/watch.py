@@ -0,0 +1,294 @@
+"""
+Author: David Meyer
+
+Description
+-----------
+Contains the watch mode, which keeps the documents of a run up to date while the data source changes.
+
+During a subscription period, the client data is updated many times a day. The DocumentWatcher checks the data
+source, the templates and the standard pdfs every WATCH_INTERVAL seconds (see config.py). If one of them has changed,
+the clients are loaded again and compared with the clients of the last update by project and client_id:
+    - the pdfs of added clients and of clients, whose record or project has changed, are created,
+    - the pdfs of dropped clients (e.g., removed from the data source or no longer selected) are removed, as well as
+      the old pdfs of clients, whose filename has changed (e.g., a corrected name),
+    - if a template or a standard pdf has changed, the pdfs of the doc types using it are created for all clients
+      (see utility.select_doc_types and INCLUDE_STANDARDS).
+The pdfs of all other clients are kept. The converter pool, the cache of the templates and the snapshot cache of the
+data source stay alive between the updates, so that an update of a few clients takes seconds.
+
+The fingerprints of the clients and the paths of their pdfs are saved in WATCH_STATE_FILE in the output directory
+after each update, so that a restarted watch only creates the pdfs that have changed in the meantime. Only the folder
+hierarchy is supported as output, an archive would only contain the pdfs of the last update.
+
+The files are polled instead of being observed by the OS, which works the same way on network shares and requires no
+additional dependencies. If the data source can't be read (e.g., while it is being saved), the update is retried at
+the next check.
+"""
+import os
+import json
+import hashlib
+import threading
+from collections import namedtuple
+from pathlib import Path
+
+from dbcmailmerge.config import (TEMPLATES, INCLUDE_STANDARDS, DEFAULT_WORKERS, DEFAULT_BACKEND, DEFAULT_ENGINE,
+                                 DEFAULT_SCHEDULE, STAGING_ROOT, SNAPSHOT_DIR, WATCH_INTERVAL, WATCH_STATE_FILE)
+from dbcmailmerge.mailproject import MailProject
+from dbcmailmerge.batch import load_batch
+from dbcmailmerge.cache import DocumentCache
+from dbcmailmerge.assembly import PdfAssembler
+from dbcmailmerge.conversion import ConverterPool
+from dbcmailmerge.output import create_output
+from dbcmailmerge.snapshot import SnapshotCache
+from dbcmailmerge.utility import select_doc_types
+
+# The result of an update
+# created : int, the number of clients, whose pdfs have been created (added or changed clients)
+# refreshed : int, the number of clients, whose pdfs of `doc_types` have been created
+# removed : int, the number of removed pdfs
+# doc_types : list of str, the doc types using a changed template or standard pdf
+WatchUpdate = namedtuple("WatchUpdate", ["created", "refreshed", "removed", "doc_types"])
+
+
+class DocumentWatcher:
+    """
+    Keeps the pdfs of the selected clients at `hierarchy_root` up to date, see the module docstring.
+
+    Parameters
+    ----------
+    data_source, project_sheet, client_sheet, hierarchy_root, standard_pdfs, selection_criteria, client_data_source,
+    snapshot_dir
+        See batch.run_batch.
+
+    Attributes
+    ----------
+    selections : list of tuple
+        Contains the (MailProject, selected_clients) pairs of the last update.
+    """
+    def __init__(self, data_source, project_sheet, client_sheet, hierarchy_root, standard_pdfs,
+                 selection_criteria=None, client_data_source=None, snapshot_dir=SNAPSHOT_DIR):
+        self.data_source = Path(data_source)
+        self.project_sheet = project_sheet
+        self.client_sheet = client_sheet
+        self.hierarchy_root = Path(hierarchy_root)
+        self.standard_pdfs = [Path(standard_pdf) for standard_pdf in standard_pdfs]
+        self.selection_criteria = selection_criteria
+        self.client_data_source = Path(client_data_source) if client_data_source is not None else None
+        self.selections = []
+
+        self.__snapshot_cache = SnapshotCache(snapshot_dir) if snapshot_dir is not None else None
+        self.__cache = DocumentCache()
+
+        # the state of the last update: key of the client: fingerprint and pdfs, filepath: state of the file
+        self.__clients = {}
+        self.__files = {}
+        if self.state_file.exists():
+            with open(self.state_file, encoding="utf-8") as state_file:
+                state = json.load(state_file)
+            self.__clients, self.__files = state["clients"], state["files"]
+
+    @property
+    def state_file(self):
+        return self.hierarchy_root / WATCH_STATE_FILE
+
+    @property
+    def watched_files(self):
+        """The data sources, the templates and the standard pdfs."""
+        files = [self.data_source]
+        if self.client_data_source is not None:
+            files.append(self.client_data_source)
+        files += [template_path for template_paths in TEMPLATES.values() for template_path in template_paths]
+        return files + self.standard_pdfs
+
+    def changed(self):
+        """Returns True, if one of the watched files has changed since the last update."""
+        return file_state(self.watched_files) != self.__files
+
+    def update(self, converter, progress_callback=None, workers=DEFAULT_WORKERS, compress=False, engine=DEFAULT_ENGINE,
+               staging_root=STAGING_ROOT, schedule=DEFAULT_SCHEDULE):
+        """
+        Loads the clients, creates the pdfs of the added and changed clients, and removes the pdfs of dropped clients.
+
+        Parameters
+        ----------
+        converter : conversion.ConverterPool
+            The running pool, which is shared by all updates.
+        progress_callback, workers, compress, engine, staging_root, schedule
+            See batch.run_batch.
+
+        Returns
+        -------
+        update : WatchUpdate
+        """
+        # taken before loading, so that a change during the update triggers the next update
+        files = file_state(self.watched_files)
+        doc_types = self.__changed_doc_types(files)
+        if doc_types:
+            self.__cache = DocumentCache()
+
+        selections = load_batch(self.data_source, self.project_sheet, self.client_sheet, self.selection_criteria,
+                                self.client_data_source, self.__snapshot_cache)
+
+        clients = {}
+        created_selections = []
+        refreshed_selections = []
+        for project, selected_clients in selections:
+            project_fingerprint = fingerprint(project.to_record())
+            created_clients = []
+            refreshed_clients = []
+            for client_record, paths in zip(selected_clients, project.document_paths(selected_clients)):
+                key = f"{project.project_id}/{client_record['client_id']}"
+                clients[key] = {"fingerprint": fingerprint([project_fingerprint, client_record]),
+                                "documents": sorted(str(path) for path in paths.values())}
+
+                previous = self.__clients.get(key)
+                if previous is None or previous["fingerprint"] != clients[key]["fingerprint"]:
+                    created_clients.append(client_record)
+                elif doc_types:
+                    refreshed_clients.append(client_record)
+
+            if created_clients:
+                created_selections.append((project, created_clients))
+            if refreshed_clients:
+                refreshed_selections.append((project, refreshed_clients))
+
+        if created_selections or refreshed_selections:
+            assembler = PdfAssembler(compress=compress, dedup=compress, cache=self.__cache)
+            with create_output(self.hierarchy_root, "folders", staging_root) as output:
+                for update_selections, update_doc_types in ((created_selections, None),
+                                                            (refreshed_selections, doc_types)):
+                    if update_selections:
+                        MailProject.create_batch_documents(update_selections, self.hierarchy_root,
+                                                           self.standard_pdfs, progress_callback=progress_callback,
+                                                           workers=workers, converter=converter, cache=self.__cache,
+                                                           assembler=assembler, engine=engine, output=output,
+                                                           schedule=schedule, doc_types=update_doc_types)
+
+        # pdfs of dropped clients and old filenames of changed clients
+        current_documents = {document for client in clients.values() for document in client["documents"]}
+        removed = 0
+        for document in {document for client in self.__clients.values() for document in client["documents"]}:
+            if document not in current_documents and (self.hierarchy_root / document).exists():
+                os.remove(self.hierarchy_root / document)
+                removed += 1
+
+        self.selections = selections
+        self.__clients, self.__files = clients, files
+        self.__save_state()
+
+        return WatchUpdate(sum(len(selected) for _, selected in created_selections),
+                           sum(len(selected) for _, selected in refreshed_selections), removed, doc_types)
+
+    def run(self, converter, stop_event=None, interval=WATCH_INTERVAL, update_callback=None, **options):
+        """
+        Checks the watched files every `interval` seconds and updates the pdfs, if one of them has changed.
+
+        Parameters
+        ----------
+        converter : conversion.ConverterPool
+            The running pool, which is shared by all updates.
+        stop_event : threading.Event or None, optional
+            Stops the watch when it is set (default: None, i.e., the watch runs until it is interrupted).
+        interval : float, optional
+            Seconds between two checks (default: config.WATCH_INTERVAL).
+        update_callback : callable or None, optional
+            Called with the WatchUpdate of each update, or with the exception, if the update failed (default: None).
+        options
+            Passed on to `update`.
+
+        Returns
+        -------
+        None
+        """
+        if stop_event is None:
+            stop_event = threading.Event()
+
+        while True:
+            if self.changed():
+                try:
+                    result = self.update(converter, **options)
+                except Exception as err:  # e.g. a data source, which is being saved; retried at the next check
+                    result = err
+                if update_callback is not None:
+                    update_callback(result)
+
+            if stop_event.wait(interval):
+                return
+
+    def __changed_doc_types(self, files):
+        """Returns the doc types, whose templates or standard pdfs have changed since the last update."""
+        changed = {path for path, state in files.items() if self.__files.get(path) != state}
+
+        templates = [template_path.name for template_paths in TEMPLATES.values() for template_path in template_paths
+                     if str(template_path) in changed]
+        doc_types = set(select_doc_types(templates=templates)) if templates else set()
+        if any(str(standard_pdf) in changed for standard_pdf in self.standard_pdfs):
+            doc_types.update(doc_type for doc_type, include in INCLUDE_STANDARDS.items() if include)
+
+        return [doc_type for doc_type in TEMPLATES.keys() if doc_type in doc_types]
+
+    def __save_state(self):
+        partial_file = self.state_file.with_name(self.state_file.name + ".part")
+        with open(partial_file, "w", encoding="utf-8") as state_file:
+            json.dump({"clients": self.__clients, "files": self.__files}, state_file)
+        os.replace(partial_file, self.state_file)
+
+
+def watch_batch(data_source, project_sheet, client_sheet, hierarchy_root, standard_pdfs, selection_criteria=None,
+                progress_callback=None, workers=DEFAULT_WORKERS, backend=DEFAULT_BACKEND, compress=False,
+                engine=DEFAULT_ENGINE, staging_root=STAGING_ROOT, snapshot_dir=SNAPSHOT_DIR, client_data_source=None,
+                schedule=DEFAULT_SCHEDULE, interval=WATCH_INTERVAL, update_callback=None, stop_event=None):
+    """
+    Keeps the documents of a run up to date until `stop_event` is set or the watch is interrupted (Ctrl+C).
+
+    See batch.run_batch and DocumentWatcher.run for the parameters. The converter pool is started once and shared by
+    all updates.
+
+    Returns
+    -------
+    selections : list of tuple
+        Contains the (MailProject, selected_clients) pairs of the last update.
+    """
+    watcher = DocumentWatcher(data_source, project_sheet, client_sheet, hierarchy_root, standard_pdfs,
+                              selection_criteria, client_data_source, snapshot_dir)
+
+    with ConverterPool(workers, backend) as converter:
+        converter.warm_up()
+        try:
+            watcher.run(converter, stop_event, interval, update_callback, progress_callback=progress_callback,
+                        workers=workers, compress=compress, engine=engine, staging_root=staging_root,
+                        schedule=schedule)
+        except KeyboardInterrupt:
+            pass
+
+    return watcher.selections
+
+
+def file_state(paths):
+    """
+    Returns the modification time and the size of each file, None for missing files.
+
+    Parameters
+    ----------
+    paths : list of pathlib.Path
+
+    Returns
+    -------
+    state : dict
+        Contains str(path), [mtime_ns, size] pairs (lists, so that the state can be compared after saving it as JSON).
+    """
+    state = {}
+    for path in paths:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            state[str(path)] = None
+        else:
+            state[str(path)] = [stat.st_mtime_ns, stat.st_size]
+    return state
+
+
+def fingerprint(record):
+    """Returns a hash of a (client or project) record, which changes if one of its values changes."""
+    data = json.dumps(record, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
@@ -0,0 +1,467 @@
+"""
+Author: David Meyer
+
+Description
+-----------
+Contains the distributed mode, in which worker processes on several hosts create the documents of a run through a
+work queue in a shared directory.
+
+The coordinator (see enqueue_batch, or the `--queue-dir` option of the command line interface) loads and selects the
+clients as usual, splits the selected clients of each project into shards of SHARD_SIZE clients, and writes them as
+JSON files to the queue directory. Any number of workers, on any host that mounts the directory, claim shards, create
+their documents with MailProject.create_batch_documents, and report the completion (see run_worker, or
+`python -m dbcmailmerge.workqueue <queue_dir>`). No broker is required, the queue only relies on renames within the
+shared directory being atomic.
+
+Layout of the queue directory:
+    - `run.json`: the settings shared by all workers (output root, standard pdfs, engine, compression, schedule),
+      written after all shards, so that workers only start when the run is complete,
+    - `pending/`: the shards waiting for a worker,
+    - `leased/`: the shards claimed by a worker. The mtime of the file is the lease, which the worker renews every
+      HEARTBEAT_INTERVAL seconds,
+    - `done/`: the finished shards with their completion report (worker, clients, seconds),
+    - `failed/`: the shards that raised an error, or whose lease expired MAX_SHARD_ATTEMPTS times,
+    - `workers/`: one status file per worker, updated with each heartbeat.
+
+A worker claims a shard by renaming it from `pending/` to `leased/`, only one of several competing workers succeeds.
+If a worker dies, its lease isn't renewed anymore. Leases older than LEASE_TIMEOUT seconds are reclaimed by the other
+workers, i.e., moved back to `pending/`. The age of a lease is measured with the clock of the file server (the mtime of
+a freshly touched file), so the clocks of the hosts don't have to be in sync.
+
+A reclaimed shard can be processed twice, if its worker was only stalled. This is harmless, since the documents are
+written atomically to the same paths. All paths in the settings have to be valid on every worker host. Only the
+`folders` output mode is supported, since several workers can't write to the same zip archive.
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import threading
+from pathlib import Path
+from collections import namedtuple
+from contextlib import contextmanager
+
+from dbcmailmerge.config import (SHARD_SIZE, LEASE_TIMEOUT, HEARTBEAT_INTERVAL, QUEUE_POLL_INTERVAL,
+                                 MAX_SHARD_ATTEMPTS, DEFAULT_WORKERS, DEFAULT_BACKEND, DEFAULT_ENGINE, SNAPSHOT_DIR,
+                                 DEFAULT_SCHEDULE)
+from dbcmailmerge.mailproject import MailProject
+from dbcmailmerge.cache import DocumentCache
+from dbcmailmerge.assembly import PdfAssembler
+from dbcmailmerge.conversion import BACKENDS, ConverterPool
+from dbcmailmerge.snapshot import SnapshotCache
+
+QUEUE_STATES = ("pending", "leased", "done", "failed")
+
+# A shard claimed by a worker
+# name : str, the file name of the shard, e.g. `shard_00001.json`
+# project : dict, the keyword arguments of the MailProject, see MailProject.to_record
+# clients : list of dict, the selected client records of the shard
+# attempts : int, the number of times the lease of the shard has expired before
+Shard = namedtuple("Shard", ["name", "project", "clients", "attempts"])
+
+
+def default_worker_id():
+    """Returns the id of the calling worker process, `<hostname>_<pid>`."""
+    return f"{socket.gethostname()}_{os.getpid()}"
+
+
+class WorkQueue:
+    """
+    A work queue of shards in a shared directory, see the module docstring. Safe to use from several processes and
+    hosts.
+
+    Parameters
+    ----------
+    queue_dir : pathlib.Path or pathlike str
+        The shared directory of the queue, created if necessary.
+    lease_timeout : float, optional
+        Seconds without heartbeat, after which a lease is reclaimed (default: config.LEASE_TIMEOUT).
+    """
+    def __init__(self, queue_dir, lease_timeout=LEASE_TIMEOUT):
+        self.queue_dir = Path(queue_dir)
+        self.lease_timeout = lease_timeout
+
+        for directory in QUEUE_STATES + ("workers",):
+            (self.queue_dir / directory).mkdir(parents=True, exist_ok=True)
+
+    @property
+    def settings_path(self):
+        """The filepath of the settings of the run, see `enqueue`."""
+        return self.queue_dir / "run.json"
+
+    def enqueue(self, selections, settings, shard_size=SHARD_SIZE):
+        """
+        Splits the selected clients into shards and adds them to the queue.
+
+        Parameters
+        ----------
+        selections : list of tuple
+            Contains (MailProject, selected_clients) pairs, see MailProject.create_batch_documents.
+        settings : dict
+            The settings of the run for the workers, see run_worker. Has to be serializable as JSON.
+        shard_size : int, optional
+            The maximum number of clients per shard (default: config.SHARD_SIZE).
+
+        Returns
+        -------
+        shard_names : list of str
+
+        Raises
+        ------
+        ValueError
+            If the queue directory already contains a run. Use one queue directory per run.
+        """
+        if self.settings_path.exists() or any(self.status().values()):
+            raise ValueError(f"The queue {self.queue_dir} already contains a run.")
+
+        shard_names = []
+        for project, selected_clients in selections:
+            for start in range(0, len(selected_clients), shard_size):
+                shard_name = f"shard_{len(shard_names) + 1:05d}.json"
+                _write_json(self.queue_dir / "pending" / shard_name,
+                            {"project": project.to_record(), "clients": selected_clients[start:start + shard_size],
+                             "attempts": 0})
+                shard_names.append(shard_name)
+
+        # written last, the workers wait for it (see run_worker)
+        _write_json(self.settings_path, settings)
+
+        return shard_names
+
+    def settings(self):
+        """
+        Returns the settings of the run, see `enqueue`.
+
+        Raises
+        ------
+        FileNotFoundError
+            If the coordinator hasn't finished enqueueing the run.
+        """
+        return _read_json(self.settings_path)
+
+    def status(self):
+        """Returns the number of shards per state, see QUEUE_STATES."""
+        return {state: len(list((self.queue_dir / state).glob("*.json"))) for state in QUEUE_STATES}
+
+    def claim(self, worker_id):
+        """
+        Claims the next pending shard, after reclaiming expired leases (see `reclaim_expired`).
+
+        Parameters
+        ----------
+        worker_id : str
+            The id of the claiming worker, see default_worker_id.
+
+        Returns
+        -------
+        shard : Shard or None
+            None if no shard is pending.
+        """
+        self.reclaim_expired()
+
+        for pending_path in sorted((self.queue_dir / "pending").glob("*.json")):
+            try:
+                # the rename keeps the mtime, so the lease has to start before the shard is moved to `leased/`, a
+                # shard that has been pending longer than the lease timeout would be reclaimed otherwise
+                os.utime(pending_path)
+                os.rename(pending_path, self.queue_dir / "leased" / pending_path.name)
+            except FileNotFoundError:
+                continue  # claimed by another worker
+
+            if not self.renew(pending_path.name, worker_id):
+                continue
+
+            data = _read_json(self.queue_dir / "leased" / pending_path.name)
+            return Shard(pending_path.name, data["project"], data["clients"], data["attempts"])
+
+        return None
+
+    def renew(self, shard_name, worker_id):
+        """
+        Renews the lease of a claimed shard (heartbeat).
+
+        Parameters
+        ----------
+        shard_name : str
+            Shard.name of the claimed shard.
+        worker_id : str
+            The id of the worker holding the lease.
+
+        Returns
+        -------
+        renewed : bool
+            False if the lease expired and the shard has been reclaimed.
+        """
+        try:
+            os.utime(self.queue_dir / "leased" / shard_name)
+        except FileNotFoundError:
+            return False
+
+        _write_json(self.queue_dir / "workers" / f"{worker_id}.json", {"shard": shard_name, "pid": os.getpid(),
+                                                                        "host": socket.gethostname()})
+        return True
+
+    def complete(self, shard, report):
+        """
+        Moves a claimed shard to `done/`.
+
+        Parameters
+        ----------
+        shard : Shard
+            The claimed shard.
+        report : dict
+            The completion report, e.g., the worker id and the duration. Has to be serializable as JSON.
+
+        Returns
+        -------
+        None
+        """
+        self.__finish(shard, "done", report)
+
+    def fail(self, shard, report):
+        """Moves a claimed shard to `failed/`. See `complete` for the parameters, `report` should contain the error."""
+        self.__finish(shard, "failed", report)
+
+    def reclaim_expired(self):
+        """
+        Moves the shards with an expired lease back to `pending/`, or to `failed/` after MAX_SHARD_ATTEMPTS.
+
+        Returns
+        -------
+        shard_names : list of str
+            The names of the reclaimed shards.
+        """
+        now = self.__server_time()
+
+        reclaimed = []
+        for leased_path in sorted((self.queue_dir / "leased").glob("*.json")):
+            try:
+                if now - leased_path.stat().st_mtime <= self.lease_timeout:
+                    continue
+
+                # only one of several reclaiming workers succeeds in moving the shard out of `leased/`
+                reclaiming_path = leased_path.with_name(f"{leased_path.name}.{_unique_id()}.reclaim")
+                os.rename(leased_path, reclaiming_path)
+            except FileNotFoundError:
+                continue  # completed or reclaimed by another worker
+
+            data = _read_json(reclaiming_path)
+            data["attempts"] += 1
+            if (self.queue_dir / "done" / leased_path.name).exists():
+                pass  # the worker died after its completion report
+            elif data["attempts"] < MAX_SHARD_ATTEMPTS:
+                _write_json(self.queue_dir / "pending" / leased_path.name, data)
+                reclaimed.append(leased_path.name)
+            else:
+                data["report"] = {"error": f"The lease expired {data['attempts']} times."}
+                _write_json(self.queue_dir / "failed" / leased_path.name, data)
+
+            os.remove(reclaiming_path)
+
+        return reclaimed
+
+    def __finish(self, shard, state, report):
+        _write_json(self.queue_dir / state / shard.name,
+                    {"project": shard.project, "clients": shard.clients, "attempts": shard.attempts,
+                     "report": report})
+
+        try:
+            os.remove(self.queue_dir / "leased" / shard.name)
+        except FileNotFoundError:
+            pass  # the lease expired in the meantime
+
+    def __server_time(self):
+        # the mtime of a touched file is set by the file server, see the module docstring
+        clock_path = self.queue_dir / "workers" / f"clock_{_unique_id()}"
+        clock_path.touch()
+        now = clock_path.stat().st_mtime
+        os.remove(clock_path)
+
+        return now
+
+
+def enqueue_batch(queue_dir, data_source, project_sheet, client_sheet, hierarchy_root, standard_pdfs,
+                  selection_criteria=None, engine=DEFAULT_ENGINE, compress=False, shard_size=SHARD_SIZE,
+                  snapshot_dir=SNAPSHOT_DIR, client_data_source=None, schedule=DEFAULT_SCHEDULE, doc_types=None):
+    """
+    Loads all projects and their clients and adds the selected clients as shards to the queue (coordinator).
+
+    See batch.run_batch for the parameters. The documents are created by the workers, see run_worker.
+
+    Returns
+    -------
+    selections : list of tuple
+        Contains the enqueued (MailProject, selected_clients) pairs.
+    """
+    from dbcmailmerge.batch import load_batch
+
+    snapshot_cache = SnapshotCache(snapshot_dir) if snapshot_dir is not None else None
+    selections = load_batch(data_source, project_sheet, client_sheet, selection_criteria, client_data_source,
+                            snapshot_cache)
+
+    # the paths have to be valid on every worker host, they are resolved on the coordinator
+    settings = {"hierarchy_root": str(Path(hierarchy_root).resolve()),
+                "standard_pdfs": [str(Path(standard_pdf).resolve()) for standard_pdf in standard_pdfs],
+                "engine": engine,
+                "compress": compress,
+                "schedule": schedule,
+                "doc_types": doc_types}
+    WorkQueue(queue_dir).enqueue(selections, settings, shard_size)
+
+    return selections
+
+
+def run_worker(queue_dir, workers=DEFAULT_WORKERS, backend=DEFAULT_BACKEND, progress_callback=None, worker_id=None,
+               poll_interval=QUEUE_POLL_INTERVAL, heartbeat_interval=HEARTBEAT_INTERVAL):
+    """
+    Claims and processes shards until all shards of the queue are done or failed.
+
+    The worker waits for the coordinator, if the run hasn't been enqueued yet, and keeps polling while other workers
+    hold leases, so that it can take over their shards if they die. The LibreOffice instances and the template cache
+    are shared by all shards of the worker.
+
+    Parameters
+    ----------
+    queue_dir : pathlib.Path or pathlike str
+        The shared directory of the queue.
+    workers, backend, progress_callback
+        See MailProject.create_client_documents. The progress is reported per shard.
+    worker_id : str or None, optional
+        The id of the worker in the queue (default: None, i.e., default_worker_id()).
+    poll_interval : float, optional
+        Seconds between two looks for shards, if none is pending (default: config.QUEUE_POLL_INTERVAL).
+    heartbeat_interval : float, optional
+        Seconds between two renewals of the lease (default: config.HEARTBEAT_INTERVAL).
+
+    Returns
+    -------
+    shard_names : list of str
+        The names of the shards processed by this worker, including the failed ones.
+    """
+    queue = WorkQueue(queue_dir)
+    if worker_id is None:
+        worker_id = default_worker_id()
+
+    while not queue.settings_path.exists():
+        time.sleep(poll_interval)
+    settings = queue.settings()
+
+    cache = DocumentCache()
+    assembler = PdfAssembler(compress=settings["compress"], dedup=settings["compress"], cache=cache)
+
+    shard_names = []
+    with ConverterPool(workers, backend) as converter:
+        converter.warm_up()  # in the background, while the worker claims its first shard
+        while True:
+            shard = queue.claim(worker_id)
+            if shard is None:
+                status = queue.status()
+                if not status["pending"] and not status["leased"]:
+                    return shard_names
+                time.sleep(poll_interval)
+                continue
+
+            started = time.perf_counter()
+            report = {"worker": worker_id, "clients": len(shard.clients)}
+            try:
+                with _heartbeat(queue, shard, worker_id, heartbeat_interval):
+                    MailProject.create_batch_documents([(MailProject(**shard.project), shard.clients)],
+                                                       Path(settings["hierarchy_root"]), settings["standard_pdfs"],
+                                                       progress_callback=progress_callback, workers=workers,
+                                                       backend=backend, converter=converter, cache=cache,
+                                                       assembler=assembler, engine=settings["engine"],
+                                                       schedule=settings.get("schedule", DEFAULT_SCHEDULE),
+                                                       doc_types=settings.get("doc_types"))
+            except Exception as err:
+                queue.fail(shard, dict(report, error=repr(err)))
+            else:
+                queue.complete(shard, dict(report, seconds=round(time.perf_counter() - started, 3)))
+
+            shard_names.append(shard.name)
+
+
+@contextmanager
+def _heartbeat(queue, shard, worker_id, interval):
+    stopped = threading.Event()
+
+    def renew():
+        while not stopped.wait(interval):
+            if not queue.renew(shard.name, worker_id):
+                return  # reclaimed, the documents are still finished, see the module docstring
+
+    thread = threading.Thread(target=renew, name="dbcmailmerge-heartbeat", daemon=True)
+    thread.start()
+    try:
+        yield
+    finally:
+        stopped.set()
+        thread.join()
+
+
+def _unique_id():
+    return f"{default_worker_id()}_{threading.get_ident()}"
+
+
+def _write_json(path, data):
+    # atomic, readers never see a partially written file
+    partial_path = path.with_name(f"{path.name}.{_unique_id()}.part")
+    with open(partial_path, 'w', encoding="utf-8") as json_file:
+        json.dump(data, json_file, default=_json_value)
+    os.replace(partial_path, path)
+
+
+def _read_json(path):
+    with open(path, encoding="utf-8") as json_file:
+        return json.load(json_file)
+
+
+def _json_value(value):
+    # numpy scalars of the parsed data source, other values (e.g. timestamps) are stored as text
+    if hasattr(value, "item"):
+        return value.item()
+    return str(value)
+
+
+def main(argv=None):
+    """
+    Entry point of a worker, `python -m dbcmailmerge.workqueue <queue_dir>`.
+
+    Parameters
+    ----------
+    argv : list of str or None, optional
+        The command line arguments without the program name (default: None, i.e., sys.argv[1:]).
+
+    Returns
+    -------
+    exit_code : int
+        0 if all shards are done, 1 if a shard failed.
+    """
+    parser = argparse.ArgumentParser(prog="python -m dbcmailmerge.workqueue",
+                                     description="Creates the documents of the shards in a work queue directory.")
+    parser.add_argument("queue_dir", type=Path, help="the shared directory of the queue (see --queue-dir)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS,
+                        help=f"number of parallel workers of this process (default: {DEFAULT_WORKERS})")
+    parser.add_argument("--backend", choices=BACKENDS, default=DEFAULT_BACKEND,
+                        help=f"conversion backend (default: {DEFAULT_BACKEND})")
+    parser.add_argument("--worker-id", help="id of this worker in the queue (default: <hostname>_<pid>)")
+    parser.add_argument("--status", action="store_true", help="only print the number of shards per state")
+    parser.add_argument("--quiet", action="store_true", help="don't print the progress")
+    args = parser.parse_args(argv)
+
+    if not args.status:
+        from dbcmailmerge.progress import ConsoleProgressRenderer
+
+        shard_names = run_worker(args.queue_dir, args.workers, args.backend,
+                                 None if args.quiet else ConsoleProgressRenderer(sys.stderr), args.worker_id)
+        print(f"Processed {len(shard_names)} shard(s)", file=sys.stderr)
+
+    status = WorkQueue(args.queue_dir).status()
+    print(', '.join(f"{state}: {count}" for state, count in status.items()), file=sys.stderr)
+
+    return 1 if status["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -10,13 +10,21 @@ for the data source (excel), and asks for standard pdfs (generic) that should be
 document (from word template) per client.
 """
 import sys
+import argparse
 import tkinter as tk
 from tkinter import messagebox, filedialog
 from pathlib import Path
+from contextlib import ExitStack
 from xlrd import XLRDError
 
-from dbcmailmerge.config import FIELD_MAP_CLIENTS, FIELD_MAP_PROJECT
+from dbcmailmerge.config import (FIELD_MAP_CLIENTS, FIELD_MAP_PROJECT, SELECTION_FILTERS, DEFAULT_WORKERS,
+                                 DEFAULT_BACKEND)
+from dbcmailmerge.conversion import ConverterPool
 from dbcmailmerge.mailproject import MailProject
+from dbcmailmerge.batch import as_project_list, client_sheet_name
+from dbcmailmerge.progress import ConsoleProgressRenderer
+from dbcmailmerge.profiling import RunProfiler, default_profile_dir
+from dbcmailmerge.tracing import TraceRecorder, default_trace_file
 
 ABORT_KEYWORDS = ('q', "quit")
 # First element of the tuple is an explanation,the second a key to a filter
@@ -159,7 +167,7 @@ def select_filter():
     """
     # TODO add multiple filters
     selection = None
-    filters = {"amount": lambda x: bool(x)}  # evaluates to False for cells that had no value in the data source
+    filters = SELECTION_FILTERS
 
     selected_filters = {}
     while selection != 0 and not selected_filters:
@@ -220,17 +228,18 @@ def create_project_and_clients(data_source=None, data_kind=("project", "client")
         will be prompted to select one.
     data_kind : tuple, optional
         For which data categories the user should provide the excel sheet names for (default: project, client).
-    project_object : MailProject or None, optional
+    project_object : MailProject or list of MailProject or None, optional
         The project_object for which the client_records should be created. None is used when no project instance has
-        been instantiated.
+        been instantiated. If the project sheet contains several projects, the client sheet name may contain the
+        placeholder `{project_id}` (see batch.py).
     counter : int, optional
         Counts how often the function has called itself. If the function has invoked itself once (counter=1), it has
         run 2 times in total (once by the original caller, once by itself) and can return to the original caller.
 
     Returns
     -------
-    project_object :
-        The created MailProject instance with instantiated client_records.
+    project_object : MailProject or list of MailProject
+        The created MailProject instance(s) with instantiated client_records.
     """
     while True:
         if not data_source:
@@ -240,7 +249,9 @@ def create_project_and_clients(data_source=None, data_kind=("project", "client")
 
         try:
             if project_object:
-                project_object.create_client_records(data_source, data_sheet_name, FIELD_MAP_CLIENTS)
+                for project in as_project_list(project_object):
+                    project.create_client_records(data_source, client_sheet_name(data_sheet_name, project),
+                                                  FIELD_MAP_CLIENTS)
             else:
                 project_object = MailProject.from_excel(data_source, data_sheet_name, FIELD_MAP_PROJECT)
         except XLRDError:
@@ -256,36 +267,68 @@ def create_project_and_clients(data_source=None, data_kind=("project", "client")
 
 
 if __name__ == "__main__":
-    # hide root window
-    root = tk.Tk()
-    root.withdraw()
-
-    # Obtain location from the user for saving the documents
-    # The folder structure is saved as a constant, and is determined by the business need
-    messagebox.showinfo("Select Directory", "Select the directory where you want to save the created documents.")
-    hierarchy_root = Path(filedialog.askdirectory())
-    root.update()
-
-    # Prompt for data source, create project, and load clients
-    project = create_project_and_clients()
-
-    # Prompt the user to select a filter for selecting only records from the data source, that are relevant
-    selection_criteria = select_filter()
-    selected_clients = project.select_clients(selection_criteria)
-
-    # Ask the user to select the standard pdfs that should be appended at the end of the created document per client.
-    standard_pdfs = prompt_files()
-
-    summary_msg = (f"You have selected the project:\n"
-                   f"{project.project_id}: {project.project_name}.\n\n"
-                   f"You are about to create documents for:\n"
-                   f"{len(selected_clients)} clients\n\n"
-                   f"Do you wish to continue?")
-
-    start_mailmerge = messagebox.askyesno("Start Mailmerge", summary_msg)
-
-    if start_mailmerge:
-        # Create documents and save them at the desired location (hierarchy_root)
-        project.create_client_documents(selected_clients, hierarchy_root, standard_pdfs)
-    else:
-        sys.exit(0)
+    parser = argparse.ArgumentParser(description="Creates the client documents, prompting for all settings.")
+    parser.add_argument("--profile", action="store_true",
+                        help="profile the document creation, reports are saved in the selected directory")
+    parser.add_argument("--profile-memory", action="store_true",
+                        help="additionally trace the memory allocations (slow)")
+    parser.add_argument("--trace", action="store_true",
+                        help="save the timeline of the document creation as a Chrome trace in the selected directory")
+    args = parser.parse_args()
+
+    # LibreOffice starts in the background while the data source is parsed and the user is prompted for the settings
+    with ConverterPool(DEFAULT_WORKERS, DEFAULT_BACKEND) as converter:
+        converter.warm_up()
+
+        # hide root window
+        root = tk.Tk()
+        root.withdraw()
+
+        # Obtain location from the user for saving the documents
+        # The folder structure is saved as a constant, and is determined by the business need
+        messagebox.showinfo("Select Directory",
+                            "Select the directory where you want to save the created documents.")
+        hierarchy_root = Path(filedialog.askdirectory())
+        root.update()
+
+        # Prompt for data source, create project(s), and load clients
+        projects = as_project_list(create_project_and_clients())
+
+        # Prompt the user to select a filter for selecting only records from the data source, that are relevant
+        selection_criteria = select_filter()
+        selections = [(project, project.select_clients(selection_criteria)) for project in projects]
+
+        # Ask the user to select the standard pdfs that should be appended at the end of the created document per
+        # client.
+        standard_pdfs = prompt_files()
+
+        project_summary = "\n".join(f"{project.project_id}: {project.project_name} ({len(selected_clients)} clients)"
+                                    for project, selected_clients in selections)
+        summary_msg = (f"You have selected the project(s):\n"
+                       f"{project_summary}.\n\n"
+                       f"You are about to create documents for:\n"
+                       f"{sum(len(selected_clients) for _, selected_clients in selections)} clients\n\n"
+                       f"Do you wish to continue?")
+
+        start_mailmerge = messagebox.askyesno("Start Mailmerge", summary_msg)
+
+        if start_mailmerge:
+            profiler = None
+            tracer = TraceRecorder() if args.trace else None
+
+            with ExitStack() as stack:
+                if args.profile or args.profile_memory:
+                    profiler = stack.enter_context(RunProfiler(default_profile_dir(hierarchy_root),
+                                                               args.profile_memory))
+
+                # Create documents and save them at the desired location (hierarchy_root)
+                MailProject.create_batch_documents(selections, hierarchy_root, standard_pdfs,
+                                                   progress_callback=ConsoleProgressRenderer(), converter=converter,
+                                                   profiler=profiler, tracer=tracer)
+
+            if profiler is not None:
+                print(f"Profiling reports saved in {profiler.out_dir}")
+            if tracer is not None:
+                print(f"Trace saved in {tracer.export(default_trace_file(hierarchy_root))}")
+        else:
+            sys.exit(0)
@@ -0,0 +1,73 @@
+"""
+Author: David Meyer
+
+Description
+-----------
+Contains the test suite for the PdfAssembler in assembly.py.
+"""
+import shutil
+import pytest
+from PyPDF2 import PdfFileReader, PdfFileWriter
+from PyPDF2.generic import NameObject, DictionaryObject
+from dbcmailmerge.assembly import PdfAssembler, strip_page_extras
+from tests.test_constants import STANDARD_PDFS
+
+
+def page_count(path):
+    with open(path, "rb") as pdf:
+        return PdfFileReader(pdf, strict=False).getNumPages()
+
+
+def test_assemble(tmp_path):
+    customized = tmp_path / "customized.pdf"
+    shutil.copy(STANDARD_PDFS[0], customized)
+    out_file = tmp_path / "merged.pdf"
+
+    pages = PdfAssembler().assemble([customized], STANDARD_PDFS, out_file)
+
+    expected_pages = page_count(STANDARD_PDFS[0]) + sum(page_count(path) for path in STANDARD_PDFS)
+    assert pages == expected_pages
+    assert page_count(out_file) == expected_pages
+
+    # the customized pdf is removed and no partial file is left behind
+    assert not customized.exists()
+    assert sorted(tmp_path.iterdir()) == [out_file]
+
+
+def test_assemble_dedup_and_compress(tmp_path):
+    plain_file = tmp_path / "plain.pdf"
+    optimized_file = tmp_path / "optimized.pdf"
+
+    # the same standard pdf twice -> its fonts and images are stored twice without dedup
+    PdfAssembler().assemble([], [STANDARD_PDFS[0]] * 2, plain_file)
+    PdfAssembler(compress=True, dedup=True).assemble([], [STANDARD_PDFS[0]] * 2, optimized_file)
+
+    assert page_count(optimized_file) == page_count(plain_file)
+    assert optimized_file.stat().st_size < plain_file.stat().st_size
+
+
+def test_size_profiles(tmp_path):
+    assembler = PdfAssembler(profiles={"offer_documents": "smallest", "appropriateness_test": None})
+
+    assert assembler.options("offer_documents") == {"compress": True, "dedup": True, "strip": True}
+    # doc types without a profile use the settings of the assembler
+    assert assembler.options("appropriateness_test") == {"compress": False, "dedup": False, "strip": False}
+
+    plain_file = tmp_path / "plain.pdf"
+    optimized_file = tmp_path / "optimized.pdf"
+    assembler.assemble([], [STANDARD_PDFS[0]] * 2, plain_file, doc_type="appropriateness_test")
+    assembler.assemble([], [STANDARD_PDFS[0]] * 2, optimized_file, doc_type="offer_documents")
+
+    assert optimized_file.stat().st_size < plain_file.stat().st_size
+
+    with pytest.raises(ValueError):
+        PdfAssembler(profiles={"offer_documents": "tiny"})
+
+
+def test_strip_page_extras():
+    writer = PdfFileWriter()
+    page = writer.addBlankPage(100, 100)
+    page[NameObject("/PieceInfo")] = DictionaryObject()
+
+    assert strip_page_extras(writer) == 1
+    assert "/PieceInfo" not in writer.getPage(0)
@@ -0,0 +1,100 @@
+"""
+Author: David Meyer
+
+Description
+-----------
+Contains the test suite for the autotuning of the workers in autotune.py.
+"""
+import threading
+import time
+from dbcmailmerge.autotune import ConcurrencyTuner, load_workers, save_workers
+
+GiB = 1024 ** 3
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def measure(tuner, clock, throughput, latency=1.0):
+    """Records one window of pdfs created with `throughput` pdfs per second and returns the measurement."""
+    clock.now += tuner.window / throughput
+    for _ in range(tuner.window - 1):
+        assert tuner.record(latency) is None
+    return tuner.record(latency)
+
+
+def test_tuner_finds_best_workers():
+    clock = FakeClock()
+    tuner = ConcurrencyTuner(min_workers=1, max_workers=8, window=2, memory=lambda: 8 * GiB, clock=clock)
+    throughputs = {1: 1.0, 2: 1.9, 3: 1.95}
+
+    actions = [measure(tuner, clock, throughputs[tuner.workers]).action for _ in range(4)]
+
+    # the third worker doesn't increase the throughput by 5 %
+    assert actions == ["increase", "increase", "decrease", "keep"]
+    assert tuner.workers == tuner.chosen == 2
+    assert [measurement.workers for measurement in tuner.history] == [1, 2, 3, 2]
+
+
+def test_tuner_backs_off():
+    clock = FakeClock()
+    memory = [8 * GiB]
+    tuner = ConcurrencyTuner(initial=4, max_workers=8, window=2, memory=lambda: memory[0], clock=clock)
+
+    measure(tuner, clock, 4.0, latency=1.0)
+    measure(tuner, clock, 4.0, latency=1.0)  # no gain with 5 workers -> back to 4
+    assert tuner.workers == 4
+
+    # the latency at the best number of workers rises
+    assert measure(tuner, clock, 4.0, latency=2.0).action == "latency"
+    assert tuner.workers == 3
+
+    # memory pressure lowers the upper bound
+    memory[0] = 100 * 1024 ** 2
+    assert measure(tuner, clock, 5.0).action == "memory"
+    memory[0] = 8 * GiB
+    measure(tuner, clock, 10.0)
+    assert tuner.workers == tuner.chosen == 2
+
+
+def test_slot_limits_active_workers():
+    tuner = ConcurrencyTuner(initial=2, max_workers=4)
+    active = []
+    lock = threading.Lock()
+
+    def work():
+        with tuner.slot():
+            with lock:
+                active.append(1)
+                maximum.append(len(active))
+            time.sleep(0.02)
+            with lock:
+                active.pop()
+
+    maximum = []
+    threads = [threading.Thread(target=work) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert max(maximum) == 2
+
+
+def test_save_and_load_workers(tmp_path):
+    settings_file = tmp_path / "autotune.json"
+    clock = FakeClock()
+    tuner = ConcurrencyTuner(initial=3, max_workers=8, window=2, memory=lambda: None, clock=clock)
+    measure(tuner, clock, 2.0)
+
+    assert load_workers("host/subprocess/libreoffice", settings_file) is None
+    save_workers("host/subprocess/libreoffice", tuner, settings_file)
+    save_workers("host/uno/libreoffice", ConcurrencyTuner(initial=2, max_workers=8), settings_file)
+
+    assert load_workers("host/subprocess/libreoffice", settings_file) == 3
+    assert load_workers("host/uno/libreoffice", settings_file) == 2
@@ -0,0 +1,41 @@
+"""
+Author: David Meyer
+
+Description
+-----------
+Contains the test suite for the batch mode in batch.py and the DocumentCache in cache.py.
+"""
+from dbcmailmerge.batch import as_project_list, client_sheet_name
+from dbcmailmerge.cache import DocumentCache
+from dbcmailmerge.mailproject import MailProject
+from tests.test_constants import TEST_PROJECT_SINGLE_1, TEST_PROJECT_SINGLE_2
+
+
+def test_as_project_list():
+    project1 = MailProject(**TEST_PROJECT_SINGLE_1)
+    project2 = MailProject(**TEST_PROJECT_SINGLE_2)
+
+    assert as_project_list(project1) == [project1]
+    assert as_project_list([project1, project2]) == [project1, project2]
+
+
+def test_client_sheet_name():
+    project = MailProject(**TEST_PROJECT_SINGLE_1)
+
+    assert client_sheet_name("client_data_{project_id}", project) == "client_data_141"
+    assert client_sheet_name("client_data", project) == "client_data"
+
+
+def test_document_cache(tmp_path):
+    template_path = tmp_path / "template.docx"
+    template_path.write_bytes(b"template")
+
+    cache = DocumentCache()
+    first = cache.template(template_path)
+    template_path.write_bytes(b"changed")  # the file is only read once
+    second = cache.standard_pdf(template_path)
+
+    assert first.read() == b"template"
+    assert second.read() == b"template"
+    assert first is not second
+    assert len(cache) == 1
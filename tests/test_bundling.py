@@ -0,0 +1,150 @@
+"""
+Author: David Meyer
+
+Description
+-----------
+Contains the test suite for the bundles of the standard pdfs in bundling.py.
+"""
+import os
+import time
+import threading
+from pathlib import Path
+
+import pytest
+from PyPDF2 import PdfFileReader
+from dbcmailmerge.assembly import PdfAssembler
+from dbcmailmerge import bundling
+from dbcmailmerge.bundling import StandardsBundler, appends_standards, read_index
+from dbcmailmerge.output import DirectoryOutput
+from tests.test_constants import STANDARD_PDFS
+
+ADVISOR_DIRS = [Path("client_correspondence", "Betreuer 1"), Path("client_correspondence", "Betreuer 2")]
+STANDARD_PAGES = 3  # pib.pdf and factsheet.pdf
+
+
+def create_run(tmp_path, bundler, clients, write_behind=False, barrier=None):
+    """Publishes an empty pdf per (advisor index, client_id) and finishes the bundler (after the barrier, if any)."""
+    with DirectoryOutput(tmp_path / "share", tmp_path, write_behind=write_behind) as output:
+        for advisor, client_id in clients:
+            relative_dir = ADVISOR_DIRS[advisor] / "offer_documents"
+            (output.local_dir(relative_dir) / f"Nr._1_{client_id}.pdf").write_bytes(b"")
+            bundler.add(ADVISOR_DIRS[advisor], "offer_documents", client_id, f"Nr._1_{client_id}.pdf")
+            output.publish(relative_dir / f"Nr._1_{client_id}.pdf")
+
+        if barrier is not None:
+            barrier.wait()
+        return bundler.finish(output, STANDARD_PDFS, PdfAssembler())
+
+
+def test_bundles():
+    bundler = StandardsBundler({"offer_documents": "advisor", "appropriateness_test": None})
+
+    assert bundler.bundles("offer_documents")
+    assert not bundler.bundles("appropriateness_test")
+    assert not appends_standards("offer_documents", bundler.scopes)
+    assert appends_standards("offer_documents", {"offer_documents": None})
+    # the appropriateness test doesn't include the standard pdfs (see INCLUDE_STANDARDS)
+    assert not appends_standards("appropriateness_test", {})
+
+    with pytest.raises(ValueError):
+        StandardsBundler({"offer_documents": "client"})
+
+
+def test_bundle_per_advisor(tmp_path):
+    files = create_run(tmp_path, StandardsBundler({"offer_documents": "advisor"}), [(0, "1"), (0, "2"), (1, "3")])
+
+    assert len(files) == 4
+    for advisor_dir in ADVISOR_DIRS:
+        with open(tmp_path / "share" / advisor_dir / "standards_offer_documents.pdf", "rb") as bundle:
+            assert PdfFileReader(bundle, strict=False).getNumPages() == STANDARD_PAGES
+
+    assert read_index(tmp_path / "share" / ADVISOR_DIRS[0] / "index_offer_documents.csv") == [
+        {"client_id": "1", "document": "offer_documents/Nr._1_1.pdf", "standards": "standards_offer_documents.pdf"},
+        {"client_id": "2", "document": "offer_documents/Nr._1_2.pdf", "standards": "standards_offer_documents.pdf"}]
+
+
+def test_bundle_per_run(tmp_path):
+    files = create_run(tmp_path, StandardsBundler({"offer_documents": "run"}), [(0, "1"), (1, "3")])
+
+    assert Path("client_correspondence", "standards_offer_documents.pdf") in files
+    assert not (tmp_path / "share" / ADVISOR_DIRS[0] / "standards_offer_documents.pdf").exists()
+    assert read_index(tmp_path / "share" / ADVISOR_DIRS[1] / "index_offer_documents.csv") == [
+        {"client_id": "3", "document": "offer_documents/Nr._1_3.pdf", "standards": "../standards_offer_documents.pdf"}]
+
+
+def test_index_keeps_existing_clients(tmp_path):
+    create_run(tmp_path, StandardsBundler({"offer_documents": "advisor"}), [(0, "1"), (0, "2")])
+    (tmp_path / "share" / ADVISOR_DIRS[0] / "offer_documents" / "Nr._1_2.pdf").unlink()
+
+    # only client 3 is created, client 1 is kept, the pdf of client 2 has been removed
+    create_run(tmp_path, StandardsBundler({"offer_documents": "advisor"}), [(0, "3")])
+
+    index = read_index(tmp_path / "share" / ADVISOR_DIRS[0] / "index_offer_documents.csv")
+    assert [row["client_id"] for row in index] == ["1", "3"]
+
+
+def test_index_of_concurrent_workers(tmp_path, mocker):
+    # two shards of the distributed mode finish at the same time against one destination
+    create_index = read_index
+
+    def slow_read_index(index_path):
+        rows = create_index(index_path)
+        time.sleep(0.2)  # the other worker would read the same index meanwhile without the lock
+        return rows
+
+    mocker.patch("dbcmailmerge.bundling.read_index", side_effect=slow_read_index)
+    barrier = threading.Barrier(2)
+    shards = [[(0, "1"), (0, "2"), (1, "3")], [(0, "4"), (1, "5")]]
+    errors = []
+
+    def run_shard(clients):
+        try:
+            create_run(tmp_path, StandardsBundler({"offer_documents": "advisor"}), clients, True, barrier)
+        except Exception as err:
+            errors.append(err)
+
+    threads = [threading.Thread(target=run_shard, args=(clients,)) for clients in shards]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    for advisor_dir, client_ids in zip(ADVISOR_DIRS, [["1", "2", "4"], ["3", "5"]]):
+        index = read_index(tmp_path / "share" / advisor_dir / "index_offer_documents.csv")
+        assert [row["client_id"] for row in index] == client_ids
+        assert not (tmp_path / "share" / advisor_dir / "index_offer_documents.csv.lock").exists()
+
+
+def test_index_lock_removes_stale_lock(tmp_path, mocker):
+    mocker.patch("dbcmailmerge.bundling.time.sleep", side_effect=AssertionError("waits for a stale lock"))
+    lock_path = tmp_path / "share" / ADVISOR_DIRS[0] / "index_offer_documents.csv.lock"
+    lock_path.parent.mkdir(parents=True)
+    lock_path.touch()
+    os.utime(lock_path, (0, 0))  # the worker died long ago
+
+    create_run(tmp_path, StandardsBundler({"offer_documents": "advisor"}), [(0, "1")])
+
+    assert not lock_path.exists()
+    assert [row["client_id"] for row in read_index(lock_path.with_suffix(""))] == ["1"]
+
+
+def test_index_lock_waits(tmp_path):
+    index_path = tmp_path / "index_offer_documents.csv"
+    holding = threading.Event()
+    order = []
+
+    def hold_lock():
+        with bundling._index_lock(index_path):
+            holding.set()
+            time.sleep(0.3)
+            order.append("first")
+
+    thread = threading.Thread(target=hold_lock)
+    thread.start()
+    holding.wait()
+    with bundling._index_lock(index_path):
+        order.append("second")
+    thread.join()
+
+    assert order == ["first", "second"]
@@ -0,0 +1,129 @@
+"""
+Author: David Meyer
+
+Description
+-----------
+Contains the test suite for the command line interface in cli.py.
+"""
+import sys
+import subprocess
+import pytest
+from pathlib import Path
+from dbcmailmerge.cli import build_parser, resolve_runs, ConfigError
+
+
+CONFIG = """
+[DEFAULT]
+output_root = out
+workers = 3
+
+[first]
+data_source = data/source.xlsx
+project_sheet = project_data_single_1
+client_sheet = client_data
+filters = amount
+standard_pdfs =
+    data/pib.pdf
+    data/factsheet.pdf
+
+[second]
+data_source = data/source.xlsx
+project_sheet = project_data_single_2
+client_sheet = client_data
+backend = uno
+"""
+
+
+def test_resolve_runs_from_arguments():
+    args = build_parser().parse_args(["--data-source", "source.xlsx", "--project-sheet", "p", "--client-sheet", "c",
+                                      "--output-root", "out", "--filter", "amount", "--standard-pdf", "pib.pdf"])
+    runs = resolve_runs(args)
+
+    assert len(runs) == 1
+    assert runs[0]["data_source"] == Path("source.xlsx")
+    assert runs[0]["filters"] == ["amount"]
+    assert runs[0]["standard_pdfs"] == [Path("pib.pdf")]
+    assert runs[0]["workers"] == 1
+    assert runs[0]["backend"] == "subprocess"
+
+
+def test_resolve_runs_from_config(tmp_path):
+    config_path = tmp_path / "runs.ini"
+    config_path.write_text(CONFIG)
+
+    # command line arguments override the config file
+    args = build_parser().parse_args(["--config", str(config_path), "--workers", "2"])
+    first, second = resolve_runs(args)
+
+    assert first["name"] == "first"
+    assert first["data_source"] == tmp_path / "data" / "source.xlsx"
+    assert first["output_root"] == tmp_path / "out"
+    assert first["standard_pdfs"] == [tmp_path / "data" / "pib.pdf", tmp_path / "data" / "factsheet.pdf"]
+    assert first["filters"] == ["amount"]
+    assert first["workers"] == 2
+
+    assert second["project_sheet"] == "project_data_single_2"
+    assert second["backend"] == "uno"
+    assert second["filters"] == []
+
+
+def test_resolve_runs_csv_without_sheets():
+    args = build_parser().parse_args(["--data-source", "projects.csv", "--client-data-source", "clients.csv",
+                                      "--output-root", "out"])
+    run, = resolve_runs(args)
+
+    assert (run["project_sheet"], run["client_sheet"]) == (None, None)
+    assert run["client_data_source"] == Path("clients.csv")
+
+    # the client sheet is required for the SQLite client data source
+    args = build_parser().parse_args(["--data-source", "projects.csv", "--client-data-source", "crm.sqlite",
+                                      "--output-root", "out"])
+    with pytest.raises(ConfigError):
+        resolve_runs(args)
+
+
+def test_resolve_runs_missing_setting():
+    args = build_parser().parse_args(["--data-source", "source.xlsx"])
+
+    with pytest.raises(ConfigError):
+        resolve_runs(args)
+
+
+def test_cli_does_not_import_tkinter():
+    code = "import sys, dbcmailmerge.cli; assert 'tkinter' not in sys.modules"
+    subprocess.run([sys.executable, "-c", code], check=True, cwd=Path(__file__).resolve().parents[1])
+
+
+def test_resolve_runs_selective_regeneration():
+    args = build_parser().parse_args(["--data-source", "source.xlsx", "--project-sheet", "p", "--client-sheet", "c",
+                                      "--output-root", "out", "--template", "appropriateness_test.docx",
+                                      "--client-id", "7"])
+    run, = resolve_runs(args)
+
+    assert run["doc_types"] == ["appropriateness_test"]
+    assert run["client_ids"] == ["7"]
+    assert "templates" not in run
+
+    # an archive would only contain the created pdfs
+    with pytest.raises(ConfigError):
+        resolve_runs(build_parser().parse_args(["--data-source", "source.xlsx", "--project-sheet", "p",
+                                                "--client-sheet", "c", "--output-root", "out", "--client-id", "7",
+                                                "--output-mode", "zip_per_run"]))
+
+
+def test_resolve_runs_watch():
+    arguments = ["--data-source", "source.xlsx", "--project-sheet", "p", "--client-sheet", "c", "--output-root", "out",
+                 "--watch"]
+    run, = resolve_runs(build_parser().parse_args(arguments))
+    assert run["watch"]
+
+    # an archive or a print file would only contain the pdfs of the last update
+    with pytest.raises(ConfigError):
+        resolve_runs(build_parser().parse_args(arguments + ["--output-mode", "zip_per_run"]))
+    with pytest.raises(ConfigError):
+        resolve_runs(build_parser().parse_args(arguments + ["--print-shop"]))
+
+    # the updates aren't profiled or traced
+    for option in ("--profile", "--profile-memory", "--trace"):
+        with pytest.raises(ConfigError):
+            resolve_runs(build_parser().parse_args(arguments + [option]))
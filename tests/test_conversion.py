@@ -0,0 +1,147 @@
+"""
+Author: David Meyer
+
+Description
+-----------
+Contains the test suite for the ConverterPool in conversion.py.
+"""
+import os
+import subprocess
+import threading
+from unittest import mock
+
+import pytest
+from dbcmailmerge.conversion import ConverterPool, _UnoSlot, resource_limit_args
+
+
+class FakeProcess:
+    """Stands in for a running LibreOffice instance of the uno backend."""
+    def __init__(self):
+        self.pid = os.getpid()
+        self.returncode = None
+
+    def poll(self):
+        return self.returncode
+
+    def wait(self, timeout=None):
+        if self.returncode is None:
+            raise subprocess.TimeoutExpired("soffice", timeout)
+        return self.returncode
+
+    def kill(self):
+        self.returncode = -9
+
+
+@pytest.fixture
+def uno_slots(mocker):
+    """Replaces the instances of the uno backend, returns the list of started instances."""
+    processes = []
+
+    def convert(slot, folder, source):
+        if slot.desktop is None:
+            slot.process, slot.desktop, slot.conversions = FakeProcess(), mock.Mock(), 0
+            processes.append(slot.process)
+        return f"{folder}/document.pdf"
+
+    mocker.patch.object(_UnoSlot, "_UnoSlot__convert", convert)
+    return processes
+
+
+def test_warm_up(mocker):
+    started = threading.Event()
+    release = threading.Event()
+
+    def warm_up(slot):
+        started.set()
+        release.wait(5)
+
+    mocker.patch("dbcmailmerge.conversion._SubprocessSlot.warm_up", warm_up)
+    convert_to = mocker.patch("dbcmailmerge.conversion.convert_to", return_value="out/document.pdf")
+
+    with ConverterPool() as pool:
+        pool.warm_up()
+        assert started.wait(5)
+
+        # the conversion waits until its slot has been started
+        conversion = threading.Thread(target=pool.convert, args=("out", "document.docx"))
+        conversion.start()
+        conversion.join(0.2)
+        assert conversion.is_alive() and not convert_to.called
+
+        release.set()
+        conversion.join(5)
+        assert convert_to.call_count == 1
+
+
+def test_warm_up_error(mocker):
+    mocker.patch("dbcmailmerge.conversion._SubprocessSlot.warm_up", side_effect=OSError("no LibreOffice"))
+    convert_to = mocker.patch("dbcmailmerge.conversion.convert_to", return_value="out/document.pdf")
+
+    with ConverterPool(size=2) as pool:
+        pool.warm_up()
+
+        # the slots are still available, the conversion reports the errors
+        assert pool.convert("out", "document.docx") == "out/document.pdf"
+        assert pool.convert("out", "document.docx") == "out/document.pdf"
+    assert convert_to.call_count == 2
+
+
+def test_warm_up_count(mocker):
+    warm_up = mocker.patch("dbcmailmerge.conversion._SubprocessSlot.warm_up")
+    convert_to = mocker.patch("dbcmailmerge.conversion.convert_to", return_value="out/document.pdf")
+
+    with ConverterPool(size=4) as pool:
+        pool.warm_up(count=2)
+    assert warm_up.call_count == 2
+
+    # the conversions use the most recently used slot
+    with ConverterPool(size=4) as pool:
+        pool.convert("out", "document.docx")
+        pool.convert("out", "document.docx")
+    assert convert_to.call_args_list[0].kwargs == convert_to.call_args_list[1].kwargs
+
+
+def test_recycle_after_documents(uno_slots):
+    with ConverterPool(backend="uno", recycle_after=3, max_rss=None) as pool:
+        for _ in range(7):
+            assert pool.convert("out", "document.docx") == "out/document.pdf"
+
+        # recycled after the 3rd and the 6th conversion
+        assert len(uno_slots) == 3
+        assert pool.restarts == 2
+
+
+def test_recycle_max_rss(uno_slots, mocker):
+    mocker.patch("dbcmailmerge.conversion.process_tree_rss", side_effect=[100.0, 2000.0, 100.0])
+
+    with ConverterPool(backend="uno", recycle_after=None, max_rss=1024) as pool:
+        for _ in range(3):
+            pool.convert("out", "document.docx")
+
+        assert len(uno_slots) == 2
+
+
+def test_restart_died_instance(uno_slots, mocker):
+    with ConverterPool(backend="uno", recycle_after=None, max_rss=None) as pool:
+        pool.convert("out", "document.docx")
+
+        # the instance has been killed, e.g. by its resource limits
+        uno_slots[-1].returncode = -9
+        assert pool.convert("out", "document.docx") == "out/document.pdf"
+        assert len(uno_slots) == 2 and pool.restarts == 1
+
+        # errors of a running instance are raised
+        mocker.patch.object(_UnoSlot, "_UnoSlot__convert", side_effect=ValueError("can't load"))
+        with pytest.raises(ValueError):
+            pool.convert("out", "document.docx")
+
+
+def test_resource_limit_args(mocker):
+    assert resource_limit_args() == []
+
+    mocker.patch("dbcmailmerge.conversion.shutil.which", return_value="/usr/bin/prlimit")
+    assert resource_limit_args(512, 600) == ["/usr/bin/prlimit", "--as=536870912", "--cpu=600", "--"]
+
+    mocker.patch("dbcmailmerge.conversion.shutil.which", return_value=None)
+    with pytest.raises(ValueError):
+        ConverterPool(memory_limit=512)
@@ -0,0 +1,19 @@
+"""
+Author: David Meyer
+
+Description
+-----------
+Contains the test suite for the functions in gui.py.
+"""
+from pathlib import Path
+from dbcmailmerge.gui import prompt_filepath
+
+
+def test_prompt_filepath(tmp_path, mocker):
+    expected = Path(tmp_path)
+
+    # Patch askdirectory method with lambda function
+    # instead of obtaining the path through tkinter's user prompt, return tmp_path
+    mocker.patch("tkinter.filedialog.askdirectory", lambda: tmp_path)
+    result = prompt_filepath()
+    assert result == expected
@@ -5,6 +5,9 @@ Description
 -----------
 Contains the test suite for the MailProject class in mailproject.py
 """
+import sys
+import subprocess
+from pathlib import Path
 from dbcmailmerge.mailproject import MailProject
 from tests.test_constants import (HIERARCHY_ROOT, STANDARD_PDFS, TEST_DATA_SOURCE_PATH,
                                   TEST_PROJECT_SINGLE_1, TEST_PROJECT_SINGLE_2, TEST_PROJECT_MULTIPLE,
@@ -82,6 +85,12 @@ class TestMailProject:
 
         assert result == expected
 
+    def test_import_is_lightweight(self):
+        """Tests that importing the module doesn't import the heavy dependencies, which are imported lazily."""
+        code = ("import sys, dbcmailmerge.mailproject; "
+                "assert not {'pandas', 'tkinter', 'PyPDF2', 'mailmerge'} & set(sys.modules)")
+        subprocess.run([sys.executable, "-c", code], check=True, cwd=Path(__file__).resolve().parents[1])
+
     def test_create_clients(self):
         # set up project
         project = MailProject(**TEST_PROJECT_SINGLE_1)
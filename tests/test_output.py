@@ -0,0 +1,132 @@
+"""
+Author: David Meyer
+
+Description
+-----------
+Contains the test suite for the staging output in output.py.
+"""
+import os
+import zipfile
+import threading
+import pytest
+from pathlib import Path
+from dbcmailmerge.output import DirectoryOutput, create_output, transfer
+
+
+@pytest.mark.parametrize("write_behind", [True, False])
+def test_directory_output(tmp_path, write_behind):
+    destination = tmp_path / "share"
+
+    with DirectoryOutput(destination, tmp_path, write_behind) as output:
+        staging_dir = output.staging_dir
+        local_dir = output.local_dir(Path("client_correspondence") / "Betreuer 1")
+        assert local_dir.parent.parent == staging_dir
+
+        (local_dir / "intermediate.docx").write_bytes(b"docx")
+        (local_dir / "client.pdf").write_bytes(b"pdf")
+        output.publish(Path("client_correspondence") / "Betreuer 1" / "client.pdf")
+
+    # only the published file is transferred, the staging directory is removed
+    assert [path.name for path in destination.rglob("*") if path.is_file()] == ["client.pdf"]
+    assert (destination / "client_correspondence" / "Betreuer 1" / "client.pdf").read_bytes() == b"pdf"
+    assert output.transferred == 1
+    assert not staging_dir.exists()
+
+    with pytest.raises(RuntimeError):
+        output.publish("client.pdf")
+
+
+@pytest.mark.parametrize("write_behind", [True, False])
+def test_flush(tmp_path, write_behind):
+    relative_file = Path("client_correspondence") / "Betreuer 1" / "client.pdf"
+
+    with DirectoryOutput(tmp_path / "share", tmp_path, write_behind) as output:
+        (output.local_dir(relative_file.parent) / relative_file.name).write_bytes(b"pdf")
+        output.publish(relative_file)
+        output.flush()
+
+        assert (tmp_path / "share" / relative_file).read_bytes() == b"pdf"
+        assert output.transferred == 1
+
+        # the output can still be used after a flush
+        (output.local_dir(relative_file.parent) / "other.pdf").write_bytes(b"pdf")
+        output.publish(relative_file.with_name("other.pdf"))
+
+    assert output.transferred == 2
+
+
+def test_transfer_across_file_systems(tmp_path, mocker):
+    source = tmp_path / "staging" / "client.pdf"
+    source.parent.mkdir()
+    source.write_bytes(b"pdf")
+    target = tmp_path / "share" / "client.pdf"
+
+    # the first rename (staging -> share) fails as it would between different file systems
+    replace = mocker.patch("dbcmailmerge.output.os.replace", side_effect=[OSError(18, "Invalid cross-device link"),
+                                                                          None])
+    transfer(source, target)
+
+    assert replace.call_args_list[1] == mocker.call(target.with_name("client.pdf.part"), target)
+    assert target.with_name("client.pdf.part").read_bytes() == b"pdf"  # renamed by the mocked os.replace
+    assert not source.exists()
+
+
+def test_failed_transfer_keeps_staging_dir(tmp_path, mocker):
+    mocker.patch("dbcmailmerge.output.transfer", side_effect=PermissionError("share is read-only"))
+
+    output = DirectoryOutput(tmp_path / "share", tmp_path)
+    (output.local_dir("") / "client.pdf").write_bytes(b"pdf")
+    output.publish("client.pdf")
+
+    with pytest.raises(PermissionError):
+        output.close()
+    assert os.path.exists(output.staging_dir / "client.pdf")
+
+
+def test_failed_transfer_keeps_draining(tmp_path, mocker):
+    published = threading.Event()
+
+    def transfer_file(relative_file):
+        published.wait(5)
+        if relative_file.name == "client_1.pdf":
+            raise ValueError("I/O operation on closed file.")
+
+    _transfer = mocker.patch.object(DirectoryOutput, "_transfer", side_effect=transfer_file)
+
+    output = DirectoryOutput(tmp_path / "share", tmp_path, write_behind=True)
+    for name in ("client_1.pdf", "client_2.pdf"):
+        (output.local_dir("") / name).write_bytes(b"pdf")
+        output.publish(name)
+    published.set()
+
+    with pytest.raises(ValueError):
+        output.close()
+    assert _transfer.call_count == 2 and output.transferred == 1
+    assert os.path.exists(output.staging_dir / "client_1.pdf")
+
+
+@pytest.mark.parametrize("output_mode, archives, members", [
+    ("zip_per_advisor", ["client_correspondence/Betreuer 1.zip", "client_correspondence/Betreuer 2.zip"],
+     ["offer_documents/client.pdf"]),
+    ("zip_per_run", ["client_correspondence.zip"],
+     ["Betreuer 1/offer_documents/client.pdf", "Betreuer 2/offer_documents/client.pdf"]),
+])
+def test_zip_output(tmp_path, output_mode, archives, members):
+    destination = tmp_path / "share"
+
+    with create_output(destination, output_mode, tmp_path) as output:
+        output.create_hierarchy("client_correspondence", [["Betreuer 1", "Betreuer 2"], ["offer_documents"]])
+
+        for advisor in ("Betreuer 1", "Betreuer 2"):
+            relative_dir = Path("client_correspondence") / advisor / "offer_documents"
+            (output.local_dir(relative_dir) / "client.pdf").write_bytes(advisor.encode())
+            output.publish(relative_dir / "client.pdf")
+
+    # only the archives are written to the destination
+    assert sorted(path.relative_to(destination).as_posix() for path in destination.rglob("*")
+                  if path.is_file()) == archives
+    assert output.archive_paths == [destination / archive for archive in archives]
+
+    with zipfile.ZipFile(destination / archives[0]) as archive:
+        assert archive.namelist() == members
+        assert archive.read(members[0]) == b"Betreuer 1"
@@ -0,0 +1,98 @@
+"""
+Author: David Meyer
+
+Description
+-----------
+Contains the test suite for the overlay engine in overlay.py. Requires pdfminer.six.
+"""
+import io
+import pytest
+from PyPDF2 import PdfFileWriter
+from PyPDF2.pdf import PageObject
+from dbcmailmerge.overlay import (OverlayTemplate, newline_shape, find_lines, text_layout, split_line, remove_lines,
+                                  text_overlay_page, line_ends, text_width)
+
+pytest.importorskip("pdfminer")
+
+
+def create_pdf(texts):
+    """Creates a one-page pdf containing the texts, list of (x, y, size, text)."""
+    page = PageObject.createBlankPage(width=595, height=842)
+    if texts:
+        page.mergePage(text_overlay_page(page, texts))
+
+    writer = PdfFileWriter()
+    writer.addPage(page)
+    out = io.BytesIO()
+    writer.write(out)
+    return out.getvalue()
+
+
+def page_text(pdf_bytes):
+    return ''.join(char for _, char, _, _ in text_layout(pdf_bytes, []))
+
+
+def test_newline_shape():
+    assert newline_shape("Client 1 Str. 1\n") == (0, 1)
+    assert newline_shape("\n\nvalue") == (2, 0)
+    assert newline_shape("two\nlines") is None
+
+
+def test_find_lines():
+    pdf = create_pdf([(100, 750, 11, "Letter"), (100, 700, 11, "Dear ZQX003"),
+                      (100, 680, 11, "Amount: ZQX001 EUR")])
+    lines, _ = find_lines(pdf)
+
+    assert [(page, text) for page, _, _, _, text in lines] == [(0, "Dear ZQX003"), (0, "Amount: ZQX001 EUR")]
+    _, y, x, size, _ = lines[0]
+    assert (y, x, size) == (pytest.approx(700), pytest.approx(100), pytest.approx(11))
+
+    # the text of the other lines is part of the layout, the personalized lines are not
+    assert ''.join(char for _, char, _, _ in text_layout(pdf, [(0, 700), (0, 680)])) == "Letter"
+
+
+def test_split_line():
+    assert split_line("Projekt Nr. ZQX004: ZQX005WWW", {4: "projektnummer", 5: "projektname"}) == \
+        ["Projekt Nr. ", ("projektnummer",), ": ", ("projektname",)]
+
+
+def test_remove_lines():
+    pdf = create_pdf([(100, 750, 11, "Letter"), (100, 700, 11, "Dear ")])
+
+    assert page_text(remove_lines(pdf, [(0, 700)])) == "Letter"
+
+
+def test_overlay_template_render(tmp_path):
+    template = OverlayTemplate(create_pdf([(100, 750, 11, "Letter")]),
+                               [(0, 100.0, 700.0, 11.0, ["Dear ", ("nachname",), ","])], {"nachname": (0, 0)})
+    out_file = tmp_path / "client.pdf"
+
+    assert template.render({"nachname": "Müller (Dr.)"}, out_file)
+    assert page_text(out_file.read_bytes()) == "LetterDear Müller (Dr.),"
+
+    # a value with a line break the template wasn't prepared for falls back to LibreOffice
+    assert not template.render({"nachname": "Müller\n"}, tmp_path / "other.pdf")
+    assert not (tmp_path / "other.pdf").exists()
+
+
+def test_line_ends_and_text_width():
+    pdf = create_pdf([(100, 750, 11, "Letter"), (100, 700, 11, "Dear ZQX003WWWWWWWWWWWWWWWWWWWW")])
+
+    # the text is written in Helvetica, so the measured end matches the computed width
+    ends = line_ends(pdf, [(0, 700), (0, 650)])
+    assert ends[0] - 100 == pytest.approx(text_width("Dear ZQX003WWWWWWWWWWWWWWWWWWWW", 11), abs=0.5)
+    assert ends[1] is None
+    assert text_width("W", 10) == pytest.approx(9.44)
+
+
+def test_overlay_template_too_wide(tmp_path):
+    template = OverlayTemplate(create_pdf([(100, 750, 11, "Letter")]),
+                               [(0, 100.0, 700.0, 11.0, [("post_str",)])], {"post_str": (0, 0)},
+                               [text_width("ZQX003" + "W" * 20, 11)])
+
+    assert template.render({"post_str": "Hauptstraße 1"}, tmp_path / "client.pdf")
+
+    # a street that would run past the marker box falls back to LibreOffice
+    street = "Bürgermeister-Hermann-Wilhelm-Müller-Straße 123a"
+    assert not template.render({"post_str": street}, tmp_path / "other.pdf")
+    assert not (tmp_path / "other.pdf").exists()
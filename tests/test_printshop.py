@@ -0,0 +1,97 @@
+"""
+Author: David Meyer
+
+Description
+-----------
+Contains the test suite for the print files of the postal mailings in printshop.py.
+"""
+import gc
+import shutil
+import weakref
+from pathlib import Path
+
+import pytest
+from PyPDF2 import PdfFileReader
+from dbcmailmerge.output import DirectoryOutput
+from dbcmailmerge.printshop import PrintShop, is_postal
+from tests.test_constants import STANDARD_PDFS
+
+# pib.pdf has 2 pages, factsheet.pdf 1 page
+CLIENT_PDFS = [("Nr._1_Doe_John_1", STANDARD_PDFS[0]), ("Nr._1_Doe_Jane_2", STANDARD_PDFS[1]),
+               ("Nr._1_Roe_Max_3", STANDARD_PDFS[0])]
+
+
+def test_is_postal():
+    assert is_postal({"medium_email": "0"})
+    assert is_postal({"medium_email": "False"})
+    assert not is_postal({"medium_email": "1"})
+
+
+def test_accepts():
+    print_shop = PrintShop()
+
+    assert print_shop.accepts({"medium_email": "0"}, "offer_documents")
+    assert not print_shop.accepts({"medium_email": "1"}, "offer_documents")
+    assert not print_shop.accepts({"medium_email": "0"}, "appropriateness_test")
+
+
+@pytest.mark.parametrize("duplex, bookmark_pages, page_count", [
+    (True, [0, 2, 4], 6),  # the second client is padded with a blank page
+    (False, [0, 2, 3], 5),
+])
+def test_print_file(tmp_path, duplex, bookmark_pages, page_count):
+    print_shop = PrintShop(duplex=duplex)
+    advisor_dir = Path("client_correspondence", "Betreuer 1")
+
+    with DirectoryOutput(tmp_path / "share", tmp_path, write_behind=False) as output:
+        for filename, source in CLIENT_PDFS:
+            pdf_path = output.local_dir(advisor_dir / "offer_documents") / (filename + ".pdf")
+            shutil.copy(source, pdf_path)
+            print_shop.add(output, advisor_dir, "offer_documents", filename, pdf_path)
+            output.publish(advisor_dir / "offer_documents" / (filename + ".pdf"))
+
+        assert print_shop.print_files == {advisor_dir / "print_offer_documents.pdf": 3}
+        print_shop.finish(output)
+
+    reader = PdfFileReader(str(tmp_path / "share" / advisor_dir / "print_offer_documents.pdf"))
+    assert reader.getNumPages() == page_count
+    assert [(bookmark.title, reader.getDestinationPageNumber(bookmark)) for bookmark in reader.getOutlines()] \
+        == [(filename, page) for (filename, _), page in zip(CLIENT_PDFS, bookmark_pages)]
+    # the single pdfs are still saved
+    assert len(list((tmp_path / "share" / advisor_dir / "offer_documents").glob("*.pdf"))) == 3
+
+
+def test_print_file_keeps_no_readers(tmp_path, mocker):
+    import PyPDF2
+
+    readers = []
+    create_reader = PyPDF2.PdfFileReader
+
+    def tracked_reader(*args, **kwargs):
+        reader = create_reader(*args, **kwargs)
+        readers.append(weakref.ref(reader))
+        return reader
+
+    mocker.patch("PyPDF2.PdfFileReader", side_effect=tracked_reader)
+    print_shop = PrintShop(duplex=False)
+    advisor_dir = Path("client_correspondence", "Betreuer 1")
+
+    with DirectoryOutput(tmp_path / "share", tmp_path, write_behind=False) as output:
+        for filename, source in CLIENT_PDFS * 4:
+            print_shop.add(output, advisor_dir, "offer_documents", filename, source)
+
+            # the pages are written to the staged print file, no client pdf is kept in memory
+            gc.collect()
+            assert all(reader() is None for reader in readers)
+
+        assert len(readers) == 12
+        staged_file = output.staging_dir / advisor_dir / "print_offer_documents.pdf.part"
+        assert staged_file.stat().st_size > 0
+        print_shop.finish(output)
+
+    with open(tmp_path / "share" / advisor_dir / "print_offer_documents.pdf", "rb") as print_file:
+        reader = create_reader(print_file)
+        assert reader.getNumPages() == 20
+        # the standard pdfs are stored once, although each of them has been added 4 or 8 times
+        assert (tmp_path / "share" / advisor_dir / "print_offer_documents.pdf").stat().st_size \
+            < 2 * sum(Path(source).stat().st_size for source in set(source for _, source in CLIENT_PDFS))
@@ -0,0 +1,59 @@
+"""
+Author: David Meyer
+
+Description
+-----------
+Contains the test suite for the profiler in profiling.py.
+"""
+import pstats
+import threading
+from dbcmailmerge.profiling import RunProfiler, package_times
+from dbcmailmerge.progress import ProgressTracker
+
+
+def busy(iterations=20000):
+    return sum(i * i for i in range(iterations))
+
+
+def test_run_profiler(tmp_path):
+    snapshots = []
+
+    with RunProfiler(tmp_path / "profile", memory=True) as profiler:
+        tracker = ProgressTracker(2, profiler.callback(snapshots.append))
+
+        def worker(client_id):
+            for stage in ("merge", "convert", "assemble"):
+                tracker.stage(client_id, stage)
+                busy()
+            tracker.client_done(client_id)
+
+        threads = [threading.Thread(target=worker, args=(str(client_id),), name=f"worker-{client_id}")
+                   for client_id in (1, 2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    # the snapshots are forwarded to the wrapped callback
+    assert len(snapshots) == 8
+
+    files = sorted(path.name for path in (tmp_path / "profile").iterdir())
+    assert files == ["report.txt", "stage_assemble.prof", "stage_convert.prof", "stage_main.prof",
+                     "stage_merge.prof", "total.prof", "worker_MainThread.prof", "worker_worker-1.prof",
+                     "worker_worker-2.prof"]
+
+    stats = pstats.Stats(str(tmp_path / "profile" / "stage_merge.prof"))
+    assert any(function_name == "busy" for _, _, function_name in stats.stats)
+
+    report = (tmp_path / "profile" / "report.txt").read_text()
+    assert "merge" in report and "Peak traced memory" in report
+
+
+def test_package_times():
+    stats = pstats.Stats.__new__(pstats.Stats)
+    stats.stats = {("/site-packages/PyPDF2/pdf.py", 1, "write"): (1, 1, 2.0, 3.0, {}),
+                   ("~", 0, "<built-in method posix.waitpid>"): (1, 1, 5.0, 5.0,
+                                                                 {("/lib/subprocess.py", 1, "wait"): (1, 1, 0.1, 5.0)}),
+                   ("/app/other.py", 1, "main"): (1, 1, 1.0, 10.0, {})}
+
+    assert package_times(stats) == {"PyPDF2": 2.0, "conversion subprocess": 5.0, "other": 1.0}
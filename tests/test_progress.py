@@ -0,0 +1,74 @@
+"""
+Author: David Meyer
+
+Description
+-----------
+Contains the test suite for the progress reporting in progress.py.
+"""
+import io
+from dbcmailmerge.progress import ProgressTracker, ConsoleProgressRenderer, format_duration
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_tracker_throughput_and_eta():
+    clock = FakeClock()
+    snapshots = []
+    tracker = ProgressTracker(4, snapshots.append, clock=clock)
+
+    tracker.stage("1", "merge")
+    assert snapshots[-1].stage == "merge"
+    assert snapshots[-1].throughput is None
+    assert snapshots[-1].eta is None
+
+    clock.now = 2.0
+    tracker.client_done("1")
+    clock.now = 4.0
+    tracker.client_done("2")
+
+    snapshot = snapshots[-1]
+    assert snapshot.done == 2
+    assert snapshot.throughput == 0.5  # 2 clients in 4 seconds
+    assert snapshot.eta == 4.0  # 2 remaining clients
+    assert snapshot.idle == 0.0
+
+
+def test_tracker_moving_average_window():
+    clock = FakeClock()
+    tracker = ProgressTracker(10, clock=clock, window=2)
+
+    # first client is slow, the following ones are fast -> only the window is taken into account
+    clock.now = 100.0
+    tracker.client_done("1")
+    clock.now = 101.0
+    tracker.client_done("2")
+    clock.now = 102.0
+    tracker.client_done("3")
+
+    assert tracker.snapshot().throughput == 1.0
+
+
+def test_console_renderer():
+    clock = FakeClock()
+    stream = io.StringIO()
+    tracker = ProgressTracker(1, ConsoleProgressRenderer(stream, stall_after=60), clock=clock)
+
+    clock.now = 61.0
+    tracker.stage("7", "convert")
+    assert "0/1 clients | convert client 7" in stream.getvalue()
+    assert "STALLED?" in stream.getvalue()
+
+    clock.now = 62.0
+    tracker.client_done("7")
+    assert stream.getvalue().endswith('\n')
+
+
+def test_format_duration():
+    assert format_duration(307) == "05:07"
+    assert format_duration(3723) == "1:02:03"
@@ -0,0 +1,47 @@
+"""
+Author: David Meyer
+
+Description
+-----------
+Contains the test suite for the scheduling of the document jobs in scheduling.py.
+"""
+import pytest
+from dbcmailmerge.cache import DocumentCache
+from dbcmailmerge.scheduling import schedule_jobs, estimate_cost, standard_page_count
+from tests.test_constants import STANDARD_PDFS
+
+# offer_documents: 2 templates and the standard pdfs, appropriateness_test: 1 template
+JOBS = [("project", {"betreuer": "Betreuer 1", "db_id": "1"}, "offer_documents"),
+        ("project", {"betreuer": "Betreuer 1", "db_id": "1"}, "appropriateness_test"),
+        ("project", {"betreuer": "Betreuer 2", "db_id": "2"}, "offer_documents"),
+        ("project", {"betreuer": "Betreuer 2", "db_id": "2"}, "appropriateness_test"),
+        ("project", {"betreuer": "Betreuer 1", "db_id": "3"}, "offer_documents"),
+        ("project", {"betreuer": "Betreuer 1", "db_id": "3"}, "appropriateness_test")]
+
+
+def job_ids(jobs):
+    return [(merge_record["db_id"], doc_type[0]) for _, merge_record, doc_type in jobs]
+
+
+def test_estimate_cost():
+    assert estimate_cost("appropriateness_test", 10) == 1.0
+    assert estimate_cost("offer_documents", 10) == pytest.approx(2.2)
+
+
+def test_standard_page_count():
+    assert standard_page_count(STANDARD_PDFS, DocumentCache()) > 0
+    assert standard_page_count([], DocumentCache()) == 0
+
+
+@pytest.mark.parametrize("schedule, expected", [
+    ("data_source", [("1", 'o'), ("1", 'a'), ("2", 'o'), ("2", 'a'), ("3", 'o'), ("3", 'a')]),
+    # Betreuer 2 has less work and is finished first
+    ("advisor", [("2", 'o'), ("2", 'a'), ("1", 'o'), ("1", 'a'), ("3", 'o'), ("3", 'a')]),
+])
+def test_schedule_jobs(schedule, expected):
+    assert job_ids(schedule_jobs(JOBS, schedule, standard_pages=10)) == expected
+
+
+def test_unknown_schedule():
+    with pytest.raises(ValueError):
+        schedule_jobs(JOBS, "longest_first")
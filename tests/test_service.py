@@ -0,0 +1,147 @@
+"""
+Author: David Meyer
+
+Description
+-----------
+Contains the test suite for the job service in service.py.
+"""
+import os
+import json
+import shutil
+import threading
+import urllib.request
+import urllib.error
+import pytest
+from dbcmailmerge.service import JobService, create_server
+from dbcmailmerge.validation import ValidationError, ValidationReport
+from tests.test_constants import STANDARD_PDFS
+
+JOB = {"name": "project_141", "data_source": "source.xlsx", "project_sheet": "project_data",
+       "client_sheet": "client_data", "output_root": "out", "filters": "amount"}
+
+
+@pytest.fixture
+def server(mocker):
+    mocker.patch("dbcmailmerge.conversion._SubprocessSlot.warm_up")
+
+    with JobService(workers=2) as service:
+        server = create_server(service, port=0)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        yield server
+        server.shutdown()
+        server.server_close()
+
+
+def request(server, path, data=None):
+    """Returns the HTTP status and the decoded JSON response of the server."""
+    url = f"http://127.0.0.1:{server.server_address[1]}{path}"
+    body = json.dumps(data).encode("utf-8") if data is not None else None
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, body), timeout=5) as response:
+            return response.status, json.load(response)
+    except urllib.error.HTTPError as err:
+        return err.code, json.load(err)
+
+
+def wait_for_job(server, job_id):
+    status = None
+    for _ in range(100):
+        _, status = request(server, f"/jobs/{job_id}")
+        if status["state"] in ("finished", "failed"):
+            break
+        threading.Event().wait(0.05)
+    return status
+
+
+def wait_for_service(service, finished):
+    for _ in range(100):
+        if service.metrics()["jobs"]["finished"] == finished:
+            return True
+        threading.Event().wait(0.05)
+    return False
+
+
+def test_submit_job(server, mocker):
+    execute_run = mocker.patch("dbcmailmerge.service.execute_run", return_value=[("project", [{}, {}, {}])])
+
+    code, status = request(server, "/jobs", JOB)
+    assert code == 202 and status["state"] in ("queued", "running")
+
+    status = wait_for_job(server, status["id"])
+    assert (status["name"], status["state"], status["clients"]) == ("project_141", "finished", 3)
+
+    run = execute_run.call_args.args[0]
+    assert run["filters"] == ["amount"] and run["workers"] == 2 and run["data_source"].is_absolute()
+
+    _, metrics = request(server, "/metrics")
+    assert metrics["jobs"]["finished"] == 1 and metrics["clients"] == 3
+    assert [job["id"] for job in request(server, "/jobs")[1]] == [status["id"]]
+
+
+def test_failed_job(server, mocker):
+    report = ValidationReport()
+    report.add("error", "1", None, "The value of `amount` is missing.")
+    mocker.patch("dbcmailmerge.service.execute_run", side_effect=ValidationError(report))
+
+    status = wait_for_job(server, request(server, "/jobs", dict(JOB, dry_run=True))[1]["id"])
+
+    assert status["state"] == "failed"
+    assert status["error"] == "The dry run found 1 error(s)."
+    assert "amount" in status["report"]
+
+
+def test_invalid_requests(server):
+    assert request(server, "/jobs", dict(JOB, engine="unknown"))[0] == 400
+    assert request(server, "/jobs", dict(JOB, watch=True))[0] == 400
+    assert request(server, "/jobs", ["not", "a", "run"])[0] == 400
+    assert request(server, "/jobs/42")[0] == 404
+    assert request(server, "/unknown")[0] == 404
+
+
+def test_close_fails_queued_jobs(mocker):
+    mocker.patch("dbcmailmerge.conversion._SubprocessSlot.warm_up")
+    release = threading.Event()
+    mocker.patch("dbcmailmerge.service.execute_run", side_effect=lambda *args: release.wait(5) and [])
+
+    service = JobService(workers=1)
+    service.start()
+    running = service.submit(JOB)["id"]
+    queued = service.submit(JOB)["id"]
+    for _ in range(100):
+        if service.status(running)["state"] == "running":
+            break
+        threading.Event().wait(0.05)
+
+    # the running job is finished, the queued job is never started
+    closing = threading.Thread(target=service.close)
+    closing.start()
+    for _ in range(100):
+        if service.status(queued)["state"] == "failed":
+            break
+        threading.Event().wait(0.05)
+    release.set()
+    closing.join(5)
+
+    assert service.status(running)["state"] == "finished"
+    assert service.status(queued)["state"] == "failed"
+    assert service.status(queued)["error"] == "The service has been stopped."
+
+
+def test_cache_is_renewed(tmp_path, mocker):
+    mocker.patch("dbcmailmerge.conversion._SubprocessSlot.warm_up")
+    execute_run = mocker.patch("dbcmailmerge.service.execute_run", return_value=[])
+    standard_pdf = shutil.copy(STANDARD_PDFS[0], tmp_path)
+
+    with JobService(workers=1) as service:
+        service.submit(dict(JOB, standard_pdfs=[str(standard_pdf)]))
+        service.submit(dict(JOB, standard_pdfs=[str(standard_pdf)]))
+        assert wait_for_service(service, 2)
+
+        stat = os.stat(standard_pdf)
+        os.utime(standard_pdf, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+        service.submit(dict(JOB, standard_pdfs=[str(standard_pdf)]))
+        assert wait_for_service(service, 3)
+
+    caches = [call.args[3] for call in execute_run.call_args_list]
+    assert caches[0] is caches[1] and caches[2] is not caches[1]
@@ -0,0 +1,49 @@
+"""
+Author: David Meyer
+
+Description
+-----------
+Contains the test suite for the data source snapshots in snapshot.py.
+"""
+import shutil
+from dbcmailmerge import mailproject
+from dbcmailmerge.mailproject import MailProject
+from dbcmailmerge.snapshot import SnapshotCache
+from dbcmailmerge.config import FIELD_MAP_PROJECT
+from tests.test_constants import TEST_DATA_SOURCE_PATH, TEST_PROJECT_SINGLE_1
+
+RECORDS = [{"client_id": 1, "amount": 10000}, {"client_id": 2, "amount": ''}]
+
+
+def test_store_and_load(tmp_path):
+    data_source = tmp_path / "data.xlsx"
+    data_source.write_bytes(b"workbook")
+    cache = SnapshotCache(tmp_path / "snapshots")
+
+    assert cache.load("clients", data_source, "client_data", {"Nr": "client_id"}) is None
+    cache.store("clients", data_source, "client_data", {"Nr": "client_id"}, RECORDS)
+
+    assert cache.load("clients", data_source, "client_data", {"Nr": "client_id"}) == RECORDS
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    # another sheet, field map, or casting doesn't use the snapshot
+    assert cache.load("clients", data_source, "client_data_2", {"Nr": "client_id"}) is None
+    assert cache.load("clients", data_source, "client_data", {"Nummer": "client_id"}) is None
+    assert cache.load("clients", data_source, "client_data", {"Nr": "client_id"}, ["amount"]) is None
+
+    # neither does a changed workbook
+    data_source.write_bytes(b"changed workbook")
+    assert cache.load("clients", data_source, "client_data", {"Nr": "client_id"}) is None
+
+
+def test_from_excel_uses_snapshot(tmp_path, mocker):
+    data_source = tmp_path / "data.xlsx"
+    shutil.copy(TEST_DATA_SOURCE_PATH, data_source)
+    cache = SnapshotCache(tmp_path / "snapshots")
+    parse_data_source = mocker.spy(mailproject, "parse_data_source")
+
+    first = MailProject.from_excel(data_source, "project_data_single_1", FIELD_MAP_PROJECT, cache)
+    second = MailProject.from_excel(data_source, "project_data_single_1", FIELD_MAP_PROJECT, cache)
+
+    assert first == second == MailProject(**TEST_PROJECT_SINGLE_1)
+    assert parse_data_source.call_count == 1
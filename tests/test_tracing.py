@@ -0,0 +1,71 @@
+"""
+Author: David Meyer
+
+Description
+-----------
+Contains the test suite for the trace export in tracing.py.
+"""
+import json
+import threading
+from dbcmailmerge.tracing import TraceRecorder
+from dbcmailmerge.progress import ProgressTracker
+from dbcmailmerge.output import DirectoryOutput
+
+
+def test_trace_recorder(tmp_path):
+    snapshots = []
+    tracer = TraceRecorder()
+    tracker = ProgressTracker(2, tracer.callback(snapshots.append))
+
+    def worker(client_id):
+        for stage in ("merge", "convert", "assemble"):
+            tracker.stage(client_id, stage)
+        tracker.client_done(client_id)
+
+    with tracer.span("format", project_id=1):
+        threads = [threading.Thread(target=worker, args=(str(client_id),), name=f"worker-{client_id}")
+                   for client_id in (1, 2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    # the snapshots are forwarded to the wrapped callback
+    assert len(snapshots) == 8
+
+    trace = json.loads(tracer.export(tmp_path / "trace.json").read_text())
+    spans = [event for event in trace["traceEvents"] if event["ph"] == "X"]
+    thread_names = {event["tid"]: event["args"]["name"] for event in trace["traceEvents"]
+                    if event["name"] == "thread_name"}
+
+    assert sorted(thread_names.values()) == ["MainThread", "worker-1", "worker-2"]
+    for client_id in ("1", "2"):
+        client_spans = [span for span in spans if span["args"].get("client_id") == client_id]
+        assert [span["name"] for span in client_spans] == ["merge", "convert", "assemble"]
+        assert {thread_names[span["tid"]] for span in client_spans} == {f"worker-{client_id}"}
+
+    # the stages of a client follow each other without overlap
+    client_spans = [span for span in spans if span["args"].get("client_id") == "1"]
+    for previous, following in zip(client_spans, client_spans[1:]):
+        assert previous["ts"] + previous["dur"] <= following["ts"]
+
+
+def test_trace_recorder_clock():
+    tracer = TraceRecorder(clock=iter([10.0, 10.5, 12.0]).__next__)
+
+    tracer.begin("convert", client_id=141)
+    tracer.end()
+    tracer.end()  # no open span
+
+    assert tracer.events == [{"name": "convert", "cat": "dbcmailmerge", "ph": "X", "tid": threading.get_native_id(),
+                              "ts": 500000.0, "dur": 1500000.0, "args": {"client_id": "141"}}]
+
+
+def test_output_records_transfers(tmp_path):
+    tracer = TraceRecorder()
+
+    with DirectoryOutput(tmp_path / "share", tmp_path, tracer=tracer) as output:
+        (output.local_dir("") / "client.pdf").write_bytes(b"pdf")
+        output.publish("client.pdf")
+
+    assert [(event["name"], event["args"]) for event in tracer.events] == [("write", {"file": "client.pdf"})]
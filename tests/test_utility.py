@@ -5,9 +5,13 @@ Description
 -----------
 Contains the test suite for the functions in utility.py.
 """
+import sqlite3
+import pytest
 from pathlib import Path
-from dbcmailmerge.utility import (path_creator, create_folder_hierarchy, prompt_filepath,
-                                  translate_dict)
+from dbcmailmerge.utility import (path_creator, create_folder_hierarchy, translate_dict, parse_data_source,
+                                  select_doc_types, client_id_filter)
+from dbcmailmerge.config import FIELD_MAP_PROJECT, FIELD_MAP_CLIENTS
+from tests.test_constants import TEST_DATA_SOURCE_PATH
 
 # TODO refactor test cases, so that they are not duplicated.
 
@@ -38,16 +42,6 @@ def test_create_folder_hierarchy(tmp_path):
         assert path.exists()
 
 
-def test_prompt_filepath(tmp_path, mocker):
-    expected = Path(tmp_path)
-
-    # Patch askdirectory method with lambda function
-    # instead of obtaining the path through tkinter's user prompt, return tmp_path
-    mocker.patch("tkinter.filedialog.askdirectory", lambda: tmp_path)
-    result = prompt_filepath()
-    assert result == expected
-
-
 def test_translate_dict():
     test_dict = {"original_key_1": 1, "original_key_2": 2}
     test_field_map = {"original_key_1": "original_value_1", "original_key_2": "original_value_2"}
@@ -62,3 +56,68 @@ def test_translate_dict():
     result = translate_dict(result, test_field_map, reverse=True)
 
     assert result == test_dict  # original dict
+
+
+@pytest.mark.parametrize("sheet_name, field_list", [("project_data_multiple", list(FIELD_MAP_PROJECT)),
+                                                    ("client_data", list(FIELD_MAP_CLIENTS))])
+def test_parse_data_source_formats(tmp_path, sheet_name, field_list):
+    import pandas as pd
+
+    expected = parse_data_source(TEST_DATA_SOURCE_PATH, sheet_name, field_list).to_dict("records")
+
+    # export the sheet as the CRM would: dates as ISO 8601 text, an additional column that isn't used
+    raw = pd.read_excel(TEST_DATA_SOURCE_PATH, sheet_name)[field_list].assign(unused="x")
+    raw.to_csv(tmp_path / "data.csv", index=False, date_format="%Y-%m-%d")
+    with sqlite3.connect(tmp_path / "data.sqlite") as connection:
+        raw.to_sql(sheet_name, connection, index=False)
+
+    assert parse_data_source(tmp_path / "data.csv", None, field_list).to_dict("records") == expected
+    assert parse_data_source(tmp_path / "data.sqlite", sheet_name, field_list).to_dict("records") == expected
+
+    pytest.importorskip("pyarrow")
+    if "depot_nummer" in raw:
+        raw["depot_nummer"] = raw["depot_nummer"].astype(str)  # Parquet doesn't support mixed int/str columns
+    raw.to_parquet(tmp_path / "data.parquet")
+    assert parse_data_source(tmp_path / "data.parquet", None, field_list).to_dict("records") == expected
+
+
+def test_parse_data_source_keeps_leading_zeros(tmp_path):
+    field_list = ["db_id", "post_plz", "depot_nummer", "datum_emission"]
+    (tmp_path / "data.csv").write_text("db_id,post_plz,depot_nummer,datum_emission\n"
+                                       "1,01067,0012345,2019-06-30\n2,,,2019-07-01\n", encoding="utf-8")
+    with sqlite3.connect(tmp_path / "data.sqlite") as connection:
+        connection.execute("CREATE TABLE clients (db_id INTEGER, post_plz TEXT, depot_nummer INTEGER, "
+                           "datum_emission TEXT)")
+        connection.executemany("INSERT INTO clients VALUES (?, ?, ?, ?)",
+                               [(1, "01067", 12345, "2019-06-30"), (2, None, None, "2019-07-01")])
+
+    csv_records = parse_data_source(tmp_path / "data.csv", None, field_list).to_dict("records")
+    sqlite_records = parse_data_source(tmp_path / "data.sqlite", "clients", field_list).to_dict("records")
+
+    assert [(record["post_plz"], record["depot_nummer"], record["datum_emission"]) for record in csv_records] \
+        == [("01067", "0012345", "30.06.2019"), ('', '', "01.07.2019")]
+    # a number column loses its leading zeros in the database, but isn't formatted as 12345.0
+    assert [(record["post_plz"], record["depot_nummer"], record["datum_emission"]) for record in sqlite_records] \
+        == [("01067", "12345", "30.06.2019"), ('', '', "01.07.2019")]
+
+
+def test_parse_data_source_unsupported_format():
+    with pytest.raises(ValueError):
+        parse_data_source(Path("data.json"), None, ["projektnummer"])
+
+
+def test_select_doc_types():
+    assert select_doc_types() == ["offer_documents", "appropriateness_test"]
+    assert select_doc_types(templates=["cover_letter"]) == ["offer_documents"]
+    assert select_doc_types(["appropriateness_test"], ["subscription_agreement.docx"]) \
+        == ["offer_documents", "appropriateness_test"]
+
+    with pytest.raises(ValueError):
+        select_doc_types(templates=["unknown.docx"])
+
+
+def test_client_id_filter():
+    selection_filter = client_id_filter(["7", 12])
+
+    assert selection_filter(7) and selection_filter(7.0) and selection_filter("12")
+    assert not selection_filter(1)
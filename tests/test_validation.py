@@ -0,0 +1,62 @@
+"""
+Author: David Meyer
+
+Description
+-----------
+Contains the test suite for the dry run in validation.py and MailProject.validate_client_documents.
+"""
+from dbcmailmerge.mailproject import MailProject
+from dbcmailmerge.validation import ValidationReport, check_required_values, check_filename
+from tests.test_constants import TEST_PROJECT_SINGLE_1, TEST_CLIENT_1, TEST_CLIENT_2
+
+
+def errors(report, client_id, doc_type, text):
+    return sum(1 for issue in report.errors
+               if (issue.client_id, issue.doc_type) == (client_id, doc_type) and text in issue.message)
+
+
+def test_validate_client_documents(mocker):
+    convert = mocker.patch("dbcmailmerge.conversion.ConverterPool.convert")
+    project = MailProject(**TEST_PROJECT_SINGLE_1)
+
+    report = project.validate_client_documents([TEST_CLIENT_1, TEST_CLIENT_2])
+
+    assert report.ok and report.issues == []
+    assert (report.clients, report.documents) == (2, 4)
+    assert not convert.called
+
+
+def test_validate_client_documents_with_errors():
+    project = MailProject(**TEST_PROJECT_SINGLE_1)
+    missing_last_name = dict(TEST_CLIENT_1, last_name='')
+    duplicate = dict(TEST_CLIENT_1)
+    control_character = dict(TEST_CLIENT_2, client_id=5, address_mailing_street="Client 5 Str.\x0b5")
+    invalid_advisor = dict(TEST_CLIENT_2, client_id=6, advisor="Betreuer 1/2")
+    missing_field = {key: value for key, value in TEST_CLIENT_2.items() if key != "address_notify_street"}
+
+    report = project.validate_client_documents([missing_last_name, TEST_CLIENT_1, duplicate, control_character,
+                                                invalid_advisor, missing_field])
+
+    assert not report.ok
+    assert errors(report, "1", None, "required field `last_name`") == 1
+    assert errors(report, "1", "offer_documents", "also created for client 1") == 1  # duplicate
+    assert errors(report, "5", "offer_documents", "can't be merged") == 1
+    assert errors(report, "6", "appropriateness_test", "invalid characters `/`") == 1
+    # reported once per template, not per client
+    assert errors(report, None, "offer_documents", "`melde_str`") == 1
+    assert errors(report, None, "appropriateness_test", "`melde_str`") == 1
+    assert "ERROR: client 6, appropriateness_test:" in report.format()
+
+
+def test_checks():
+    assert check_required_values({"first_name": " ", "last_name": "Doe"}, ["first_name", "last_name", "advisor"]) \
+        == ["first_name", "advisor"]
+    assert check_filename("Nr._141_Doe_John_1") == ''
+    assert check_filename('Betreuer 1/2: "A"') == '/:"'
+
+
+def test_empty_report():
+    report = ValidationReport()
+
+    assert report.ok
+    assert report.format() == "Dry run: 0 clients, 0 documents, 0 error(s), 0 warning(s)\n"
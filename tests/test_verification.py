@@ -0,0 +1,76 @@
+"""
+Author: David Meyer
+
+Description
+-----------
+Contains the test suite for the verification of the created pdfs in verification.py.
+"""
+from PyPDF2 import PdfFileReader, PdfFileWriter
+from PyPDF2.pdf import PageObject
+from dbcmailmerge.config import TEMPLATES
+from dbcmailmerge.mailproject import MailProject
+from dbcmailmerge.overlay import text_overlay_page
+from dbcmailmerge.verification import ExpectedDocument, template_page_count, verify_document, verify_documents
+from tests.test_constants import TEST_PROJECT_SINGLE_1, TEST_CLIENT_1, STANDARD_PDFS
+
+STANDARD_PAGES = 3  # pib.pdf and factsheet.pdf
+
+
+def create_pdf(pdf_path, lines, standard_pdfs=STANDARD_PDFS):
+    """Writes a customized page containing `lines`, followed by the standard pdfs."""
+    page = PageObject.createBlankPage(width=595, height=842)
+    page.mergePage(text_overlay_page(page, [(50, 800 - 20 * index, 12, line) for index, line in enumerate(lines)]))
+
+    writer = PdfFileWriter()
+    writer.addPage(page)
+    readers = [PdfFileReader(str(path), strict=False) for path in standard_pdfs]
+    for reader in readers:
+        for page_number in range(reader.getNumPages()):
+            writer.addPage(reader.getPage(page_number))
+    with open(pdf_path, "wb") as pdf_file:
+        writer.write(pdf_file)
+
+
+def test_template_page_count():
+    assert template_page_count(TEMPLATES["appropriateness_test"][0]) == 4
+    assert template_page_count(TEMPLATES["offer_documents"][0]) == 1
+
+
+def test_verify_document(tmp_path):
+    pdf_path = tmp_path / "Nr._141_Doe_John_1.pdf"
+    create_pdf(pdf_path, ["Dear Mr. John Doe,", "you subscribed 10,000.00 EUR."])
+
+    expected = ExpectedDocument("1", "offer_documents", pdf_path, 1, STANDARD_PAGES, ("John", "Doe", "10,000.00"))
+    assert verify_document(expected) == []
+
+    errors = verify_document(expected._replace(customized_pages=2, texts=("Jane", "10,000.00")))
+    assert errors == ["Nr._141_Doe_John_1.pdf has 4 pages instead of 5.", "Nr._141_Doe_John_1.pdf doesn't contain "
+                                                                            "`Jane`."]
+
+    assert verify_document(expected._replace(pdf_path=tmp_path / "missing.pdf")) == ["missing.pdf doesn't exist."]
+
+
+def test_verify_documents(tmp_path):
+    expected_documents = []
+    for client_id in range(4):
+        pdf_path = tmp_path / f"{client_id}.pdf"
+        create_pdf(pdf_path, [f"Client {client_id}"], standard_pdfs=[])
+        expected_documents.append(ExpectedDocument(str(client_id), "appropriateness_test", pdf_path, 1, 0,
+                                                   (f"Client {client_id}", "Client 0")))
+
+    # in two processes
+    report = verify_documents(expected_documents, workers=2)
+
+    assert report.documents == 4
+    assert [issue.client_id for issue in report.errors] == ["1", "2", "3"]
+    assert report.format().startswith("Verification: 0 clients, 4 documents, 3 error(s)")
+
+
+def test_verify_client_documents_missing(tmp_path):
+    project = MailProject(**TEST_PROJECT_SINGLE_1)
+
+    report = project.verify_client_documents([TEST_CLIENT_1], tmp_path, STANDARD_PDFS, workers=1)
+
+    assert (report.clients, report.documents) == (1, 2)
+    assert [(issue.doc_type, issue.message.endswith("doesn't exist.")) for issue in report.errors] \
+        == [("offer_documents", True), ("appropriateness_test", True)]
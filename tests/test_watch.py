@@ -0,0 +1,91 @@
+"""
+Author: David Meyer
+
+Description
+-----------
+Contains the test suite for the watch mode in watch.py.
+"""
+import os
+import shutil
+import pandas as pd
+from dbcmailmerge.mailproject import MailProject
+from dbcmailmerge.watch import DocumentWatcher, file_state, fingerprint
+from tests.test_constants import TEST_DATA_SOURCE_PATH, STANDARD_PDFS
+
+
+def fake_create_batch_documents(selections, hierarchy_root, standard_pdfs, *args, doc_types=None, **kwargs):
+    """Writes an empty file instead of each pdf."""
+    for project, selected_clients in selections:
+        for paths in project.document_paths(selected_clients):
+            for doc_type, path in paths.items():
+                if doc_types is None or doc_type in doc_types:
+                    (hierarchy_root / path).parent.mkdir(parents=True, exist_ok=True)
+                    (hierarchy_root / path).write_bytes(b"")
+
+
+def touch(path):
+    """Changes the modification time, even on file systems with a coarse resolution."""
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+
+def test_file_state(tmp_path):
+    existing = tmp_path / "source.xlsx"
+    existing.write_bytes(b"data")
+
+    state = file_state([existing, tmp_path / "missing.xlsx"])
+
+    assert state[str(existing)][1] == 4
+    assert state[str(tmp_path / "missing.xlsx")] is None
+
+
+def test_fingerprint():
+    assert fingerprint({"a": 1, "b": 2}) == fingerprint({"b": 2, "a": 1})
+    assert fingerprint({"a": 1, "b": 2}) != fingerprint({"a": 1, "b": 3})
+
+
+def test_update(tmp_path, mocker):
+    create_batch_documents = mocker.patch.object(MailProject, "create_batch_documents",
+                                                 side_effect=fake_create_batch_documents)
+
+    data_source = tmp_path / "source.xlsx"
+    shutil.copy(TEST_DATA_SOURCE_PATH, data_source)
+    standard_pdfs = [shutil.copy(path, tmp_path) for path in STANDARD_PDFS]
+    out = tmp_path / "out"
+
+    watcher = DocumentWatcher(data_source, "project_data_single_1", "client_data", out, standard_pdfs,
+                              snapshot_dir=None)
+    assert watcher.changed()
+
+    update = watcher.update(None)
+    pdfs = sorted(out.rglob("*.pdf"))
+    clients = sum(len(selected_clients) for _, selected_clients in watcher.selections)
+    assert (update.created, update.refreshed, update.removed) == (clients, 0, 0)
+    assert len(pdfs) == 2 * clients
+    assert not watcher.changed()
+
+    # the state is kept after a restart
+    watcher = DocumentWatcher(data_source, "project_data_single_1", "client_data", out, standard_pdfs,
+                              snapshot_dir=None)
+    assert not watcher.changed()
+
+    # drop the last client -> its pdfs are removed, no pdfs are created
+    sheets = pd.read_excel(data_source, sheet_name=None)
+    with pd.ExcelWriter(data_source) as writer:
+        for sheet_name, data in sheets.items():
+            if sheet_name == "client_data":
+                data = data.iloc[:-1]
+            data.to_excel(writer, sheet_name=sheet_name, index=False)
+    touch(data_source)
+
+    create_batch_documents.reset_mock()
+    update = watcher.update(None)
+    assert (update.created, update.refreshed, update.removed) == (0, 0, 2)
+    assert not create_batch_documents.called
+    assert len(list(out.rglob("*.pdf"))) == 2 * (clients - 1)
+
+    # a changed standard pdf -> the pdfs of the doc types including it are created for all clients
+    touch(standard_pdfs[0])
+    update = watcher.update(None)
+    assert update.refreshed == clients - 1 and update.doc_types == ["offer_documents"]
+    assert create_batch_documents.call_args.kwargs["doc_types"] == ["offer_documents"]
@@ -0,0 +1,105 @@
+"""
+Author: David Meyer
+
+Description
+-----------
+Contains the test suite for the distributed mode in workqueue.py.
+"""
+import os
+import pytest
+from dbcmailmerge import workqueue
+from dbcmailmerge.workqueue import WorkQueue, run_worker
+from dbcmailmerge.mailproject import MailProject
+from tests.test_constants import TEST_PROJECT_SINGLE_1, TEST_PROJECT_SINGLE_2, TEST_CLIENT_1, TEST_CLIENT_2
+
+SETTINGS = {"hierarchy_root": "/srv/mailings", "standard_pdfs": [], "engine": "libreoffice", "compress": False}
+
+
+def enqueue(queue_dir, shard_size=1):
+    selections = [(MailProject(**TEST_PROJECT_SINGLE_1), [TEST_CLIENT_1, TEST_CLIENT_2]),
+                  (MailProject(**TEST_PROJECT_SINGLE_2), [TEST_CLIENT_1])]
+    return WorkQueue(queue_dir).enqueue(selections, SETTINGS, shard_size)
+
+
+def test_to_record():
+    project = MailProject(**TEST_PROJECT_SINGLE_1)
+
+    assert project.to_record() == TEST_PROJECT_SINGLE_1
+    assert MailProject(**project.to_record()) == project
+
+
+def test_enqueue_claim_complete(tmp_path):
+    assert enqueue(tmp_path, shard_size=2) == ["shard_00001.json", "shard_00002.json"]
+    with pytest.raises(ValueError):
+        enqueue(tmp_path)
+
+    # two workers never claim the same shard
+    first = WorkQueue(tmp_path).claim("worker-1")
+    second = WorkQueue(tmp_path).claim("worker-2")
+    assert WorkQueue(tmp_path).claim("worker-3") is None
+
+    assert (first.name, second.name) == ("shard_00001.json", "shard_00002.json")
+    assert first.project == TEST_PROJECT_SINGLE_1 and first.clients == [TEST_CLIENT_1, TEST_CLIENT_2]
+    assert WorkQueue(tmp_path).settings() == SETTINGS
+    assert WorkQueue(tmp_path).status() == {"pending": 0, "leased": 2, "done": 0, "failed": 0}
+
+    WorkQueue(tmp_path).complete(first, {"worker": "worker-1"})
+    WorkQueue(tmp_path).fail(second, {"worker": "worker-2", "error": "ValueError()"})
+    assert WorkQueue(tmp_path).status() == {"pending": 0, "leased": 0, "done": 1, "failed": 1}
+
+
+def test_reclaim_expired_lease(tmp_path):
+    enqueue(tmp_path, shard_size=3)
+    queue = WorkQueue(tmp_path, lease_timeout=60)
+
+    for attempt in range(workqueue.MAX_SHARD_ATTEMPTS):
+        shard = queue.claim("dead-worker")
+        assert shard.attempts == attempt
+        assert queue.reclaim_expired() == []  # the lease is valid
+
+        # the worker died, its last heartbeat was two minutes ago
+        leased_path = tmp_path / "leased" / shard.name
+        os.utime(leased_path, (leased_path.stat().st_mtime - 120,) * 2)
+        queue.reclaim_expired()
+
+        assert not queue.renew(shard.name, "dead-worker")
+
+    # given up after MAX_SHARD_ATTEMPTS
+    assert queue.status() == {"pending": 1, "leased": 0, "done": 0, "failed": 1}
+
+
+def test_claim_old_pending_shard(tmp_path, mocker):
+    enqueue(tmp_path, shard_size=3)
+    queue = WorkQueue(tmp_path, lease_timeout=60)
+
+    # the shard has been pending for two minutes, e.g. until a worker has been started
+    pending_path = tmp_path / "pending" / "shard_00001.json"
+    os.utime(pending_path, (pending_path.stat().st_mtime - 120,) * 2)
+
+    # another worker reclaims expired leases right after the shard has been moved to `leased/`
+    reclaimed = []
+    renew = queue.renew
+
+    def reclaim_and_renew(shard_name, worker_id):
+        reclaimed.extend(WorkQueue(tmp_path, lease_timeout=60).reclaim_expired())
+        return renew(shard_name, worker_id)
+
+    mocker.patch.object(queue, "renew", side_effect=reclaim_and_renew)
+    shard = queue.claim("worker-1")
+
+    assert reclaimed == []
+    assert shard.attempts == 0
+    assert queue.status() == {"pending": 1, "leased": 1, "done": 0, "failed": 0}
+
+
+def test_run_worker(tmp_path, mocker):
+    enqueue(tmp_path)
+    mocker.patch("dbcmailmerge.workqueue.ConverterPool")
+    create_batch_documents = mocker.patch.object(MailProject, "create_batch_documents",
+                                                 side_effect=[None, OSError("disk full"), None])
+
+    assert run_worker(tmp_path, worker_id="worker-1") == ["shard_00001.json", "shard_00002.json", "shard_00003.json"]
+
+    selections = create_batch_documents.call_args_list[2].args[0]
+    assert selections == [(MailProject(**TEST_PROJECT_SINGLE_2), [TEST_CLIENT_1])]
+    assert WorkQueue(tmp_path).status() == {"pending": 0, "leased": 0, "done": 2, "failed": 1}